@@ -0,0 +1,239 @@
+"""
+Reader for the Steam client's binary app info cache, appinfo.vdf.
+
+The client keeps the same per-app metadata steamcmd's +app_info_print
+shows in ~/.steam/steam/appcache/appinfo.vdf. Reading it directly takes
+milliseconds and works offline, where steamcmd takes seconds and needs
+to log in.
+
+The file is mmap'd and indexed by appID on first use, reading only
+each record's header, so looking up one app decodes just that app's
+record.
+
+File layout (all little-endian)::
+
+    u32 magic               0x07564427 (v27), ...28 (v28) or ...29 (v29)
+    u32 universe
+    i64 string table offset (v29 only)
+    records, each:
+        u32 appID           0 ends the list
+        u32 size            bytes remaining in this record
+        u32 info state, u32 last updated, u64 PICS token,
+        20 bytes SHA-1 of the text VDF, u32 change number,
+        20 bytes SHA-1 of the binary VDF (v28 and later)
+        binary VDF
+    string table (v29 only): u32 count, then NUL-terminated strings
+
+In v29, binary VDF keys are u32 indices into the string table rather
+than inline NUL-terminated strings.
+"""
+
+import logging
+import mmap
+import os
+import struct
+import threading
+
+
+LOG = logging.getLogger('vent')
+
+APPINFO_PATH = "~/.steam/steam/appcache/appinfo.vdf"
+
+MAGIC_V27 = 0x07564427
+MAGIC_V28 = 0x07564428
+MAGIC_V29 = 0x07564429
+
+# Binary VDF value types.
+TYPE_MAP = 0x00
+TYPE_STRING = 0x01
+TYPE_INT32 = 0x02
+TYPE_FLOAT32 = 0x03
+TYPE_POINTER = 0x04
+TYPE_WIDESTRING = 0x05
+TYPE_COLOR = 0x06
+TYPE_UINT64 = 0x07
+TYPE_END = 0x08
+TYPE_INT64 = 0x0A
+TYPE_END_ALT = 0x0B
+
+_SCALARS = {
+    TYPE_INT32: struct.Struct("<i"),
+    TYPE_FLOAT32: struct.Struct("<f"),
+    TYPE_POINTER: struct.Struct("<i"),
+    TYPE_COLOR: struct.Struct("<i"),
+    TYPE_UINT64: struct.Struct("<Q"),
+    TYPE_INT64: struct.Struct("<q"),
+}
+
+
+class AppInfoError(Exception):
+    """
+    appinfo.vdf is missing, of an unknown version, or corrupt.
+    """
+
+
+class AppInfo:
+    """
+    Random access to the records in an appinfo.vdf file.
+
+    :param path: File to read; defaults to APPINFO_PATH.
+    """
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path or APPINFO_PATH)
+        try:
+            with open(self.path, "rb") as infile:
+                st = os.fstat(infile.fileno())
+                self.signature = (st.st_size, st.st_mtime_ns)
+                self.data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as exc:
+            raise AppInfoError(f"Can't read {self.path}: {exc}") from exc
+
+        try:
+            self._read_header()
+            self.index = self._build_index()
+        except struct.error as exc:
+            raise AppInfoError(f"{self.path} is truncated") from exc
+
+    def close(self):
+        self.data.close()
+
+    def _read_header(self):
+        magic, self.universe = struct.unpack_from("<II", self.data, 0)
+        self.version = {MAGIC_V27: 27, MAGIC_V28: 28, MAGIC_V29: 29}.get(magic)
+        if self.version is None:
+            raise AppInfoError(f"{self.path}: unknown appinfo magic {magic:#010x}")
+
+        self.strings = None
+        self.records_start = 8
+        self.records_end = len(self.data)
+        if self.version >= 29:
+            (table,) = struct.unpack_from("<q", self.data, 8)
+            self.records_start = 16
+            self.records_end = table
+            self.strings = self._read_string_table(table)
+
+        # Fixed fields between a record's size and its binary VDF.
+        self.record_header = 4 + 4 + 8 + 20 + 4 + (20 if self.version >= 28 else 0)
+
+    def _read_string_table(self, offset):
+        (count,) = struct.unpack_from("<I", self.data, offset)
+        strings = []
+        pos = offset + 4
+        for _ in range(count):
+            end = self.data.find(b'\0', pos)
+            if end == -1:
+                raise AppInfoError(f"{self.path}: truncated string table")
+            strings.append(self.data[pos:end].decode('utf-8', 'replace'))
+            pos = end + 1
+        return strings
+
+    def _build_index(self):
+        """
+        Map each appID to the (start, end) of its binary VDF, and its
+        change number.
+        """
+        index = {}
+        pos = self.records_start
+        while pos + 4 <= self.records_end:
+            (appID,) = struct.unpack_from("<I", self.data, pos)
+            if appID == 0:
+                break
+            (size,) = struct.unpack_from("<I", self.data, pos + 4)
+            start = pos + 8
+            end = start + size
+            if end > self.records_end:
+                raise AppInfoError(f"{self.path}: record for {appID} overruns the file")
+            (change_number,) = struct.unpack_from("<I", self.data, start + 36)
+            index[appID] = (start + self.record_header, end, change_number)
+            pos = end
+        return index
+
+    def __contains__(self, appID):
+        return int(appID) in self.index
+
+    def _cstring(self, pos):
+        end = self.data.find(b'\0', pos)
+        if end == -1:
+            raise AppInfoError(f"{self.path}: unterminated string at {pos}")
+        return self.data[pos:end].decode('utf-8', 'replace'), end + 1
+
+    def _key(self, pos):
+        if self.strings is None:
+            return self._cstring(pos)
+        (index,) = struct.unpack_from("<I", self.data, pos)
+        return self.strings[index], pos + 4
+
+    def _parse_map(self, pos, end):
+        result = {}
+        while pos < end:
+            kind = self.data[pos]
+            pos += 1
+            if kind in (TYPE_END, TYPE_END_ALT):
+                return result, pos
+
+            key, pos = self._key(pos)
+            if kind == TYPE_MAP:
+                value, pos = self._parse_map(pos, end)
+            elif kind == TYPE_STRING:
+                value, pos = self._cstring(pos)
+            elif kind == TYPE_WIDESTRING:
+                stop = pos
+                while self.data[stop:stop + 2] != b'\0\0':
+                    stop += 2
+                    if stop >= end:
+                        raise AppInfoError(f"{self.path}: unterminated string at {pos}")
+                value, pos = self.data[pos:stop].decode('utf-16-le', 'replace'), stop + 2
+            elif kind in _SCALARS:
+                scalar = _SCALARS[kind]
+                (number,) = scalar.unpack_from(self.data, pos)
+                pos += scalar.size
+                # steamcmd's text output has every value as a string;
+                # match it so callers see the same shape either way.
+                value = str(number)
+            else:
+                raise AppInfoError(f"{self.path}: unknown VDF type {kind:#x} at {pos - 1}")
+            result[key] = value
+        raise AppInfoError(f"{self.path}: unterminated map")
+
+    def get(self, appID):
+        """
+        Decode one app's record.
+
+        :return: The same dict shape as valve.get_info's steamcmd path,
+            i.e. the contents of the app's top-level "appinfo" section;
+            or None if the app isn't in the file.
+        """
+        entry = self.index.get(int(appID))
+        if entry is None:
+            return None
+        start, end, change_number = entry
+        try:
+            root, _ = self._parse_map(start, end)
+        except (struct.error, IndexError) as exc:
+            raise AppInfoError(f"{self.path}: corrupt record for {appID}") from exc
+        info = root.get('appinfo', root)
+        info['_change_number'] = str(change_number)
+        return info
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def load_appinfo(path=None):
+    """
+    Shared AppInfo for a file, re-opened when the client rewrites it.
+    """
+    global _cache
+    path = os.path.expanduser(path or APPINFO_PATH)
+    with _cache_lock:
+        try:
+            st = os.stat(path)
+        except OSError as exc:
+            raise AppInfoError(f"Can't read {path}: {exc}") from exc
+        if (_cache is None or _cache.path != path
+                or _cache.signature != (st.st_size, st.st_mtime_ns)):
+            # Another thread may still be reading the old mapping; it is
+            # unmapped once the last reference to it goes.
+            _cache = AppInfo(path)
+        return _cache
@@ -0,0 +1,186 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+
+from .metadb import metadb
+
+
+LOG = logging.getLogger('vent')
+
+_HAVE_PIL = False
+try:
+    from PIL import Image
+    _HAVE_PIL = True
+except ModuleNotFoundError:
+    pass
+
+
+MANIFEST_NAME = "manifest.json"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def image_size(path):
+    """
+    Read the pixel dimensions of an image without decoding it.
+
+    :return: (width, height), or (None, None) if unknown.
+    """
+    if not _HAVE_PIL or Path(path).suffix.lower() not in IMAGE_EXTENSIONS:
+        return None, None
+    try:
+        with Image.open(path) as img:
+            return img.size
+    except OSError:
+        return None, None
+
+
+def object_path(cache_dir, digest):
+    """
+    Location of a blob in the content-addressed store.
+    """
+    return os.path.join(cache_dir, "objects", digest[:2], digest)
+
+
+def hash_file(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as infile:
+        for chunk in iter(lambda: infile.read(1024 * 1024), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def store_object(cache_dir, data):
+    """
+    Store bytes in the content-addressed store, once.
+
+    :return: (digest, path) of the stored object.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = object_path(cache_dir, digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as outfile:
+            outfile.write(data)
+        os.replace(tmp, path)
+    return digest, path
+
+
+def link_object(source, target):
+    """
+    Hard-link a stored object into place, replacing whatever is there.
+    """
+    tmp = f"{target}.{os.getpid()}.tmp"
+    try:
+        os.link(source, tmp)
+    except OSError:
+        shutil.copyfile(source, tmp)
+    os.replace(tmp, target)
+
+
+class Manifest:
+    """
+    Record of every asset downloaded for an app.
+
+    Entries are keyed by local file name and record the logical asset
+    name, language, source URL, byte size, pixel dimensions, content
+    hash and fetch time, so asset selection can be answered from the
+    manifest rather than by probing the filesystem.
+
+    :param cache_dir: The steam cache directory.
+    :param appID: The steam appID the manifest describes.
+    """
+    def __init__(self, cache_dir, appID):
+        self.cache_dir = str(cache_dir)
+        self.appID = str(appID)
+        self.local_dir = os.path.join(self.cache_dir, self.appID)
+        self.path = os.path.join(self.local_dir, MANIFEST_NAME)
+        self.entries = {}
+        try:
+            with open(self.path, "r") as infile:
+                self.entries = json.load(infile)
+        except FileNotFoundError:
+            pass
+
+    def __contains__(self, local_name):
+        return local_name in self.entries
+
+    def __iter__(self):
+        return iter(self.entries.items())
+
+    def save(self):
+        os.makedirs(self.local_dir, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as outfile:
+            json.dump(self.entries, outfile, indent=2)
+        os.replace(tmp, self.path)
+        # Mirror into the metadata database for library-wide queries.
+        metadb(self.cache_dir).set_assets(self.appID, self.entries)
+
+    def local_path(self, local_name):
+        return os.path.join(self.local_dir, local_name)
+
+    def record(self, local_name, url, asset=None, lang=None, digest=None):
+        """
+        Add or refresh the manifest entry for a file already in place.
+        """
+        path = self.local_path(local_name)
+        if digest is None:
+            digest = hash_file(path)
+        width, height = image_size(path)
+        self.entries[local_name] = {
+            'asset': asset or Path(local_name).stem,
+            'lang': lang,
+            'url': url,
+            'size': os.path.getsize(path),
+            'width': width,
+            'height': height,
+            'sha256': digest,
+            'fetched': datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        return self.entries[local_name]
+
+    def add(self, local_name, data, url, asset=None, lang=None):
+        """
+        Store downloaded bytes and link them into the app's directory.
+        """
+        os.makedirs(self.local_dir, exist_ok=True)
+        digest, obj = store_object(self.cache_dir, data)
+        link_object(obj, self.local_path(local_name))
+        return self.record(local_name, url, asset, lang, digest)
+
+    def find(self, names):
+        """
+        Return the path of the first of names present in the manifest.
+        """
+        for name in names:
+            if name in self.entries:
+                return self.local_path(name)
+        return None
+
+    def best_image(self, min_width=0, landscape=None):
+        """
+        Find the largest image matching the given constraints.
+
+        :param min_width: Minimum width in pixels.
+        :param landscape: If True, only wider-than-tall images; if
+            False, only taller-than-wide ones; None for either.
+        :return: Path to the image, or None.
+        """
+        best = None
+        best_area = 0
+        for name, entry in self.entries.items():
+            width, height = entry.get('width'), entry.get('height')
+            if not width or not height or width < min_width:
+                continue
+            if landscape is not None and (width > height) != landscape:
+                continue
+            if width * height > best_area:
+                best, best_area = name, width * height
+        if best is None:
+            return None
+        return self.local_path(best)
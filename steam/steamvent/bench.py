@@ -0,0 +1,950 @@
+"""
+Hermetic benchmark harness for 'vent' and 'vent-installer'.
+
+Puts stand-in 'steam', 'steamcmd', 'keyd', 'systemctl', 'xfconf-query',
+'gamescope' and 'xrandr' executables on PATH and runs the real launch
+and install code paths against them, in a throwaway directory, with no
+network. Reports per-phase latency and how many external processes
+each run spawned.
+
+Usage::
+
+    python3 -m steamvent.bench launch -n 10 --game-delay 500
+    python3 -m steamvent.bench launch -n 5 --window --window-delay 2000
+    python3 -m steamvent.bench install -n 5 --steamcmd-delay 200
+    python3 -m steamvent.bench throughput --games 20 --latency 0.05 --p429 0.1
+    python3 -m steamvent.bench bundle
+"""
+
+import argparse
+import collections
+import ctypes
+import json
+import logging
+import os
+from pathlib import Path
+import random
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+import vdf
+
+from .appinfo import MAGIC_V28, MAGIC_V29
+from .common import Configuration
+from . import runner
+
+
+LOG = logging.getLogger('vent')
+
+
+BENCH_APPID = "4000000"
+BENCH_GAME = "Benchmark Game"
+BENCH_EXECUTABLE = "benchgame"
+BENCH_GOVERNOR = "schedutil"
+BENCH_MODE = ["1920x1080", "60.00"]
+
+# Performance profile for --profile; only settings that need no
+# privileges, so it applies in full as any user.
+BENCH_PROFILE = """\
+[cpu]
+governor = performance
+affinity = 0
+
+[priority]
+nice = 5
+ionice = idle
+"""
+
+# Display profiles for --display.
+BENCH_DISPLAY = {
+    'gamescope': "[display]\nmethod = gamescope\nrender = 1280x720\nupscale = fsr\nfps = 60\n",
+    'xrandr': "[display]\nmethod = xrandr\nrender = 1280x720\nrefresh = 60\nfps = 30\n",
+}
+
+# A Steam user's localconfig.vdf, before any launch options are set.
+LOCALCONFIG = {'UserLocalConfigStore': {'Software': {'Valve': {'Steam': {'apps': {}}}}}}
+
+# A single script stands in for every fake binary; it looks at the
+# name it was invoked under to decide what to do.
+FAKE_SCRIPT = r'''#!{python}
+import os
+import sys
+import time
+
+name = os.path.basename(sys.argv[0])
+bench_dir = os.environ["BENCH_DIR"]
+
+with open(os.path.join(bench_dir, "spawns.log"), "a") as outfile:
+    outfile.write(name + "\t" + " ".join(sys.argv[1:]) + "\n")
+
+def delay(key):
+    ms = int(os.environ.get("BENCH_DELAY_" + key.upper().replace("-", "_"), "0"))
+    time.sleep(ms / 1000.0)
+
+delay(name)
+
+def fail(message):
+    sys.stderr.write(name + ": " + message + "\n")
+    with open(os.path.join(bench_dir, "errors.log"), "a") as outfile:
+        outfile.write(name + ": " + message + "\n")
+    sys.exit(1)
+
+def launch_options(appID):
+    # The game's launch options, as the real client reads them.
+    import glob
+    import vdf
+    pattern = os.path.expanduser("~/.steam/steam/userdata/*/config/localconfig.vdf")
+    for path in glob.glob(pattern):
+        with open(path) as infile:
+            node = vdf.load(infile)
+        for key in ("userlocalconfigstore", "software", "valve", "steam", "apps", appID):
+            node = [v for k, v in node.items() if k.lower() == key] or [dict()]
+            node = node[0]
+        if node.get("LaunchOptions"):
+            return node["LaunchOptions"]
+    return ""
+
+def run_game(uri):
+    if uri.startswith("steam://rungameid/"):
+        if os.fork() == 0:
+            import shlex
+            os.setsid()
+            delay("game")
+            game = os.path.join(bench_dir, "games", os.environ["BENCH_EXECUTABLE"])
+            lifetime = int(os.environ.get("BENCH_GAME_LIFETIME", "1000")) / 1000.0
+            options = launch_options(uri.rsplit("/", 1)[-1])
+            if "%command%" in options:
+                command = shlex.join([game, str(lifetime)])
+                os.execv("/bin/sh", ["sh", "-c", options.replace("%command%", command)])
+            os.execv(game, [game, str(lifetime)])
+
+# xrandr: one output, and the modes it supports.
+XRANDR_OUTPUT = "HDMI-1"
+XRANDR_MODES = [("1920x1080", ["60.00", "144.00"]), ("1600x900", ["60.00"]), ("1280x720", ["60.00"])]
+
+def xrandr_state():
+    try:
+        with open(os.path.join(bench_dir, "xrandr.mode")) as infile:
+            return infile.read().split()
+    except FileNotFoundError:
+        return ["1920x1080", "60.00"]
+
+if name == "steam" and sys.argv[1:] == ["-bench-client"]:
+    # Stand-in for the running client: read forwarded command lines
+    # from ~/.steam/steam.pipe. O_RDWR keeps the FIFO from ever
+    # reporting EOF when a writer goes away.
+    import signal
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    pipe = os.path.expanduser("~/.steam/steam.pipe")
+    os.makedirs(os.path.dirname(pipe), exist_ok=True)
+    if not os.path.exists(pipe):
+        os.mkfifo(pipe)
+    with open(os.open(pipe, os.O_RDWR), "r") as infile:
+        for line in infile:
+            run_game(line.split()[-1])
+
+elif name == "steam":
+    run_game(sys.argv[-1])
+
+elif name == "gamescope":
+    if "--" not in sys.argv:
+        fail("no command after --")
+    split = sys.argv.index("--")
+    args, command = sys.argv[1:split], sys.argv[split + 1:]
+    numeric = ("-w", "-h", "-W", "-H", "-r", "--framerate-limit")
+    choices = dict([
+        ("-F", ("linear", "nearest", "fsr", "nis", "pixel")),
+        ("-S", ("auto", "integer", "fit", "fill", "stretch")),
+    ])
+    while args:
+        flag = args.pop(0)
+        if flag == "-f":
+            continue
+        if flag not in numeric and flag not in choices:
+            fail("unknown option " + flag)
+        if not args:
+            fail(flag + " needs a value")
+        value = args.pop(0)
+        if flag in numeric and not value.isdigit():
+            fail(flag + " needs a number, not " + value)
+        if flag in choices and value not in choices[flag]:
+            fail("bad value for " + flag + ": " + value)
+    if not command:
+        fail("no command after --")
+    os.execvp(command[0], command)
+
+elif name == "xrandr":
+    modes = dict(XRANDR_MODES)
+    if sys.argv[1:] == ["--query"]:
+        mode, rate = xrandr_state()
+        print("Screen 0: minimum 8 x 8, current " + mode.replace("x", " x ") + ", maximum 32767 x 32767")
+        print(XRANDR_OUTPUT + " connected primary " + mode + "+0+0 (normal left inverted right x axis y axis) 527mm x 296mm")
+        for each, rates in XRANDR_MODES:
+            marks = [r + ("*" if (each, r) == (mode, rate) else " ") + ("+" if (each, i) == (XRANDR_MODES[0][0], 0) else "") for i, r in enumerate(rates)]
+            print("   " + each.ljust(12) + "  " + " ".join(marks))
+        print("DP-1 disconnected (normal left inverted right x axis y axis)")
+    else:
+        args = sys.argv[1:]
+        if args[:2] != ["--output", XRANDR_OUTPUT] or args[2:3] != ["--mode"] or len(args) not in (4, 6):
+            fail("unexpected arguments " + " ".join(args))
+        mode = args[3]
+        rate = modes.get(mode, [None])[0]
+        if mode not in modes:
+            fail("mode " + mode + " not found")
+        if len(args) == 6:
+            if args[4] != "--rate":
+                fail("unexpected arguments " + " ".join(args))
+            rate = [r for r in modes[mode] if float(r) == float(args[5])]
+            if not rate:
+                fail("rate " + args[5] + " not supported by " + mode)
+            rate = rate[0]
+        with open(os.path.join(bench_dir, "xrandr.mode"), "w") as outfile:
+            outfile.write(mode + " " + rate)
+
+elif name == "steamcmd" and "+app_info_print" in sys.argv:
+    appID = sys.argv[sys.argv.index("+app_info_print") + 1]
+    canned = os.path.join(bench_dir, "app_info", appID + ".vdf")
+    if not os.path.exists(canned):
+        canned = os.path.join(bench_dir, "app_info.vdf")
+    print("Redirecting stderr to '/dev/null'")
+    print("Loading Steam API...OK")
+    with open(canned, "r") as infile:
+        print(infile.read())
+    print("Unloading Steam API...OK")
+'''
+
+# Stand-in game for --window: maps a window carrying its _NET_WM_PID
+# after a delay, as a slow-loading game would. Needs python-xlib.
+WINDOW_CLIENT = r'''#!{python}
+import os
+import sys
+import time
+
+from Xlib import X, Xatom
+from Xlib.display import Display
+
+lifetime = float(sys.argv[1])
+time.sleep(int(os.environ.get("BENCH_DELAY_WINDOW", "0")) / 1000.0)
+
+display = Display()
+screen = display.screen()
+window = screen.root.create_window(0, 0, 640, 480, 0, screen.root_depth, X.InputOutput)
+window.change_property(display.intern_atom("_NET_WM_PID"), Xatom.CARDINAL, 32, [os.getpid()])
+window.map()
+display.sync()
+time.sleep(lifetime)
+'''
+
+FAKE_BINARIES = ('steam', 'steamcmd', 'keyd', 'systemctl', 'xfconf-query', 'gamescope', 'xrandr')
+
+# Canned steamcmd +app_info_print output.
+APP_INFO = {
+    'common': {
+        'name': BENCH_GAME,
+        'review_percentage': "90",
+        'steam_release_date': "1500000000",
+    },
+    'config': {
+        'installdir': "Benchmark",
+        'launch': {
+            '0': {
+                'executable': BENCH_EXECUTABLE,
+                'config': {'oslist': "linux"},
+            },
+        },
+    },
+    'extended': {
+        'developer': "LowellMakes",
+        'publisher': "LowellMakes",
+    },
+}
+
+# Canned IStoreBrowseService and appdetails responses, written to the
+# cache up front so nothing is fetched over the network.
+WEB_INFO = {
+    'assets': {},
+    'trailers': {},
+    'basic_info': {'short_description': "A game for benchmarking."},
+}
+STORE_INFO = {
+    'genres': [{'description': "Benchmark"}],
+    'categories': [{'description': "Single-player"}],
+}
+
+
+def _binary_vdf(obj, strings=None):
+    """
+    Encode a dict as binary VDF, with keys inline or, given a string
+    table list, as indices into it.
+    """
+    out = bytearray()
+    for key, value in obj.items():
+        if isinstance(value, dict):
+            out.append(0x00)
+        elif isinstance(value, int):
+            out.append(0x02)
+        else:
+            out.append(0x01)
+        if strings is None:
+            out += key.encode() + b'\0'
+        else:
+            if key not in strings:
+                strings.append(key)
+            out += struct.pack("<I", strings.index(key))
+        if isinstance(value, dict):
+            out += _binary_vdf(value, strings)
+        elif isinstance(value, int):
+            out += struct.pack("<i", value)
+        else:
+            out += str(value).encode() + b'\0'
+    out.append(0x08)
+    return bytes(out)
+
+
+def write_appinfo(path, apps, version=29):
+    """
+    Write a Steam client appinfo.vdf holding the given apps.
+
+    :param apps: dict of appID to app info, as valve.get_info returns.
+    :param version: 28 or 29.
+    """
+    strings = [] if version >= 29 else None
+    records = bytearray()
+    for appID, info in apps.items():
+        body = dict(info)
+        body['appid'] = int(appID)
+        payload = _binary_vdf({'appinfo': body}, strings)
+        header = struct.pack("<IIQ20sI20s", 2, int(time.time()), 0, b'\0' * 20, 1, b'\0' * 20)
+        records += struct.pack("<II", int(appID), len(header) + len(payload))
+        records += header + payload
+    records += struct.pack("<I", 0)
+
+    magic = {28: MAGIC_V28, 29: MAGIC_V29}[version]
+    if strings is None:
+        data = struct.pack("<II", magic, 1) + records
+    else:
+        table = struct.pack("<I", len(strings))
+        table += b''.join(s.encode() + b'\0' for s in strings)
+        data = struct.pack("<IIq", magic, 1, 16 + len(records)) + records + table
+
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    Path(path).write_bytes(data)
+
+
+PR_SET_CHILD_SUBREAPER = 36
+
+
+def _become_subreaper():
+    # The fake steam orphans the fake game, just like the real one. Adopt
+    # orphans ourselves so we can reap them between runs; otherwise, in a
+    # container without a reaping init, the previous run's zombie would
+    # be "detected" as the next run's game.
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0) != 0:
+        LOG.warning("Could not become a child subreaper")
+
+
+def _reap_orphans():
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return
+        if pid == 0:
+            return
+
+
+class PhaseRecorder(logging.Handler):
+    """
+    Collect the durations of structured 'phase' log records.
+    """
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.phases = collections.defaultdict(list)
+
+    def emit(self, record):
+        name = getattr(record, 'phase', None)
+        duration = getattr(record, 'duration', None)
+        if name and duration is not None and name != 'exec':
+            self.phases[name].append(duration)
+
+
+class Bench:
+    """
+    A throwaway cabinet: fake binaries on PATH and a fake home directory.
+
+    :param root: Directory to build the environment in.
+    :param delays: dict of fake binary name (or 'game') to delay in ms.
+    :param game_lifetime: How long the fake game runs for, in ms.
+    :param appinfo: Give the fake Steam client an appinfo.vdf, so
+        metadata comes from it rather than from steamcmd.
+    :param profile: Give the game a performance profile, applied
+        against a fake sysfs tree.
+    :param display: Give the game a display profile using this method,
+        'gamescope' or 'xrandr'.
+    :param x_display: Run the game as a window client on this X
+        display (see start_xvfb), rather than as a plain process.
+    """
+    def __init__(self, root, delays=None, game_lifetime=1000, appinfo=False, profile=False,
+                 display=None, x_display=None):
+        self.root = Path(root)
+        self.x_display = x_display
+        self.appinfo = appinfo
+        self.profile = profile
+        self.display = display
+        self.sysfs = self.root.joinpath("sys")
+        self.bin_dir = self.root.joinpath("bin")
+        self.home = self.root.joinpath("home")
+        self.delays = delays or {}
+        self.game_lifetime = game_lifetime
+        self._saved_env = {}
+
+    def setup(self):
+        self.bin_dir.mkdir(parents=True, exist_ok=True)
+        self.root.joinpath("games").mkdir(exist_ok=True)
+
+        fake = self.bin_dir.joinpath("fake.py")
+        fake.write_text(FAKE_SCRIPT.format(python=sys.executable))
+        self.root.joinpath("app_info.vdf").write_text(
+            vdf.dumps({BENCH_APPID: APP_INFO}, pretty=True)
+        )
+        fake.chmod(0o755)
+        for name in FAKE_BINARIES:
+            link = self.bin_dir.joinpath(name)
+            if not link.exists():
+                link.symlink_to(fake)
+
+        # The "game" is just sleep(1), under the game's executable name,
+        # or a window client that also sleeps.
+        game = self.root.joinpath("games", BENCH_EXECUTABLE)
+        if game.exists() or game.is_symlink():
+            game.unlink()
+        if self.x_display:
+            game.write_text(WINDOW_CLIENT.format(python=sys.executable))
+            game.chmod(0o755)
+        else:
+            game.symlink_to(shutil.which("sleep"))
+
+        # An install directory for readahead to work on.
+        install_dir = self.home.joinpath(
+            ".steam", "steam", "steamapps", "common", APP_INFO['config']['installdir']
+        )
+        install_dir.mkdir(parents=True, exist_ok=True)
+        for name, size in ((BENCH_EXECUTABLE, 64 * 1024), ("data.pak", 8 * 1024 ** 2)):
+            data = install_dir.joinpath(name)
+            if not data.exists():
+                data.write_bytes(os.urandom(size))
+
+        appinfo = self.home.joinpath(".steam", "steam", "appcache", "appinfo.vdf")
+        if self.appinfo:
+            write_appinfo(appinfo, {BENCH_APPID: APP_INFO})
+        elif appinfo.exists():
+            appinfo.unlink()
+
+        # Two CPUs' worth of cpufreq for performance profiles.
+        for cpu in range(2):
+            cpufreq = self.sysfs.joinpath("devices", "system", "cpu", f"cpu{cpu}", "cpufreq")
+            cpufreq.mkdir(parents=True, exist_ok=True)
+            cpufreq.joinpath("scaling_available_governors").write_text(
+                "performance powersave schedutil\n"
+            )
+            cpufreq.joinpath("scaling_governor").write_text(f"{BENCH_GOVERNOR}\n")
+
+        cfg = self.configuration()
+        for path in (cfg.keymap_dir, cfg.game_dir, cfg.run_dir):
+            path.mkdir(parents=True, exist_ok=True)
+        cfg.default_keymap.write_text("# benchmark\n")
+        cfg.keymap_dir.joinpath(f"{BENCH_APPID}.conf").write_text("# benchmark\n")
+        perf = cfg.keymap_dir.joinpath(f"{BENCH_APPID}.perf")
+        if self.profile:
+            perf.write_text(BENCH_PROFILE)
+        elif perf.exists():
+            perf.unlink()
+
+        localconfig = self.home.joinpath(".steam", "steam", "userdata", "1000", "config", "localconfig.vdf")
+        localconfig.parent.mkdir(parents=True, exist_ok=True)
+        localconfig.write_text(vdf.dumps(LOCALCONFIG, pretty=True))
+        self.root.joinpath("xrandr.mode").write_text(" ".join(BENCH_MODE))
+        display = cfg.keymap_dir.joinpath(f"{BENCH_APPID}.display")
+        if self.display:
+            display.write_text(BENCH_DISPLAY[self.display])
+        elif display.exists():
+            display.unlink()
+        return cfg
+
+    def seed_cache(self, appID=BENCH_APPID):
+        cfg = self.configuration()
+        local_dir = cfg.cache_dir.joinpath(str(appID))
+        local_dir.mkdir(parents=True, exist_ok=True)
+        local_dir.joinpath("web.json").write_text(json.dumps(WEB_INFO))
+        local_dir.joinpath("store.json").write_text(json.dumps(STORE_INFO))
+        # Always requested by the installer; make it a cache hit.
+        local_dir.joinpath("page_bg_raw.jpg").write_bytes(b'')
+
+    def configuration(self):
+        steam_root = self.home.joinpath("RetroPie", "steam")
+        keymap_dir = steam_root.joinpath("keymaps")
+        return Configuration(
+            user="bench",
+            home_dir=self.home,
+            retropie_dir=self.home.joinpath("RetroPie"),
+            steam_dir=steam_root,
+            game_dir=steam_root.joinpath("menu"),
+            keymap_dir=keymap_dir,
+            cache_dir=steam_root.joinpath("cache"),
+            run_dir=steam_root.joinpath("run"),
+            history_db=steam_root.joinpath("history.db"),
+            active_keymap=keymap_dir.joinpath("active.conf"),
+            default_keymap=keymap_dir.joinpath("default.conf"),
+            keyd_config=self.root.joinpath("keyd.conf"),
+            es_config=self.root.joinpath("es_systems.cfg"),
+            autostart_config=self.home.joinpath(".config/autostart/retropie.desktop"),
+        )
+
+    def __enter__(self):
+        env = {
+            'PATH': f"{self.bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+            'HOME': str(self.home),
+            'BENCH_DIR': str(self.root),
+            'BENCH_EXECUTABLE': BENCH_EXECUTABLE,
+            'BENCH_GAME_LIFETIME': str(self.game_lifetime),
+            'VENT_SYSFS_ROOT': str(self.sysfs),
+        }
+        # Without a window client, keep the launcher off any real display.
+        env['DISPLAY'] = self.x_display or ""
+        for name, ms in self.delays.items():
+            key = "BENCH_DELAY_" + name.upper().replace("-", "_")
+            env[key] = str(ms)
+
+        for key, value in env.items():
+            self._saved_env[key] = os.environ.get(key)
+            os.environ[key] = value
+        return self
+
+    def __exit__(self, *exc_info):
+        for key, value in self._saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+    def check_restored(self):
+        """
+        Raise if a fake binary rejected its arguments, or a session left
+        the CPU governors or screen mode changed.
+        """
+        errors = self.root.joinpath("errors.log")
+        if errors.exists():
+            raise Exception(f"Fake binaries reported errors:\n{errors.read_text()}")
+        if self.governors() != [BENCH_GOVERNOR] * 2:
+            raise Exception(f"CPU governors not restored: {self.governors()}")
+        mode = self.root.joinpath("xrandr.mode").read_text().split()
+        if mode != BENCH_MODE:
+            raise Exception(f"Screen mode not restored: {mode}")
+
+    def governors(self):
+        """
+        The fake CPUs' current governors.
+        """
+        return [
+            path.read_text().strip()
+            for path in sorted(self.sysfs.glob("devices/system/cpu/cpu*/cpufreq/scaling_governor"))
+        ]
+
+    def spawns(self):
+        """
+        Count fake binary invocations since the last call, by name.
+        """
+        log = self.root.joinpath("spawns.log")
+        counts = collections.Counter()
+        if log.exists():
+            for line in log.read_text().splitlines():
+                counts[line.split("\t", 1)[0]] += 1
+            log.unlink()
+        return counts
+
+
+def bench_launch(bench, cfg):
+    # Imported here so that a missing optional dependency only breaks
+    # the benchmark that needs it.
+    from .launcher import do_launch
+    from .session import LaunchLock
+
+    keymap = cfg.keymap_dir.joinpath(f"{BENCH_APPID}.conf")
+    session = LaunchLock(cfg.run_dir)
+    if not session.acquire(BENCH_APPID):
+        raise Exception("Benchmark launch lock is already held")
+    with session:
+        do_launch(cfg, BENCH_APPID, keymap, session)
+
+
+def bench_install(bench, cfg):
+    from .install import install_game
+
+    # Start from a cold metadata cache each time.
+    shutil.rmtree(cfg.cache_dir, ignore_errors=True)
+    bench.seed_cache()
+    install_game(cfg, BENCH_APPID)
+
+
+def make_fixtures(fixture_dir, count, asset_size=256 * 1024):
+    """
+    Synthesise fixtures for count games, for the mock Steam server.
+    """
+    rng = random.Random(0)
+    for i in range(count):
+        appID = str(int(BENCH_APPID) + i)
+        local_dir = Path(fixture_dir, appID)
+        local_dir.mkdir(parents=True, exist_ok=True)
+
+        info = json.loads(json.dumps(APP_INFO))
+        info['common']['name'] = f"{BENCH_GAME} {i}"
+        local_dir.joinpath("vdf.json").write_text(json.dumps(info))
+
+        web = json.loads(json.dumps(WEB_INFO))
+        web['assets'] = {
+            'header': "header.jpg",
+            'main_capsule': "capsule_616x353.jpg",
+            'hero_capsule': "hero_capsule.jpg",
+        }
+        local_dir.joinpath("web.json").write_text(json.dumps(web))
+        local_dir.joinpath("store.json").write_text(json.dumps(STORE_INFO))
+
+        for name in web['assets'].values():
+            local_dir.joinpath(name).write_bytes(rng.randbytes(asset_size))
+
+
+def _report(title, totals, recorder, spawns, exec_counts, iterations):
+    print("")
+    print(f"== {title}: {iterations} iterations ==")
+    print("")
+    print(f"{'phase':20s} {'mean':>8s} {'min':>8s} {'max':>8s}")
+    rows = [('total', totals)] + sorted(recorder.phases.items())
+    for name, values in rows:
+        print(
+            f"{name:20s} {statistics.mean(values):8.3f} "
+            f"{min(values):8.3f} {max(values):8.3f}"
+        )
+
+    print("")
+    print(f"{'process spawns/run':20s} {'fake':>8s} {'ex()':>8s}")
+    for name in sorted(set(spawns) | set(exec_counts)):
+        print(
+            f"{name:20s} {spawns[name] / iterations:8.1f} "
+            f"{exec_counts.get(name, 0) / iterations:8.1f}"
+        )
+
+
+def start_client(bench):
+    """
+    Start a stand-in Steam client listening on ~/.steam/steam.pipe.
+    """
+    proc = subprocess.Popen([str(bench.bin_dir.joinpath("steam")), "-bench-client"])
+    pipe = bench.home.joinpath(".steam", "steam.pipe")
+    for _ in range(100):
+        if pipe.exists():
+            break
+        time.sleep(0.05)
+    return proc
+
+
+def start_xvfb():
+    """
+    Start a private Xvfb server.
+
+    :return: (process, display name)
+    """
+    if not shutil.which("Xvfb"):
+        raise Exception("--window needs Xvfb installed")
+    read_fd, write_fd = os.pipe()
+    proc = subprocess.Popen(
+        ["Xvfb", "-displayfd", str(write_fd), "-nolisten", "tcp", "-screen", "0", "1280x720x24"],
+        pass_fds=(write_fd,),
+        stderr=subprocess.DEVNULL,
+    )
+    os.close(write_fd)
+    with os.fdopen(read_fd) as infile:
+        number = infile.readline().strip()
+    if not number:
+        proc.kill()
+        raise Exception("Xvfb failed to start")
+    return proc, f":{number}"
+
+
+def run_benchmark(kind, iterations, delays, game_lifetime, workdir=None,
+                  client=False, appinfo=False, profile=False, display=None, window=False):
+    """
+    Run a benchmark end to end and print a latency report.
+
+    :param kind: 'launch' or 'install'.
+    :param iterations: Number of runs.
+    :param delays: dict of fake binary name (or 'game') to delay in ms.
+    :param game_lifetime: How long the fake game runs for, in ms.
+    :param workdir: Directory to build the environment in; defaults to
+        a temporary directory that is removed afterwards.
+    :param client: Run a stand-in Steam client, so launches are
+        dispatched over its pipe rather than through the bootstrap.
+    :param appinfo: Provide the client's appinfo.vdf.
+    :param profile: Give the game a performance profile.
+    :param display: Give the game a display profile: 'gamescope' or 'xrandr'.
+    :param window: Run the game as a window client under Xvfb, so the
+        launcher's window detection is exercised.
+    """
+    target = {'launch': bench_launch, 'install': bench_install}[kind]
+
+    _become_subreaper()
+    recorder = PhaseRecorder()
+    LOG.setLevel(logging.DEBUG)
+    LOG.addHandler(recorder)
+
+    with tempfile.TemporaryDirectory(prefix="vent-bench-") as tmp:
+        xvfb, x_display = start_xvfb() if window else (None, None)
+        bench = Bench(workdir or tmp, delays, game_lifetime, appinfo, profile, display, x_display)
+        cfg = bench.setup()
+        bench.seed_cache()
+
+        totals = []
+        spawns = collections.Counter()
+        with bench:
+            proc = start_client(bench) if client else None
+            bench.spawns()
+            try:
+                before = runner.stats()
+                for _ in range(iterations):
+                    start = time.monotonic()
+                    target(bench, cfg)
+                    totals.append(time.monotonic() - start)
+                    spawns.update(bench.spawns())
+                    _reap_orphans()
+                    bench.check_restored()
+                after = runner.stats()
+            finally:
+                if proc:
+                    proc.terminate()
+                    proc.wait()
+                if xvfb:
+                    xvfb.terminate()
+                    xvfb.wait()
+
+    exec_counts = {
+        name: stats.calls - (before[name].calls if name in before else 0)
+        for name, stats in after.items()
+    }
+
+    LOG.removeHandler(recorder)
+    _report(kind, totals, recorder, spawns, exec_counts, iterations)
+
+
+def run_throughput(games, faults, fixtures=None, workdir=None):
+    """
+    Install every fixture game against a local mock Steam server.
+
+    :param games: Number of synthetic games, if fixtures isn't given.
+    :param faults: mockserver.Faults to inject.
+    :param fixtures: Directory of recorded fixtures (a cache directory).
+    :param workdir: Directory to build the environment in.
+    """
+    from .install import install_game
+    from .mockserver import MockSteamServer
+
+    _become_subreaper()
+    recorder = PhaseRecorder()
+    LOG.setLevel(logging.DEBUG)
+    LOG.addHandler(recorder)
+
+    with tempfile.TemporaryDirectory(prefix="vent-bench-") as tmp:
+        bench = Bench(workdir or tmp)
+        cfg = bench.setup()
+
+        if fixtures is None:
+            fixtures = bench.root.joinpath("fixtures")
+            make_fixtures(fixtures, games)
+
+        app_info_dir = bench.root.joinpath("app_info")
+        app_info_dir.mkdir(exist_ok=True)
+        server = MockSteamServer(fixtures, faults).start()
+        app_ids = server.fixtures.app_ids()
+        for appID in app_ids:
+            info = json.loads(Path(fixtures, appID, "vdf.json").read_text())
+            app_info_dir.joinpath(f"{appID}.vdf").write_text(
+                vdf.dumps({appID: info}, pretty=True)
+            )
+
+        os.environ['VENT_STEAM_BASE'] = server.url
+        totals = []
+        try:
+            with bench:
+                start = time.monotonic()
+                for appID in app_ids:
+                    game_start = time.monotonic()
+                    install_game(cfg, appID)
+                    totals.append(time.monotonic() - game_start)
+                elapsed = time.monotonic() - start
+        finally:
+            del os.environ['VENT_STEAM_BASE']
+            server.stop()
+
+        fetched = sum(
+            path.stat().st_size
+            for path in cfg.cache_dir.joinpath("objects").rglob("*")
+            if path.is_file()
+        )
+
+    LOG.removeHandler(recorder)
+    _report("throughput", totals, recorder, collections.Counter(), {}, len(app_ids))
+    print("")
+    print(f"{len(app_ids)} games in {elapsed:.3f}s: {len(app_ids) / elapsed:.2f} games/s")
+    print(f"{fetched / 1024 / 1024:.1f} MiB of assets stored")
+    for name, value in sorted(server.counters.items()):
+        print(f"server {name:13s} {value}")
+
+
+def run_bundle(workdir=None):
+    """
+    Export an installed game whose assets are deduplicated, import it
+    into an empty cache and check everything came back.
+
+    :param workdir: Directory to build the environment in.
+    """
+    from .assets import Manifest
+    from .bundle import BUNDLE_MANIFEST, export_bundle, import_bundle
+    from .install import install_game, read_gamelist_entries, update_gamelist_xml
+
+    with tempfile.TemporaryDirectory(prefix="vent-bench-") as tmp:
+        bench = Bench(workdir or tmp)
+        cfg = bench.setup()
+        bench.seed_cache()
+        with bench:
+            install_game(cfg, BENCH_APPID)
+            # Identical bytes under two names: both are hard links to
+            # one object in the store.
+            manifest = Manifest(cfg.cache_dir, BENCH_APPID)
+            data = os.urandom(64 * 1024)
+            for name in ("hero.jpg", "hero_english.jpg"):
+                manifest.add(name, data, f"https://example.invalid/{name}", "hero")
+            manifest.save()
+            # Neither this cabinet's play history nor a half-written
+            # file belongs in the bundle.
+            entry = read_gamelist_entries()[str(BENCH_APPID)]
+            update_gamelist_xml(dict(entry, playcount="3"))
+            Path(manifest.local_dir, "trailer_es.mp4.part").write_bytes(b"partial")
+            expected = {
+                name: Path(manifest.local_path(name)).read_bytes() for name in manifest.entries
+            }
+
+            path = bench.root.joinpath("bundle.tar.gz")
+            start = time.monotonic()
+            export_bundle(cfg, [BENCH_APPID], path)
+            exported = time.monotonic() - start
+
+            shutil.rmtree(cfg.cache_dir)
+            cfg.keymap_dir.joinpath(f"{BENCH_APPID}.conf").unlink()
+            start = time.monotonic()
+            if not import_bundle(cfg, str(path)):
+                raise Exception("Bundle import skipped games")
+            imported = time.monotonic() - start
+
+            manifest = Manifest(cfg.cache_dir, BENCH_APPID)
+            if set(manifest.entries) != set(expected):
+                raise Exception(f"Imported assets differ: {sorted(manifest.entries)}")
+            for name, content in expected.items():
+                if Path(manifest.local_path(name)).read_bytes() != content:
+                    raise Exception(f"Imported asset '{name}' differs")
+            if not cfg.keymap_dir.joinpath(f"{BENCH_APPID}.conf").exists():
+                raise Exception("Keymap not imported")
+            if Path(manifest.local_dir, "trailer_es.mp4.part").exists():
+                raise Exception("Partial file exported")
+            with tarfile.open(path) as tar:
+                bundle = json.load(tar.extractfile(BUNDLE_MANIFEST))
+            if 'playcount' in bundle['apps'][str(BENCH_APPID)]['gamelist']:
+                raise Exception("Play history exported")
+
+    print(f"bundle round trip: export {exported:.3f}s, import {imported:.3f}s, {len(expected)} assets")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark vent launches and installs against stand-in binaries",
+    )
+    parser.add_argument("kind", choices=("launch", "install", "throughput", "bundle"))
+    parser.add_argument(
+        "--games", type=int, default=10,
+        help="throughput: number of synthetic games to install",
+    )
+    parser.add_argument("--fixtures", help="throughput: recorded fixture directory")
+    parser.add_argument("--latency", type=float, default=0.0, help="throughput: server latency, in seconds")
+    parser.add_argument("--p404", type=float, default=0.0, help="throughput: probability of a 404")
+    parser.add_argument("--p429", type=float, default=0.0, help="throughput: probability of a 429")
+    parser.add_argument("--truncate", type=float, default=0.0, help="throughput: probability of a truncated body")
+    parser.add_argument("-n", "--iterations", type=int, default=5)
+    parser.add_argument(
+        "--appinfo", action="store_true",
+        help="launch/install: provide the Steam client's appinfo.vdf",
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="launch: give the game a performance profile, against a fake sysfs",
+    )
+    parser.add_argument(
+        "--display", choices=sorted(BENCH_DISPLAY),
+        help="launch: give the game a display profile using this method",
+    )
+    parser.add_argument(
+        "--window", action="store_true",
+        help="launch: run the game as a window client under Xvfb (needs python-xlib)",
+    )
+    parser.add_argument(
+        "--window-delay", type=int, default=1000,
+        help="--window: ms between the game starting and its window appearing",
+    )
+    parser.add_argument(
+        "--steam-client", action="store_true",
+        help="launch: run a stand-in Steam client listening on steam.pipe",
+    )
+    parser.add_argument(
+        "--game-delay", type=int, default=500,
+        help="ms between the steam:// dispatch and the game process appearing",
+    )
+    parser.add_argument(
+        "--game-lifetime", type=int, default=1000,
+        help="ms the fake game runs for before exiting",
+    )
+    for name in FAKE_BINARIES:
+        parser.add_argument(
+            f"--{name}-delay", type=int, default=0,
+            help=f"ms the fake '{name}' takes to run",
+        )
+    parser.add_argument("--workdir", help="Keep the environment in this directory")
+    args = parser.parse_args()
+
+    delays = {'game': args.game_delay, 'window': args.window_delay}
+    for name in FAKE_BINARIES:
+        delays[name] = getattr(args, f"{name.replace('-', '_')}_delay")
+
+    if args.kind == 'throughput':
+        from .mockserver import Faults
+        faults = Faults(
+            latency=args.latency,
+            not_found=args.p404,
+            rate_limited=args.p429,
+            truncated=args.truncate,
+        )
+        run_throughput(args.games, faults, args.fixtures, args.workdir)
+    elif args.kind == 'bundle':
+        run_bundle(args.workdir)
+    else:
+        run_benchmark(
+            args.kind, args.iterations, delays, args.game_lifetime,
+            args.workdir, args.steam_client, args.appinfo, args.profile, args.display,
+            args.window,
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+"""
+Portable game bundles, for provisioning cabinets without a network.
+
+``vent-installer export <appID...>`` packs each game's cached metadata
+and assets, its keymap, its menu script and its gamelist entry into a
+single gzipped tarball. ``vent-installer import <bundle>`` streams it
+back in, checking every file against the SHA-256 recorded in the
+bundle, and registers all of the games in one gamelist.xml write.
+
+Bundles don't carry the games themselves; Steam still downloads those
+on first launch or with ``steamcmd +app_update``.
+
+Layout::
+
+    bundle.json                   always the first member; see below
+    <appID>/cache/<name>          files from cache/<appID>/
+    <appID>/keymap.conf           keymaps/<appID>.conf
+    <appID>/menu/<name>.sh        the menu script
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import stat
+import sys
+import tarfile
+import tempfile
+
+from .assets import MANIFEST_NAME, Manifest, hash_file
+from .common import get_configuration
+from .install import game_entry, read_gamelist_entries, update_gamelist_xml
+from .valve import SOURCES, read_cached_info, write_cached_info
+
+
+LOG = logging.getLogger('vent')
+
+BUNDLE_VERSION = 1
+BUNDLE_MANIFEST = "bundle.json"
+
+# Gamelist paths are stored relative to the home directory, since it
+# differs from cabinet to cabinet.
+HOME_MARKER = "~"
+
+# The gamelist fields install.generate_gamelist_entry writes; the rest
+# (playcount, lastplayed, favorite, ...) belong to the cabinet and
+# EmulationStation, not to the game.
+GAMELIST_FIELDS = (
+    'name', 'steam_appID', 'desc', 'image', 'video', 'rating', 'releasedate',
+    'developer', 'publisher', 'genre', 'players', 'path',
+)
+
+# Files still being written, by Manifest.add or a transcode.
+PARTIAL_SUFFIXES = (".part", ".tmp")
+
+
+class BundleError(Exception):
+    """
+    The bundle is unreadable, or doesn't match its own manifest.
+    """
+
+
+def _relocate(entry, old, new):
+    return {
+        key: new + value[len(old):] if value.startswith(old + "/") else value
+        for key, value in entry.items()
+    }
+
+
+def _add_bytes(tar, arcname, data):
+    info = tarfile.TarInfo(arcname)
+    info.size = len(data)
+    info.mtime = int(datetime.datetime.now().timestamp())
+    with tempfile.SpooledTemporaryFile() as buf:
+        buf.write(data)
+        buf.seek(0)
+        tar.addfile(info, buf)
+
+
+def _add_file(tar, path, arcname):
+    # Assets are hard links into the object store; tar.add() would
+    # write every repeat of an inode as a link member, which a
+    # streaming import can't verify on its own. Always write contents.
+    with open(path, "rb") as infile:
+        info = tar.gettarinfo(arcname=arcname, fileobj=infile)
+        info.type = tarfile.REGTYPE
+        info.linkname = ""
+        info.size = os.fstat(infile.fileno()).st_size
+        tar.addfile(info, infile)
+
+
+def export_bundle(cfg, app_ids, path):
+    """
+    Write a bundle of the given, already installed, games.
+    """
+    gamelist = read_gamelist_entries()
+    contents = {}
+    sources = []
+
+    for appID in (str(a) for a in app_ids):
+        local_dir = cfg.cache_dir.joinpath(appID)
+        if not local_dir.is_dir():
+            raise BundleError(f"appID {appID} has no cache directory; install it first")
+
+        entry = gamelist.get(appID)
+        if entry:
+            entry = {key: value for key, value in entry.items() if key in GAMELIST_FIELDS}
+        # Metadata comes from the metadata database, as <source>.json;
+        # everything else straight from the app's cache directory.
+        # Sources are bytes, or paths to read.
+        files = []
+        for source in SOURCES:
+            data = read_cached_info(cfg.cache_dir, appID, source)
+            if data is not None:
+                files.append((json.dumps(data).encode(), f"{appID}/cache/{source}.json"))
+        skip = {MANIFEST_NAME} | {f"{source}.json" for source in SOURCES}
+        files += [
+            (p, f"{appID}/cache/{p.name}") for p in sorted(local_dir.iterdir())
+            if p.is_file() and p.name not in skip and not p.name.endswith(PARTIAL_SUFFIXES)
+        ]
+        keymap = cfg.keymap_dir.joinpath(f"{appID}.conf")
+        if keymap.exists():
+            files.append((keymap, f"{appID}/keymap.conf"))
+        if entry and entry.get('path'):
+            script = Path(entry['path'])
+            if script.exists():
+                files.append((script, f"{appID}/menu/{script.name}"))
+
+        contents[appID] = {
+            'files': {},
+            'assets': Manifest(cfg.cache_dir, appID).entries,
+            'gamelist': _relocate(entry, str(cfg.home_dir), HOME_MARKER) if entry else None,
+        }
+        sources.append((appID, files))
+
+    # Hash everything first so the manifest can lead the archive, and
+    # import can verify each file as it streams past.
+    for appID, files in sources:
+        for source, arcname in files:
+            if isinstance(source, bytes):
+                digest = hashlib.sha256(source).hexdigest()
+            else:
+                digest = hash_file(source)
+            contents[appID]['files'][arcname] = digest
+
+    manifest = json.dumps({
+        'version': BUNDLE_VERSION,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'apps': contents,
+    }, indent=2).encode()
+
+    tmp = f"{path}.tmp"
+    with tarfile.open(tmp, "w:gz", compresslevel=6) as tar:
+        _add_bytes(tar, BUNDLE_MANIFEST, manifest)
+        for appID, files in sources:
+            print(f"exporting {appID} ({len(files)} files)")
+            for source, arcname in files:
+                if isinstance(source, bytes):
+                    _add_bytes(tar, arcname, source)
+                else:
+                    _add_file(tar, source, arcname)
+    os.replace(tmp, path)
+
+    print(f"wrote {path}: {len(sources)} games, {os.path.getsize(path) / 1024 / 1024:.1f} MiB")
+
+
+def _extract_member(tar, member, target):
+    """
+    Stream one member to target, returning its SHA-256.
+    """
+    sha = hashlib.sha256()
+    src = tar.extractfile(member)
+    with open(target, "wb") as outfile:
+        for chunk in iter(lambda: src.read(1024 * 1024), b''):
+            sha.update(chunk)
+            outfile.write(chunk)
+    return sha.hexdigest()
+
+
+def _install_app(cfg, appID, contents, staged):
+    """
+    Move one app's verified, staged files into place.
+    """
+    manifest = Manifest(cfg.cache_dir, appID)
+    os.makedirs(manifest.local_dir, exist_ok=True)
+    assets = contents['assets']
+    metadata = {f"{source}.json": source for source in SOURCES}
+
+    for arcname, path in staged.items():
+        if arcname.endswith("/keymap.conf"):
+            os.makedirs(cfg.keymap_dir, exist_ok=True)
+            shutil.move(path, cfg.keymap_dir.joinpath(f"{appID}.conf"))
+            continue
+
+        kind, name = arcname.split('/', 2)[1:]
+        # Never trust the bundle with a path.
+        name = os.path.basename(name)
+        if kind == 'menu':
+            os.makedirs(cfg.game_dir, exist_ok=True)
+            script = cfg.game_dir.joinpath(name)
+            shutil.move(path, script)
+            os.chmod(script, os.stat(script).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        elif name in metadata:
+            with open(path, "r") as infile:
+                write_cached_info(cfg.cache_dir, appID, metadata[name], json.load(infile))
+        elif name in assets:
+            entry = assets[name]
+            with open(path, "rb") as infile:
+                manifest.add(name, infile.read(), entry['url'], entry['asset'], entry['lang'])
+        else:
+            shutil.move(path, manifest.local_path(name))
+
+    manifest.save()
+
+
+def import_bundle(cfg, path):
+    """
+    Restore every game in a bundle and register them in gamelist.xml.
+
+    :param path: Bundle file, or '-' for stdin.
+    """
+    fileobj = sys.stdin.buffer if path == '-' else None
+
+    os.makedirs(cfg.steam_dir, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".import-", dir=cfg.steam_dir)
+    try:
+        with tarfile.open(path if fileobj is None else None, "r|*", fileobj=fileobj) as tar:
+            members = iter(tar)
+            first = next(members, None)
+            if first is None or first.name != BUNDLE_MANIFEST:
+                raise BundleError(f"{path}: not a vent bundle ({BUNDLE_MANIFEST} missing)")
+            bundle = json.load(tar.extractfile(first))
+            if bundle.get('version') != BUNDLE_VERSION:
+                raise BundleError(f"{path}: unsupported bundle version {bundle.get('version')}")
+
+            expected = {
+                arcname: digest
+                for contents in bundle['apps'].values()
+                for arcname, digest in contents['files'].items()
+            }
+            staged = {appID: {} for appID in bundle['apps']}
+            bad = set()
+
+            for member in members:
+                appID = member.name.split('/', 1)[0]
+                if not member.isfile() or member.name not in expected:
+                    LOG.warning("Skipping unexpected bundle member '%s'", member.name)
+                    continue
+                target = os.path.join(staging, str(len(staged[appID])) + "-" + appID)
+                digest = _extract_member(tar, member, target)
+                if digest != expected[member.name]:
+                    print(f"hash mismatch: {member.name}")
+                    bad.add(appID)
+                staged[appID][member.name] = target
+    except BundleError:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    except (tarfile.TarError, OSError, ValueError) as exc:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise BundleError(f"{path}: {exc}") from exc
+
+    entries = []
+    try:
+        for appID, contents in bundle['apps'].items():
+            missing = set(contents['files']) - set(staged[appID])
+            if missing:
+                print(f"{appID}: {len(missing)} files missing from bundle, skipping")
+                continue
+            if appID in bad:
+                print(f"{appID}: failed verification, skipping")
+                continue
+
+            print(f"importing {appID} ({len(staged[appID])} files)")
+            _install_app(cfg, appID, contents, staged[appID])
+
+            if contents['gamelist']:
+                entries.append(_relocate(contents['gamelist'], HOME_MARKER, str(cfg.home_dir)))
+            else:
+                info = {
+                    source: read_cached_info(cfg.cache_dir, appID, source)
+                    for source in SOURCES
+                }
+                entries.append(game_entry(cfg, appID, info))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    if entries:
+        update_gamelist_xml(*entries)
+    print(f"imported {len(entries)} of {len(bundle['apps'])} games")
+    return len(entries) == len(bundle['apps'])
+
+
+def do_main(command, argv):
+    parser = argparse.ArgumentParser(prog=f"vent-installer {command}")
+    if command == 'export':
+        parser.add_argument("appID", nargs='+')
+        parser.add_argument("-o", "--output", help="Bundle to write; default vent-bundle-<date>.tar.gz")
+    else:
+        parser.add_argument("bundle", help="Bundle to import, or - for stdin")
+    args = parser.parse_args(argv)
+
+    cfg = get_configuration()
+    if command == 'export':
+        output = args.output or datetime.date.today().strftime("vent-bundle-%Y%m%d.tar.gz")
+        export_bundle(cfg, args.appID, output)
+    elif not import_bundle(cfg, args.bundle):
+        raise BundleError("Some games in the bundle could not be imported")
@@ -1,31 +1,73 @@
 #!/usr/bin/env python3
 
 from dataclasses import dataclass
-import datetime
 import logging
-from logging.handlers import SysLogHandler
 import os
 from pathlib import Path
 import shlex
 import subprocess
+import sys
+
+try:
+    from .crash import RETRY, crash_screen
+    from .logs import configure_logging, dump_crash_report
+    from .profiler import profiling
+    from . import runner
+except ImportError:
+    # setup.py imports this module from within the package directory.
+    from crash import RETRY, crash_screen
+    from logs import configure_logging, dump_crash_report
+    from profiler import profiling
+    import runner
 
 
 LOG = logging.getLogger('vent')
 
 
-def ex(*args, check=True, capture_output=False, stdout=None, stderr=None):
+def ex(*args, check=True, capture_output=False, stdout=None, stderr=None,
+       timeout=None, stream=None):
     cmd = " ".join(shlex.quote(arg) for arg in args)
     LOG.debug("exec> %s", cmd)
     try:
-        result = subprocess.run(args, check=check, capture_output=capture_output)
+        result = runner.run(
+            *args,
+            check=check,
+            capture_output=capture_output,
+            stdout=stdout,
+            stderr=stderr,
+            timeout=timeout,
+            stream=stream,
+        )
         return result
     except subprocess.CalledProcessError:
         LOG.exception("subprocess failed")
         raise
+    except subprocess.TimeoutExpired:
+        LOG.error("subprocess timed out after %ss: %s", timeout, cmd)
+        raise
+
+
+async def aex(*args, check=True, capture_output=False, timeout=None):
+    """
+    asyncio variant of ex(), so independent commands can overlap.
+    """
+    try:
+        return await runner.arun(
+            *args,
+            check=check,
+            capture_output=capture_output,
+            timeout=timeout,
+        )
+    except subprocess.CalledProcessError:
+        LOG.exception("subprocess failed")
+        raise
+    except subprocess.TimeoutExpired:
+        LOG.error("subprocess timed out after %ss: %s", timeout, " ".join(shlex.quote(arg) for arg in args))
+        raise
 
 
 def have_binary(name):
-    res = ex("which", name, check=False)
+    res = ex("which", name, check=False, timeout=5)
     return bool(res.returncode == 0)
 
 
@@ -35,7 +77,7 @@ def mklink(source, dest):
 
 def switch_keymap(active_link, default_link, keymap):
     try:
-        ex("systemctl", "is-active", "--quiet", "keyd")
+        ex("systemctl", "is-active", "--quiet", "keyd", timeout=10)
     except subprocess.CalledProcessError:
         LOG.error("keyd is not running! What happened to it?")
         raise
@@ -43,8 +85,8 @@ def switch_keymap(active_link, default_link, keymap):
     mklink(active_link, keymap)
 
     try:
-        ex("keyd", "reload")
-    except subprocess.CalledProcessError:
+        ex("keyd", "reload", timeout=10)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
         LOG.error("keyd reload failed! Is there an error in the keyd configuration file?")
 
         try:
@@ -59,96 +101,49 @@ def switch_keymap(active_link, default_link, keymap):
         raise
 
 
-def configure_logging():
-    address = ''
-    if os.path.exists('/dev/log'):
-        address = '/dev/log'
-    elif os.path.exists('/var/run/syslog'):
-        address = '/var/run/syslog'
+def write_crash_report():
+    try:
+        cfg = get_configuration()
+        name = os.path.basename(sys.argv[0]) or "vent"
+        path = dump_crash_report(cfg.cache_dir.joinpath("crash"), name)
+        if path:
+            print(f"Crash report written to {path}")
+    except Exception:
+        LOG.exception("Failed to write crash report")
 
-    if address:
-        syslog = SysLogHandler(address=address)
-    else:
-        syslog = SysLogHandler()
 
-    syslog.setLevel(logging.DEBUG)
-    syslog.setFormatter(
-        logging.Formatter("%(name)s: %(message)s")
-    )
+def restore_default_keymap():
+    cfg = get_configuration()
+    switch_keymap(cfg.active_keymap, cfg.default_keymap, cfg.default_keymap)
+
+
+def profiles_dir():
+    return get_configuration().cache_dir.joinpath("profiles")
 
-    LOG.setLevel(logging.DEBUG)
-    LOG.addHandler(syslog)
+
+def entry_point_name():
+    return os.path.splitext(os.path.basename(sys.argv[0]))[0] or "vent"
 
 
 def main_wrapper(callback):
     configure_logging()
 
-    try:
-        callback()
-    except Exception as exc:
-        LOG.exception("Unhandled exception in main()")
-        print("""
-⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⣠⣴⠶⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⢠⣾⡿⠃⠀⠀⠀⠀⠀⢀⡀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⣀⣘⣿⡧⠤⠤⠤⠖⠛⠋⠉⠙⢦⣀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⣀⣤⡴⠚⠋⠉⠁⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⢯⠙⠦⣄⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⢀⣠⣤⡤⢤⣴⣞⣹⡿⠶⣶⠀⠀⠀⢰⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⢸⠀⠀⠈⠛⢦⣀⣀⣴⠟⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⢼⠁⢹⠁⣽⠏⠀⣠⣤⡴⠃⠀⠀⠀⣼⡀⠀⠀⠀⣠⠀⣤⣄⠀⠀⢸⠀⠀⠀⠀⠀⠓⢾⡁⠀⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⣀⣠⡴⣶⡶⣿⣇⠟⠀⠉⠀⢰⠏⠀⣤⣀⠀⠀⣸⠻⣷⠀⠀⣰⣿⣴⡯⠊⠀⢀⣿⣰⡄⠀⠶⢼⡄⠀⠙⡄⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⠀⣠⡴⠛⣉⣠⣾⣿⡇⠞⠃⠀⠀⠀⠀⢾⡆⢰⣿⠁⢀⡼⠣⢤⣿⣤⠞⠁⢹⣯⣧⠀⠀⡼⠉⢿⣧⠀⠀⠀⢻⡄⠀⢹⡄⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⢀⣾⣋⣴⣶⣿⣿⣿⣿⡇⠀⠀⠀⠀⠀⠀⠘⣷⣾⣧⡴⠋⢀⡴⠚⠛⠛⢶⡦⣼⣿⣿⣀⡾⠁⠀⠘⣿⣆⠀⠀⠘⡇⠀⠀⢧⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠿⣿⣿⣿⣿⣿⣿⣿⣿⡇⠀⠀⠀⠀⠀⠀⠀⢹⣿⡃⠀⠀⠘⣆⠚⢉⡷⠀⢱⡄⠙⣿⡿⠁⢤⣤⣰⣿⣿⠃⠀⠀⣿⠀⠀⢸⡄⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⠈⠙⠻⣿⣿⣿⣿⣿⡇⠀⠀⠀⠀⠀⠀⠀⣾⣿⡇⠀⠀⠀⠉⠙⢉⣥⠴⠚⠀⠀⠘⢧⠀⢸⢧⣼⣿⣿⡇⠀⠀⣾⠀⠀⢸⣽⣆⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠙⢿⣿⣿⡟⠀⠀⠀⠀⠀⠀⢀⣼⠏⣿⢧⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⢻⣿⠿⢏⣿⡇⠀⣰⣯⣴⠀⢸⠀⠙⠧⠀⠀⠀⠀
-⠀⠀⠀⠐⢤⡀⠀⠀⠀⠀⠀⠀⠘⢛⠟⠀⠀⠀⠀⠀⢀⣰⣿⠅⠀⠙⣿⠳⠤⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⣺⠏⣇⣰⡟⣿⣿⣴⡟⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠉⠢⡀⠀⠀⠀⠀⡰⠋⠀⠀⠀⠀⠀⢀⣾⡿⠁⠀⠀⠀⠸⡆⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⢀⣿⢀⣿⢏⣼⢯⣿⡟⠁⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠈⠳⣄⢀⡞⠁⠀⠀⠀⠀⠀⢀⣾⣿⣷⣠⠀⠀⠀⢸⡿⠀⠀⣖⠓⠒⠲⠤⠤⢄⣀⣀⠀⠀⠀⠀⢸⣿⠈⣿⡿⢡⣞⠋⠀⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⠀⣨⠏⠀⠀⠀⠀⠀⠀⢀⡞⣉⣈⢻⣿⣷⣤⣄⣼⡇⠀⠀⠙⠋⠉⠉⠉⠓⠒⠲⢭⣽⣲⣆⠀⣼⣿⠀⢿⡇⠀⠈⠓⢤⡀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⣰⠃⠀⠀⠀⠀⠀⠀⢀⡾⠋⠉⠉⠉⠛⢿⣿⣿⣿⡟⢶⣄⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⢈⣩⡾⠟⠉⠀⢸⣷⡀⠀⠀⠀⠙⢦⡀⠀⠀⠀⠀⠀
-⣆⡀⠀⠀⠀⠀⠀⣰⠃⠀⠀⠀⠀⠀⠀⢀⣾⠀⣀⡀⠀⠀⠀⠈⠻⣿⣿⡛⠲⢭⣗⠦⣤⣀⠀⣀⣠⣤⣴⣺⣿⣏⡀⡀⠀⢀⣴⣿⣷⡄⠀⡀⠀⠀⠙⢦⡀⠀⠀⠀
-⠀⠙⠳⢄⡀⠀⢠⠇⠀⠀⠀⠀⠀⠀⠀⡼⠉⠉⠲⢯⠑⠆⠀⠀⠀⠙⣿⣷⡀⠀⠈⠉⠻⢿⣿⣝⡻⣿⣿⣷⣄⠙⠿⢷⡶⠟⠙⣇⡙⢮⣀⠘⠲⢄⡀⠀⠙⣆⠀⠀
-⠀⠀⠀⠀⠙⠢⡾⠀⠀⠀⠀⠀⠀⠀⡼⠃⠀⠀⠀⠈⢳⠀⠀⠀⠀⠀⢹⣿⣇⢀⣠⠤⠚⣿⣿⣿⣿⣶⣭⣿⣿⣧⡀⠀⠀⠀⠀⠸⣽⡀⠈⠉⠛⠓⠒⠂⠀⠘⣧⠀
-⠀⠀⠀⠀⠀⠀⡇⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⣿⠇⠀⠀⠀⠀⢸⣿⣿⣿⡅⠀⣼⡏⢻⣏⠻⣷⣍⡙⠛⣿⣿⡆⠀⠀⠀⠀⢻⡇⠀⠀⠀⠀⠀⠀⠀⠈⢸⡆
-⠀⠀⠀⠀⡀⠒⠷⣀⡀⠀⠀⠀⠀⠀⠀⠀⠀⣀⣀⣴⣯⣸⠀⠀⠀⢀⣸⣿⣿⣿⢻⡴⣿⣅⣸⣿⡄⠈⠛⠿⣾⡿⣿⡿⣆⢀⠀⠀⠘⣿⠀⠀⠀⠀⠀⢀⣀⡴⠚⠁
-⠀⠀⠀⠀⠙⠢⣄⡈⠉⠙⢷⡒⠒⠛⠻⣯⣭⣭⡿⢻⠟⠁⠀⠀⠠⣾⣿⣿⣿⣿⣄⡻⣬⣿⣿⣿⣦⣤⣤⣤⣤⣤⣘⣷⡘⣿⠀⠀⣴⡗⠒⠒⠒⠉⠉⠉⠁⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠙⢷⡀⠀⠙⠶⢤⣀⡀⠙⠦⣄⡀⠀⠀⣀⣀⣴⣿⣿⣿⣿⣿⣿⣷⣦⣦⣶⣿⣿⣿⣿⣿⣿⣿⣿⣿⣷⣿⣷⠾⠋⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⠀⠙⢦⣀⠀⠀⠀⠈⠙⠲⠤⣍⣉⠉⠀⠘⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⡿⣿⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⢀⣀⡂⠰⣄⠀⠀⠀⠲⢤⣀⡀⠉⠉⠒⢢⣨⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣧⢹⡇⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠉⠓⠬⠵⠤⠄⣀⣀⣘⣚⣶⠤⠒⠉⠀⠸⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣷⠈⢻⡀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠈⠉⠁⠀⠀⠀⠀⠀⠘⣷⢻⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⠀⠈⣧⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⢹⡏⢻⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⠀⠀⠘⣇⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⠀⢀⠀⠀⠀⠤⠤⠤⠤⠤⠤⠤⠤⢀⣀⡠⢿⣮⢻⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⣿⠀⠀⠀⠘⣆⠀⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⠀⠀⠀⠀⠀⢀⠤⠖⠂⠉⠁⠀⠀⠀⠀⠀⠀⠀⠀⢀⣠⡴⠞⠉⠀⠘⣿⢃⣿⣿⣿⣿⣿⣿⣿⠟⢿⣿⣿⣿⣿⣿⣿⡇⠀⠀⠀⠹⡀⠀⠀⠀⠀⠀⠀⠀⠀
-⠀⠀⠀⢀⣀⠄⠀⠀⢀⣀⣀⣀⣀⠠⠀⢀⣀⣀⣠⢴⠿⠟⠋⠀⠀⠀⠀⠀⠀⢹⡇⢹⣿⣿⣿⣿⣿⣿⣤⣾⣿⣿⣿⣿⣿⣿⣿⡀⠀⠀⠀⣧⠀⠀⠀⠀⠀⠀⠀⠀""")
-
-        print("")
-        print("Oww...!!")
-        print(f"{type(exc).__name__}: {str(exc)}")
-        print("")
-        print(
-            "This event has been logged. If you have admin access, type "
-            "`journalctl --identifier=vent --since=today` to review the logs."
-        )
-        print("")
-        print(
-            "Please report this failure on the Arcade gaming basecamp, "
-            "or send a mail to gaming@lowellmakes.com."
-        )
-        print("Thank you, and sorry for the inconvenience!")
-        print("")
-        print("You may want to press the reset switch inside the control deck.")
-        print("The control panel lifts up, and there's a pink box with a black button on it.")
-        print("Push it to reset the system.")
-        print("")
-
-        now = datetime.datetime.now()
-        later = now + datetime.timedelta(minutes=3)
-        while datetime.datetime.now() < later:
-            remaining = later - datetime.datetime.now()
-            print("\r" + "Return to menu in " + str(remaining)[3:], end='')
-        raise
-    finally:
-        print("")
+    with profiling(entry_point_name(), profiles_dir):
+        while True:
+            try:
+                callback()
+                return
+            except Exception as exc:
+                LOG.exception("Unhandled exception in main()")
+                write_crash_report()
+                action = crash_screen(exc, restore_keymap=restore_default_keymap)
+                if action == RETRY:
+                    LOG.info("Retrying after failure, as requested from the crash screen")
+                    continue
+                raise
+            finally:
+                print("")
+                LOG.debug("Slowest external commands:\n%s", runner.summary())
 
 
 @dataclass
@@ -160,6 +155,8 @@ class Configuration:
     game_dir: Path
     keymap_dir: Path
     cache_dir: Path
+    run_dir: Path
+    history_db: Path
     active_keymap: Path
     default_keymap: Path
     keyd_config: Path
@@ -196,6 +193,8 @@ def get_configuration():
         game_dir=steam_root.joinpath("menu"),
         keymap_dir=keymap_dir,
         cache_dir=steam_root.joinpath("cache"),
+        run_dir=steam_root.joinpath("run"),
+        history_db=steam_root.joinpath("history.db"),
         active_keymap=keymap_dir.joinpath("active.conf"),
         default_keymap=keymap_dir.joinpath("default.conf"),
         keyd_config=Path('/etc/keyd/default.conf'),
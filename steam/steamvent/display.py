@@ -0,0 +1,462 @@
+"""
+Per-game display profiles.
+
+A profile is an optional INI file kept next to the game's keymap, as
+keymaps/<appID>.display::
+
+    [display]
+    # gamescope: run the game nested in gamescope, which renders it at
+    #   'render' and scales it up to 'output'.
+    # xrandr: switch the screen to 'render' for the session.
+    method = gamescope
+    render = 1280x720
+    # gamescope only; defaults to the screen's own resolution.
+    output = 1920x1080
+    # gamescope only: fsr, nis, integer, linear or nearest.
+    upscale = fsr
+    # Frame cap, in frames per second.
+    fps = 60
+    refresh = 60
+
+gamescope (and, for xrandr, the frame cap via DXVK_FRAME_RATE) is
+applied through the game's Steam launch options, which live in
+userdata/<user>/config/localconfig.vdf. The client reads that file
+when it starts and rewrites it when it exits, so launch options are
+written by the installer and by the kiosk before it starts Steam; a
+launch that finds them out of date rewrites them too, but the change
+only takes effect from the next Steam start.
+
+Games without a display profile keep whatever launch options they
+have, except ones that look like a profile's: those are cleared, so
+deleting or emptying a profile takes gamescope back out of the launch.
+A profile owns its game's launch options outright.
+
+xrandr mode switches are made by the launcher before dispatch and put
+back when the session ends. The mode to put back is also written to
+run/display.json, so if the launcher itself is killed, the kiosk's next
+start, or the next launch, restores it.
+"""
+
+import configparser
+from dataclasses import dataclass
+import glob
+import json
+import logging
+import os
+import re
+import shlex
+import subprocess
+
+import vdf
+
+from .common import ex
+
+
+LOG = logging.getLogger('vent')
+
+STEAM_ROOT = "~/.steam/steam"
+PROFILE_SUFFIX = ".display"
+MODE_STATE_NAME = "display.json"
+
+GAMESCOPE = 'gamescope'
+XRANDR = 'xrandr'
+
+# upscale setting to gamescope arguments.
+GAMESCOPE_UPSCALE = {
+    'fsr': ("-F", "fsr"),
+    'nis': ("-F", "nis"),
+    'linear': ("-F", "linear"),
+    'nearest': ("-F", "nearest"),
+    'integer': ("-S", "integer"),
+}
+
+PROFILE_TEMPLATE = """\
+# Display profile for {name}
+# Steam appID: {appID}
+#
+# Uncomment to run the game at a lower resolution or frame rate.
+# See steamvent/display.py for the settings.
+
+[display]
+# method = gamescope
+# render = 1280x720
+# upscale = fsr
+# fps = 60
+"""
+
+
+class ProfileError(Exception):
+    """
+    A display profile is malformed.
+    """
+
+
+def profile_path(cfg, appID):
+    return cfg.keymap_dir.joinpath(f"{appID}{PROFILE_SUFFIX}")
+
+
+def parse_resolution(text):
+    match = re.fullmatch(r'\s*(\d+)\s*x\s*(\d+)\s*', text)
+    if not match:
+        raise ValueError(f"'{text}' isn't a WIDTHxHEIGHT resolution")
+    return int(match.group(1)), int(match.group(2))
+
+
+@dataclass
+class Profile:
+    method: str = GAMESCOPE
+    render: tuple = None
+    output: tuple = None
+    upscale: str = None
+    fps: int = None
+    refresh: int = None
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a profile file.
+
+        :return: The Profile, or None if there is no such file or it
+            sets nothing.
+        :raises ProfileError: if the file can't be parsed.
+        """
+        parser = configparser.ConfigParser()
+        try:
+            if not parser.read(path) or not parser.has_section('display'):
+                return None
+        except configparser.Error as exc:
+            raise ProfileError(f"{path}: {exc}") from exc
+
+        section = parser['display']
+        if not section:
+            return None
+        try:
+            profile = cls(
+                method=section.get('method', GAMESCOPE),
+                render=parse_resolution(section['render']) if 'render' in section else None,
+                output=parse_resolution(section['output']) if 'output' in section else None,
+                upscale=section.get('upscale'),
+                fps=section.getint('fps'),
+                refresh=section.getint('refresh'),
+            )
+        except ValueError as exc:
+            raise ProfileError(f"{path}: {exc}") from exc
+
+        if profile.method not in (GAMESCOPE, XRANDR):
+            raise ProfileError(f"{path}: unknown method '{profile.method}'")
+        if profile.upscale and profile.upscale not in GAMESCOPE_UPSCALE:
+            raise ProfileError(f"{path}: unknown upscale '{profile.upscale}'")
+        return profile
+
+    def gamescope_args(self):
+        args = ["gamescope"]
+        if self.render:
+            args += ["-w", str(self.render[0]), "-h", str(self.render[1])]
+        if self.output:
+            args += ["-W", str(self.output[0]), "-H", str(self.output[1])]
+        if self.refresh:
+            args += ["-r", str(self.refresh)]
+        if self.fps:
+            args += ["--framerate-limit", str(self.fps)]
+        if self.upscale:
+            args += GAMESCOPE_UPSCALE[self.upscale]
+        args += ["-f", "--"]
+        return args
+
+    def launch_options(self):
+        """
+        Steam launch options for the profile; '' if it needs none.
+        """
+        if self.method == GAMESCOPE:
+            return shlex.join(self.gamescope_args()) + " %command%"
+        if self.fps:
+            # xrandr can't cap the frame rate; DXVK can, for Proton games.
+            return f"DXVK_FRAME_RATE={self.fps} %command%"
+        return ""
+
+
+def write_profile_template(path, appID, info):
+    """
+    Write a commented-out profile for the player to fill in, unless the
+    game already has one.
+    """
+    if os.path.exists(path):
+        return
+    print(f"writing display profile template to {path}")
+    with open(path, "w") as outfile:
+        outfile.write(PROFILE_TEMPLATE.format(name=info['vdf']['common']['name'], appID=appID))
+
+
+def write_profile(path, appID, info, profile):
+    print(f"writing display profile to {path}")
+    parser = configparser.ConfigParser()
+    parser['display'] = {'method': profile.method}
+    for key in ('render', 'output'):
+        value = getattr(profile, key)
+        if value:
+            parser['display'][key] = f"{value[0]}x{value[1]}"
+    for key in ('upscale', 'fps', 'refresh'):
+        value = getattr(profile, key)
+        if value:
+            parser['display'][key] = str(value)
+    with open(path, "w") as outfile:
+        outfile.write(f"# Display profile for {info['vdf']['common']['name']}\n")
+        outfile.write(f"# Steam appID: {appID}\n\n")
+        parser.write(outfile)
+
+
+# Steam launch options
+
+# Launch options Profile.launch_options() generates.
+_GENERATED_OPTIONS = re.compile(r'(gamescope .* -f -- |DXVK_FRAME_RATE=\d+ )%command%')
+
+
+def localconfig_paths(steam_root=None):
+    root = os.path.expanduser(steam_root or STEAM_ROOT)
+    return sorted(glob.glob(os.path.join(root, "userdata", "*", "config", "localconfig.vdf")))
+
+
+def _child(node, key):
+    # Steam isn't consistent about key case ("apps" vs "Apps").
+    for existing in node:
+        if existing.lower() == key.lower():
+            return node[existing]
+    node[key] = {}
+    return node[key]
+
+
+def _apps_config(data):
+    node = data
+    for key in ('UserLocalConfigStore', 'Software', 'Valve', 'Steam', 'apps'):
+        node = _child(node, key)
+    return node
+
+
+def _app_config(data, appID):
+    return _child(_apps_config(data), str(appID))
+
+
+def _load_localconfig(path):
+    try:
+        with open(path, encoding='UTF-8') as infile:
+            return vdf.load(infile)
+    except (OSError, SyntaxError, ValueError) as exc:
+        LOG.warning("Can't read '%s': %s", path, exc)
+        return None
+
+
+def _save_localconfig(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding='UTF-8') as outfile:
+        vdf.dump(data, outfile, pretty=True)
+    os.replace(tmp, path)
+
+
+def set_launch_options(appID, options, steam_root=None):
+    """
+    Set a game's launch options for every Steam user on the cabinet.
+
+    :return: True if any localconfig.vdf was changed.
+    """
+    changed = False
+    for path in localconfig_paths(steam_root):
+        data = _load_localconfig(path)
+        if data is None:
+            continue
+
+        app = _app_config(data, appID)
+        if app.get('LaunchOptions', '') == options:
+            continue
+        app['LaunchOptions'] = options
+        _save_localconfig(path, data)
+        LOG.info("Set launch options for appID=%s in '%s': %s", appID, path, options)
+        changed = True
+    return changed
+
+
+def clear_generated_launch_options(keep=(), steam_root=None):
+    """
+    Clear the launch options a display profile generated from every
+    game that no longer has one.
+
+    :param keep: appIDs whose launch options are left alone.
+    :return: True if any localconfig.vdf was changed.
+    """
+    keep = {str(appID) for appID in keep}
+    changed = False
+    for path in localconfig_paths(steam_root):
+        data = _load_localconfig(path)
+        if data is None:
+            continue
+
+        apps = _apps_config(data)
+        cleared = [
+            appID for appID, app in apps.items()
+            if appID not in keep and isinstance(app, dict)
+            and _GENERATED_OPTIONS.fullmatch(app.get('LaunchOptions', ''))
+        ]
+        if not cleared:
+            continue
+        for appID in cleared:
+            apps[appID]['LaunchOptions'] = ""
+        _save_localconfig(path, data)
+        LOG.info("Cleared display launch options for appIDs %s in '%s'", ", ".join(cleared), path)
+        changed = True
+    return changed
+
+
+def sync_launch_options(cfg, steam_root=None):
+    """
+    Bring every profiled game's launch options up to date, and clear
+    them from games whose profile is gone or empty.
+
+    Run before Steam starts; see the module docstring.
+    """
+    profiled = set()
+    for path in sorted(cfg.keymap_dir.glob(f"*{PROFILE_SUFFIX}")):
+        appID = path.name[:-len(PROFILE_SUFFIX)]
+        try:
+            profile = Profile.load(path)
+        except ProfileError:
+            # Leave the game as it is until the profile is fixed.
+            LOG.exception("Ignoring display profile for appID=%s", appID)
+            profiled.add(appID)
+            continue
+        if profile:
+            set_launch_options(appID, profile.launch_options(), steam_root)
+            profiled.add(appID)
+    clear_generated_launch_options(profiled, steam_root)
+
+
+# xrandr
+
+_OUTPUT_LINE = re.compile(r'^(\S+) connected')
+_MODE_LINE = re.compile(r'^\s+(\d+x\d+)\S*\s+(.*)$')
+
+
+def current_mode():
+    """
+    The first connected output and its current mode.
+
+    :return: (output, "WxH", rate as a string) or None.
+    """
+    res = ex("xrandr", "--query", check=False, capture_output=True, timeout=10)
+    if res.returncode:
+        return None
+    output = None
+    for line in res.stdout.decode().splitlines():
+        match = _OUTPUT_LINE.match(line)
+        if match:
+            output = output or match.group(1)
+            continue
+        match = _MODE_LINE.match(line)
+        if output and match:
+            for rate in match.group(2).split():
+                if '*' in rate:
+                    return output, match.group(1), rate.strip('*+')
+    return None
+
+
+def set_mode(output, mode, rate=None):
+    args = ["xrandr", "--output", output, "--mode", mode]
+    if rate:
+        args += ["--rate", str(rate)]
+    ex(*args, timeout=10)
+
+
+def recover_mode(state_path):
+    """
+    Put back a screen mode left switched by a launcher that didn't clean up.
+    """
+    try:
+        with open(state_path) as infile:
+            output, mode, rate = json.load(infile)['mode']
+    except FileNotFoundError:
+        return
+    except (ValueError, KeyError, TypeError):
+        LOG.warning("Discarding unreadable display state '%s'", state_path)
+        os.unlink(state_path)
+        return
+
+    LOG.warning("Restoring screen mode %s on %s left by an earlier session", mode, output)
+    try:
+        set_mode(output, mode, rate)
+    except (OSError, subprocess.SubprocessError):
+        LOG.exception("Failed to restore display mode")
+        return
+    os.unlink(state_path)
+
+
+class DisplaySession:
+    """
+    Apply a display Profile to one launch and undo it afterwards.
+
+    :param appID: The game.
+    :param profile: Its Profile.
+    :param state_path: Where to record the mode to put back.
+    """
+    def __init__(self, appID, profile, state_path):
+        self.appID = str(appID)
+        self.profile = profile
+        self.state_path = str(state_path)
+        self.saved_mode = None
+
+    def _save_state(self):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as outfile:
+            json.dump({'mode': self.saved_mode}, outfile)
+        os.replace(tmp, self.state_path)
+
+    def apply(self):
+        """
+        Check the launch options and, for xrandr, switch modes. Call
+        before dispatching the game.
+        """
+        try:
+            if set_launch_options(self.appID, self.profile.launch_options()):
+                LOG.warning(
+                    "Launch options for appID=%s were out of date; "
+                    "they take effect from the next Steam start", self.appID,
+                )
+        except OSError:
+            LOG.exception("Failed to update launch options")
+
+        if self.profile.method != XRANDR or not (self.profile.render or self.profile.refresh):
+            return
+        try:
+            self.saved_mode = current_mode()
+            if self.saved_mode is None:
+                LOG.warning("No connected output found; not switching modes")
+                return
+            self._save_state()
+            output, mode, _ = self.saved_mode
+            render = self.profile.render
+            set_mode(output, f"{render[0]}x{render[1]}" if render else mode, self.profile.refresh)
+        except (OSError, subprocess.SubprocessError):
+            LOG.exception("Failed to switch display mode")
+
+    def restore(self):
+        if self.saved_mode:
+            output, mode, rate = self.saved_mode
+            set_mode(output, mode, rate)
+            self.saved_mode = None
+        try:
+            os.unlink(self.state_path)
+        except FileNotFoundError:
+            pass
+
+
+def display_session(cfg, appID):
+    """
+    The DisplaySession for launching appID, or None if it has no profile.
+
+    Also puts back any screen mode an earlier launcher left switched.
+    """
+    state_path = cfg.run_dir.joinpath(MODE_STATE_NAME)
+    recover_mode(state_path)
+    try:
+        profile = Profile.load(profile_path(cfg, appID))
+    except ProfileError:
+        LOG.exception("Ignoring display profile for appID=%s", appID)
+        return None
+    return DisplaySession(appID, profile, state_path) if profile else None
@@ -0,0 +1,323 @@
+"""
+Launch session history.
+
+Every 'vent' launch is recorded in a small SQLite database: when it
+started and ended, how long the game was played, how long the game's
+process and then its window took to appear after dispatch, and why the
+session ended. The aggregates are
+folded back into gamelist.xml as <playcount> and <lastplayed> in one
+write, at kiosk start, so EmulationStation can sort by them; they also
+drive the usage report and cache eviction order.
+"""
+
+import argparse
+from contextlib import contextmanager
+import datetime
+import logging
+import os
+import sqlite3
+import time
+
+from .common import get_configuration
+from .install import read_gamelist_entries, update_gamelist_xml
+
+
+LOG = logging.getLogger('vent')
+
+# Why a session ended.
+EXITED = 'exited'            # The game closed by itself.
+EXIT_BUTTON = 'exit_button'  # The cabinet's exit button stopped it.
+DETECT_TIMEOUT = 'detect_timeout'
+ERROR = 'error'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    appid TEXT NOT NULL,
+    started REAL NOT NULL,
+    ended REAL,
+    duration REAL,
+    detect_latency REAL,
+    exit_cause TEXT,
+    window_latency REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_appid ON sessions (appid, started);
+
+-- Resource samples taken during a session; see sampler.py.
+CREATE TABLE IF NOT EXISTS samples (
+    session INTEGER PRIMARY KEY REFERENCES sessions (id),
+    interval REAL NOT NULL,
+    data BLOB NOT NULL
+);
+"""
+
+# Sessions to keep resource samples for; older ones are dropped.
+MAX_SAMPLED_SESSIONS = 500
+
+# Columns added since the table was first created.
+ADDED_COLUMNS = {
+    'window_latency': "REAL",
+}
+
+# EmulationStation's gamelist.xml timestamp format.
+ES_TIME_FORMAT = "%Y%m%dT%H%M%S"
+
+
+class SessionRecord:
+    """
+    One in-progress session; see History.session().
+    """
+    def __init__(self, appID):
+        self.appID = str(appID)
+        self.started = time.time()
+        self.detected = None
+        self.detect_latency = None
+        self.window_latency = None
+        self.exit_cause = None
+        # (interval, packed samples) from a sampler.Sampler, if any.
+        self.samples = None
+
+    def game_detected(self, latency):
+        self.detected = time.time()
+        self.detect_latency = latency
+
+    def window_shown(self, latency):
+        self.window_latency = latency
+
+
+class History:
+    """
+    :param path: SQLite database file.
+    """
+    def __init__(self, path):
+        self.path = str(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.db = sqlite3.connect(self.path, timeout=10)
+        self.db.executescript(SCHEMA)
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(sessions)")}
+        with self.db:
+            for column, kind in ADDED_COLUMNS.items():
+                if column not in columns:
+                    self.db.execute(f"ALTER TABLE sessions ADD COLUMN {column} {kind}")
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @contextmanager
+    def session(self, appID):
+        """
+        Record a launch session around the with block.
+
+        The exit cause defaults to ERROR if the block raises, and to
+        EXITED otherwise. Failing to write history never fails the
+        launch itself.
+        """
+        record = SessionRecord(appID)
+        row = None
+        try:
+            with self.db:
+                row = self.db.execute(
+                    "INSERT INTO sessions (appid, started) VALUES (?, ?)",
+                    (record.appID, record.started),
+                ).lastrowid
+        except sqlite3.Error:
+            LOG.exception("Failed to record session start")
+
+        try:
+            yield record
+        except BaseException:
+            record.exit_cause = record.exit_cause or ERROR
+            raise
+        finally:
+            ended = time.time()
+            duration = ended - record.detected if record.detected else None
+            try:
+                if row is not None:
+                    with self.db:
+                        self.db.execute(
+                            "UPDATE sessions SET ended = ?, duration = ?, "
+                            "detect_latency = ?, window_latency = ?, exit_cause = ? "
+                            "WHERE id = ?",
+                            (ended, duration, record.detect_latency, record.window_latency,
+                             record.exit_cause or EXITED, row),
+                        )
+                        if record.samples:
+                            self._save_samples(row, *record.samples)
+            except sqlite3.Error:
+                LOG.exception("Failed to record session end")
+
+    def _save_samples(self, row, interval, data):
+        self.db.execute(
+            "INSERT OR REPLACE INTO samples (session, interval, data) VALUES (?, ?, ?)",
+            (row, interval, data),
+        )
+        self.db.execute(
+            "DELETE FROM samples WHERE session NOT IN "
+            "(SELECT session FROM samples ORDER BY session DESC LIMIT ?)",
+            (MAX_SAMPLED_SESSIONS,),
+        )
+
+    def samples(self, since=None):
+        """
+        Sessions that have resource samples, oldest first.
+
+        :param since: Only sessions started after this Unix time.
+        :return: list of dicts.
+        """
+        rows = self.db.execute(
+            "SELECT s.id, s.appid, s.started, s.exit_cause, m.interval, m.data "
+            "FROM sessions s JOIN samples m ON m.session = s.id "
+            "WHERE s.started >= ? ORDER BY s.started",
+            (since or 0,),
+        )
+        keys = ('id', 'appID', 'started', 'exit_cause', 'interval', 'data')
+        return [dict(zip(keys, row)) for row in rows]
+
+    def aggregates(self):
+        """
+        Per-game totals over every session that reached the game.
+
+        :return: dict of appID to (playcount, lastplayed, total seconds).
+        """
+        rows = self.db.execute(
+            "SELECT appid, COUNT(*), MAX(started), TOTAL(duration) FROM sessions "
+            "WHERE duration IS NOT NULL GROUP BY appid"
+        )
+        return {appid: (count, last, total) for appid, count, last, total in rows}
+
+    def report(self, since=None):
+        """
+        Usage per game, most played first.
+
+        :param since: Only count sessions started after this Unix time.
+        :return: list of dicts.
+        """
+        rows = self.db.execute(
+            "SELECT appid, "
+            "SUM(duration IS NOT NULL), TOTAL(duration), MAX(started), "
+            "AVG(detect_latency), AVG(window_latency), SUM(exit_cause IN (?, ?)) "
+            "FROM sessions WHERE started >= ? GROUP BY appid "
+            "ORDER BY TOTAL(duration) DESC",
+            (ERROR, DETECT_TIMEOUT, since or 0),
+        )
+        keys = (
+            'appID', 'plays', 'played', 'lastplayed',
+            'detect_latency', 'window_latency', 'failures',
+        )
+        return [dict(zip(keys, row)) for row in rows]
+
+    def eviction_order(self, app_ids):
+        """
+        Order cached games from the first to evict to the last.
+
+        Games never played come first, then by least recently played.
+        """
+        last = {appid: entry[1] for appid, entry in self.aggregates().items()}
+        return sorted((str(a) for a in app_ids), key=lambda a: (last.get(a, 0), a))
+
+
+def _gamelist_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def fold_into_gamelist(cfg):
+    """
+    Write every game's playcount and lastplayed into gamelist.xml.
+
+    EmulationStation keeps counts of its own, from before there was any
+    history and for launches it makes itself, so neither value is ever
+    moved backwards: playcount becomes the larger of the two counts and
+    lastplayed the later of the two times.
+
+    Run while EmulationStation is stopped; it rewrites the gamelist
+    from memory when it exits.
+    """
+    entries = read_gamelist_entries()
+    with History(cfg.history_db) as history:
+        aggregates = history.aggregates()
+
+    updates = []
+    for appID, (count, last, _) in aggregates.items():
+        entry = entries.get(appID)
+        if not entry or not entry.get('path'):
+            continue
+        playcount = str(max(count, _gamelist_int(entry.get('playcount'))))
+        # The format sorts in time order, so later is greater.
+        lastplayed = max(
+            datetime.datetime.fromtimestamp(last).strftime(ES_TIME_FORMAT),
+            entry.get('lastplayed') or '',
+        )
+        if entry.get('playcount') == playcount and entry.get('lastplayed') == lastplayed:
+            continue
+        updates.append({
+            'path': entry['path'],
+            'playcount': playcount,
+            'lastplayed': lastplayed,
+        })
+
+    if updates:
+        update_gamelist_xml(*updates)
+    return len(updates)
+
+
+def _format_duration(seconds):
+    minutes, seconds = divmod(int(seconds or 0), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}"
+
+
+def print_report(cfg, days=None):
+    since = time.time() - days * 86400 if days else None
+    entries = read_gamelist_entries()
+    with History(cfg.history_db) as history:
+        rows = history.report(since)
+
+    print(
+        f"{'game':40s} {'plays':>5s} {'played':>9s} {'last played':>16s} "
+        f"{'detect':>7s} {'window':>7s} {'fail':>4s}"
+    )
+    for row in rows:
+        name = entries.get(row['appID'], {}).get('name', row['appID'])
+        last = datetime.datetime.fromtimestamp(row['lastplayed']).strftime("%Y-%m-%d %H:%M")
+        detect, window = (
+            f"{row[key]:6.1f}s" if row[key] is not None else "      -"
+            for key in ('detect_latency', 'window_latency')
+        )
+        print(
+            f"{name[:40]:40s} {row['plays']:5d} {_format_duration(row['played']):>9s} "
+            f"{last:>16s} {detect:>7s} {window:>7s} {row['failures']:4d}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Launch history for the steam library")
+    commands = parser.add_subparsers(dest="command", required=True)
+    report = commands.add_parser("report", help="Show usage per game")
+    report.add_argument("--days", type=int, help="Only count the last N days")
+    commands.add_parser("fold", help="Write playcount/lastplayed into gamelist.xml")
+    commands.add_parser("eviction", help="List cached games, first to evict first")
+    args = parser.parse_args()
+
+    cfg = get_configuration()
+    if args.command == 'report':
+        print_report(cfg, args.days)
+    elif args.command == 'fold':
+        print(f"Updated {fold_into_gamelist(cfg)} gamelist entries")
+    elif args.command == 'eviction':
+        cached = [p.name for p in cfg.cache_dir.iterdir() if p.name.isdigit()]
+        with History(cfg.history_db) as history:
+            for appID in history.eviction_order(cached):
+                print(appID)
+
+
+if __name__ == '__main__':
+    main()
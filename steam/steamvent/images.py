@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+
+from .assets import Manifest
+from .valve import guess_thumbnail
+
+
+LOG = logging.getLogger('vent')
+
+_HAVE_PIL = False
+try:
+    from PIL import Image
+    _HAVE_PIL = True
+except ModuleNotFoundError:
+    pass
+
+
+# Native resolution of the cabinet's display panel.
+PANEL_SIZE = (1920, 1080)
+
+# Size of the image box in the EmulationStation theme's game views.
+GAMELIST_SIZE = (960, 540)
+
+SPLASH_NAME = "splash.jpg"
+GAMELIST_NAME = "gamelist.jpg"
+
+# Records which source file (and which version of it) each derivative
+# was generated from.
+DERIVATIVES_NAME = "derivatives.json"
+
+# Smallest width worth stretching across the panel as a splash.
+SPLASH_MIN_WIDTH = 1280
+
+
+def splash_source(cache_dir, appID):
+    """
+    Pick the original, full-resolution image to use as a launch splash.
+    """
+    img = os.path.join(cache_dir, str(appID), "raw_page_background.jpg")
+    if os.path.exists(img):
+        return img
+
+    manifest = Manifest(cache_dir, appID)
+    img = manifest.best_image(min_width=SPLASH_MIN_WIDTH, landscape=True)
+    if img:
+        return img
+    return guess_thumbnail(cache_dir, str(appID))
+
+
+def _signature(path):
+    st = os.stat(path)
+    return {
+        'source': os.path.basename(path),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+    }
+
+
+def _load_signatures(local_dir):
+    try:
+        with open(os.path.join(local_dir, DERIVATIVES_NAME), "r") as infile:
+            return json.load(infile)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_signatures(local_dir, signatures):
+    with open(os.path.join(local_dir, DERIVATIVES_NAME), "w") as outfile:
+        json.dump(signatures, outfile, indent=2)
+
+
+def resize_image(source, target, size, quality=85):
+    """
+    Scale an image down to fit within size, saving it as a compact JPEG.
+    """
+    with Image.open(source) as img:
+        img = img.convert("RGB")
+        img.thumbnail(size, Image.Resampling.LANCZOS)
+        tmp = target + ".tmp"
+        img.save(tmp, "JPEG", quality=quality, optimize=True)
+    os.replace(tmp, target)
+
+
+def make_derivative(cache_dir, appID, source, name, size):
+    """
+    Generate a pre-scaled copy of source in the app's cache directory.
+
+    The derivative is only regenerated when the source image changes.
+
+    :return: Path to the derivative, or None if it could not be made.
+    """
+    if not source:
+        return None
+    if not _HAVE_PIL:
+        LOG.warning("python3-pil is not installed; not scaling '%s'", source)
+        return None
+
+    local_dir = os.path.join(cache_dir, str(appID))
+    target = os.path.join(local_dir, name)
+    signatures = _load_signatures(local_dir)
+    signature = _signature(source)
+
+    if os.path.exists(target) and signatures.get(name) == signature:
+        return target
+
+    print(f"scaling {os.path.basename(source)} to {size[0]}x{size[1]} for {name}")
+    try:
+        resize_image(source, target, size)
+    except OSError:
+        LOG.exception("Failed to scale image '%s'", source)
+        return None
+
+    signatures[name] = signature
+    _save_signatures(local_dir, signatures)
+    return target
+
+
+def make_derivatives(cache_dir, appID):
+    """
+    Generate the splash and gamelist images for an app.
+
+    :return: (splash, gamelist) paths; either may be None.
+    """
+    splash = make_derivative(
+        cache_dir, appID, splash_source(cache_dir, appID),
+        SPLASH_NAME, PANEL_SIZE,
+    )
+    gamelist = make_derivative(
+        cache_dir, appID, guess_thumbnail(cache_dir, str(appID)),
+        GAMELIST_NAME, GAMELIST_SIZE,
+    )
+    return splash, gamelist
+
+
+def find_splash(cache_dir, appID):
+    """
+    Find the best splash image for launch, preferring the pre-scaled one.
+    """
+    img = os.path.join(cache_dir, str(appID), SPLASH_NAME)
+    if os.path.exists(img):
+        return img
+    return splash_source(cache_dir, appID)
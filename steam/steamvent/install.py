@@ -8,44 +8,75 @@ import os
 from pathlib import Path
 import stat
 import subprocess
+import sys
 from xml.etree import ElementTree
 
-import requests
-
 from .common import get_configuration, main_wrapper
-from . import keycfg
+from . import display, keycfg
+from .assets import Manifest
+from .images import make_derivatives
+from .logs import phase
+from .peer import cache_peer
+from .transcode import Transcoder, transcoded_trailer
+from .webclient import NotFound, SteamHTTPError, client
 from .valve import (
     get_executable,
     load_or_fetch_info,
     guess_thumbnail,
+    steam_url,
 )
 
 
 LOG = logging.getLogger('vent')
 
 
-def cache_asset(cachedir, appID, url, local_name):
-    local_dir = os.path.join(cachedir, appID + '/')
-    os.makedirs(local_dir, exist_ok=True)
+def cache_asset(manifest, url, local_name, asset=None, lang=None, progress=None):
+    """
+    Fetch one asset into the app's cache, unless it's already there.
 
-    local_path = os.path.join(local_dir, local_name)
-    if not os.path.exists(local_path):
-        try:
-            rsp = requests.get(url)
-            print(f"{rsp.status_code}: {url}")
-            if rsp.status_code == 200:
-                with open(local_path, "wb") as outfile:
-                    outfile.write(rsp.content)
-        except requests.ConnectionError:
-            LOG.warning("ConnectionError fetching '%s'", url)
+    :param progress: Passed on to SteamClient.get, for the download.
+    """
+    local_path = manifest.local_path(local_name)
+    if local_name in manifest and os.path.exists(local_path):
+        return
 
+    if os.path.exists(local_path):
+        # Fetched before we kept a manifest; adopt it into the store.
+        with open(local_path, "rb") as infile:
+            manifest.add(local_name, infile.read(), url, asset, lang)
+        return
 
-def get_images(appID, info, cachedir):
+    peer = cache_peer()
+    if peer:
+        data, _ = peer.fetch(manifest.appID, local_name)
+        if data is not None:
+            print(f"peer: {url}")
+            manifest.add(local_name, data, url, asset, lang)
+            return
+
+    try:
+        rsp = client().get(url, progress=progress)
+    except SteamHTTPError as exc:
+        print(f"{exc.status or 'ERR'}: {url}")
+        if not isinstance(exc, NotFound):
+            LOG.warning("Failed to fetch '%s': %s", url, exc)
+        return
+
+    print(f"{rsp.status_code}: {url}")
+    manifest.add(local_name, rsp.content, url, asset, lang)
+
+
+def asset_queue(appID, info):
+    """
+    Work out every asset to fetch for an app.
+
+    :return: dict of local file name to (url, asset name, language).
+    """
     # https://partner.steamgames.com/doc/store/assets
     # https://myopic.design/tools/steam-asset-scraper/?appid=1420810
 
-    store_url_base = f'https://shared.fastly.steamstatic.com/store_item_assets/steam/apps/{appID}/'
-    community_url = f"https://cdn.fastly.steamstatic.com/steamcommunity/public/images/apps/{appID}/"
+    store_url_base = steam_url('assets', f"store_item_assets/steam/apps/{appID}/")
+    community_url = steam_url('community', f"steamcommunity/public/images/apps/{appID}/")
 
     queue = {}
 
@@ -53,15 +84,17 @@ def get_images(appID, info, cachedir):
         ext = Path(url).suffix[1:]
         key = f"{basename}.{ext}"
 
-        if url in queue.values():
+        if url in (entry[0] for entry in queue.values()):
             pass
             #print(f"skipping {url}, already in queue")
         elif key in queue:
-            queue[f"{basename}-{lang}.{ext}"] = url
+            queue[f"{basename}-{lang}.{ext}"] = (url, basename, lang)
         else:
-            queue[key] = url
+            queue[key] = (url, basename, lang)
 
-    assets = info['web']['assets']
+    web = info.get('web') or {}
+
+    assets = web.get('assets', {})
     for key, value in assets.items():
         if key == 'asset_url_format':
             continue
@@ -113,22 +146,30 @@ def get_images(appID, info, cachedir):
     _enqueue(store_url_base + "page_bg_raw.jpg", None, "page_bg_raw")
 
     def _find_trailer():
-        for trailer in info['web']['trailers'].get('highlights', []):
-            if 'trailer_max' in trailer:
-                for fmt in trailer['trailer_max']:
+        # Prefer the 480p variant where it's listed; the cabinet
+        # decodes these constantly for the screensaver and video view.
+        for variant in ('trailer_480p', 'trailer_max'):
+            for trailer in web.get('trailers', {}).get('highlights', []):
+                for fmt in trailer.get(variant, []):
                     if fmt['type'] == 'video/mp4':
-                        return (
-                            'https://video.akamai.steamstatic.com/'
-                            'store_trailers/' + fmt['filename']
-                        )
+                        return steam_url('video', 'store_trailers/' + fmt['filename'])
         return None
 
     trailer = _find_trailer()
     if trailer:
         _enqueue(trailer, None, 'trailer')
 
-    for local_name, url in queue.items():
-        cache_asset(cachedir, appID, url, local_name)
+    return queue
+
+
+def get_images(appID, info, cachedir):
+    queue = asset_queue(appID, info)
+    manifest = Manifest(cachedir, appID)
+    try:
+        for local_name, (url, asset, lang) in queue.items():
+            cache_asset(manifest, url, local_name, asset, lang)
+    finally:
+        manifest.save()
 
 
 def write_keymap(path, appID, info):
@@ -162,13 +203,18 @@ def generate_gamelist_entry(info, appID, libimg, script_path, cachedir):
 
     metadata = {}
 
+    web = info.get('web') or {}
+    store = info.get('store') or {}
+
     metadata['name'] = info['vdf']['common']['name']
     metadata['steam_appID'] = appID
-    metadata['desc'] = info['web']['basic_info']['short_description']
+    metadata['desc'] = web.get('basic_info', {}).get('short_description', '')
     metadata['image'] = libimg
     # metadata['thumbnail'] = '...'
 
-    video_path = os.path.join(local_dir, 'trailer.mp4')
+    video_path = transcoded_trailer(local_dir)
+    if not video_path:
+        video_path = os.path.join(local_dir, 'trailer.mp4')
     if os.path.exists(video_path):
         print(f"using trailer '{video_path}'")
         metadata['video'] = video_path
@@ -188,10 +234,10 @@ def generate_gamelist_entry(info, appID, libimg, script_path, cachedir):
     metadata['developer'] = info['vdf'].get('extended', {}).get('developer', '')
     metadata['publisher'] = info['vdf'].get('extended', {}).get('publisher', '')
 
-    if 'genres' in info['store']:
-        metadata['genre'] = info['store']['genres'][0]['description']
+    if 'genres' in store:
+        metadata['genre'] = store['genres'][0]['description']
 
-    for cat in info['store'].get('categories', []):
+    for cat in store.get('categories', []):
         if cat['description'] == 'Single-player':
             metadata['players'] = "1"
             break
@@ -201,10 +247,31 @@ def generate_gamelist_entry(info, appID, libimg, script_path, cachedir):
     return metadata
 
 
-def update_gamelist_xml(game_entry):
-    gamelist_path = os.path.expanduser(
+def gamelist_xml_path():
+    return os.path.expanduser(
         "~/.emulationstation/gamelists/steam/gamelist.xml"
     )
+
+
+def read_gamelist_entries():
+    """
+    Existing steam gamelist.xml entries, keyed by appID.
+    """
+    try:
+        root = ElementTree.parse(gamelist_xml_path()).getroot()
+    except FileNotFoundError:
+        return {}
+
+    entries = {}
+    for elem in root.iter(tag='game'):
+        fields = {child.tag: child.text or '' for child in elem}
+        if fields.get('steam_appID'):
+            entries[fields['steam_appID']] = fields
+    return entries
+
+
+def update_gamelist_xml(*game_entries):
+    gamelist_path = gamelist_xml_path()
     os.makedirs(Path(gamelist_path).parent, exist_ok=True)
 
     try:
@@ -214,37 +281,74 @@ def update_gamelist_xml(game_entry):
         root = ElementTree.Element("gameList")
         tree = ElementTree.ElementTree(root)
 
-    game = None
-    new_element = True
-
+    games = {}
     for elem in root.iter(tag='game'):
         path = elem.find('path')
-        if path is not None and path.text == game_entry['path']:
+        if path is not None:
+            games[path.text] = elem
+
+    for game_entry in game_entries:
+        game = games.get(game_entry['path'])
+        if game is None:
+            print(f"Adding gamelist.xml entry to '{gamelist_path}'")
+            game = ElementTree.Element("game")
+            root.append(game)
+            games[game_entry['path']] = game
+        else:
             print(f"Updating gamelist.xml entry in '{gamelist_path}'")
-            game = elem
-            new_element = False
-            break
 
-    if game is None:
-        print(f"Adding gamelist.xml entry to '{gamelist_path}'")
-        game = ElementTree.Element("game")
         for key, value in game_entry.items():
-            node = ElementTree.Element(key)
+            node = game.find(key)
+            if node is None:
+                node = ElementTree.SubElement(game, key)
             node.text = value
-            game.append(node)
-        root.append(game)
 
     ElementTree.indent(tree)
     #print(ElementTree.tostring(root, encoding='UTF-8').decode())
     tree.write(gamelist_path, encoding='UTF-8')
 
 
-def install_game(cfg, appID):
+def game_entry(cfg, appID, info):
+    _, libimg = make_derivatives(cfg.cache_dir, appID)
+    if not libimg:
+        libimg = guess_thumbnail(cfg.cache_dir, str(appID))
+    print(f"using thumbnail {libimg}")
+
+    name = info['vdf']['common']['name']
+    script_path = cfg.game_dir.joinpath(f"{name}.sh")
+    return generate_gamelist_entry(info, appID, libimg, script_path, cfg.cache_dir)
+
+
+def register_game(cfg, appID, info):
+    update_gamelist_xml(game_entry(cfg, appID, info))
+
+
+def resume_transcodes(cfg):
+    transcoder = Transcoder(cfg.cache_dir)
+    try:
+        transcoder.resume()
+        for appID, target in transcoder.wait().items():
+            if target:
+                info = load_or_fetch_info(appID, cfg.cache_dir)
+                register_game(cfg, appID, info)
+    finally:
+        transcoder.close()
+
+
+def install_game(cfg, appID, display_profile=None):
+    """
+    :param display_profile: A display.Profile to write for the game;
+        otherwise a template is written for the player to fill in.
+    """
     os.makedirs(cfg.cache_dir, exist_ok=True)
 
     print("")
     print("Fetching metadata ...")
-    info = load_or_fetch_info(appID, cfg.cache_dir)
+    with phase('metadata', appID=appID):
+        info = load_or_fetch_info(appID, cfg.cache_dir)
+    for source, exc in info.errors.items():
+        print(f"Warning: no {source} metadata ({exc}); continuing without it.")
+        print("         Re-run the install later to fill it in.")
     print("")
 
     # Just to ensure that we can actually identify the binary when it
@@ -258,26 +362,51 @@ def install_game(cfg, appID):
     print("")
 
     print("Fetching assets ...")
-    get_images(appID, info, cfg.cache_dir)
+    with phase('assets', appID=appID):
+        get_images(appID, info, cfg.cache_dir)
     print("")
 
-    subprocess.run([
-        "steamcmd",
-        "+login", "LowellMakes",
-        "+app_update", str(appID),
-        "+exit",
-    ], check=True)
+    # Transcode the trailer in the background while the game downloads.
+    transcoder = None
+    local_dir = os.path.join(cfg.cache_dir, str(appID))
+    trailer = os.path.join(local_dir, "trailer.mp4")
+    if (os.path.exists(trailer)
+            and not transcoded_trailer(local_dir)
+            and Transcoder.available()):
+        transcoder = Transcoder(cfg.cache_dir)
+        transcoder.submit(appID, trailer)
 
-    libimg = guess_thumbnail(cfg.cache_dir, str(appID))
-    print(f"using thumbnail {libimg}")
-    script_path = cfg.game_dir.joinpath(f"{name}.sh")
-    write_runscript(script_path, appID)
+    try:
+        with phase('download', appID=appID):
+            subprocess.run([
+                "steamcmd",
+                "+login", "LowellMakes",
+                "+app_update", str(appID),
+                "+exit",
+            ], check=True)
+
+        script_path = cfg.game_dir.joinpath(f"{name}.sh")
+        write_runscript(script_path, appID)
+
+        keymap_path = cfg.keymap_dir.joinpath(f"{appID}.conf")
+        write_keymap(keymap_path, appID, info)
+
+        display_path = display.profile_path(cfg, appID)
+        if display_profile:
+            display.write_profile(display_path, appID, info, display_profile)
+            display.set_launch_options(appID, display_profile.launch_options())
+        else:
+            display.write_profile_template(display_path, appID, info)
 
-    keymap_path = cfg.keymap_dir.joinpath(f"{appID}.conf")
-    write_keymap(keymap_path, appID, info)
+        if transcoder:
+            print("Waiting for trailer transcode to finish ...")
+            transcoder.wait()
+    finally:
+        if transcoder:
+            transcoder.close()
 
-    game_entry = generate_gamelist_entry(info, appID, libimg, script_path, cfg.cache_dir)
-    update_gamelist_xml(game_entry)
+    with phase('register', appID=appID):
+        register_game(cfg, appID, info)
 
     print("")
     print("All done!")
@@ -286,15 +415,52 @@ def install_game(cfg, appID):
 
 
 def do_main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument("appID")
+    if sys.argv[1:2] in (['export'], ['import']):
+        # Imported here; bundle builds on the functions above.
+        from . import bundle
+        bundle.do_main(sys.argv[1], sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(
+        epilog="Also: vent-installer export <appID...> / vent-installer import <bundle>",
+    )
+    parser.add_argument("appID", nargs='?')
+    parser.add_argument(
+        "--resume-transcodes",
+        action="store_true",
+        help="Finish trailer transcodes left over from an interrupted install",
+    )
+    group = parser.add_argument_group("display profile")
+    group.add_argument("--display-method", choices=(display.GAMESCOPE, display.XRANDR))
+    group.add_argument("--render", help="Render resolution, e.g. 1280x720")
+    group.add_argument("--upscale", choices=sorted(display.GAMESCOPE_UPSCALE))
+    group.add_argument("--fps", type=int, help="Frame cap")
+    group.add_argument("--refresh", type=int, help="Refresh rate")
     args = parser.parse_args()
+    if not (args.appID or args.resume_transcodes):
+        parser.error("an appID is required")
+
+    display_profile = None
+    if args.display_method or args.render or args.upscale or args.fps or args.refresh:
+        try:
+            display_profile = display.Profile(
+                method=args.display_method or display.GAMESCOPE,
+                render=display.parse_resolution(args.render) if args.render else None,
+                upscale=args.upscale,
+                fps=args.fps,
+                refresh=args.refresh,
+            )
+        except ValueError as exc:
+            parser.error(str(exc))
 
     cfg = get_configuration()
     for key, value in cfg.__dict__.items():
         print(f"{key:20s} {value}")
 
-    install_game(cfg, args.appID)
+    if args.resume_transcodes:
+        resume_transcodes(cfg)
+    if args.appID:
+        install_game(cfg, args.appID, display_profile)
 
 
 def main():
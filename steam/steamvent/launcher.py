@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+from contextlib import ExitStack
 import logging
 import os
 import select
@@ -8,83 +9,76 @@ import subprocess
 import sys
 import time
 
-from .common import ex, main_wrapper, get_configuration, switch_keymap
-from .valve import get_executable, load_or_fetch_info, guess_thumbnail
+from .common import main_wrapper, get_configuration, switch_keymap
+from .display import display_session
+from .history import DETECT_TIMEOUT, EXIT_BUTTON, History
+from .images import find_splash
+from .logs import phase
+from .performance import session_profile
+from .readahead import GameReadahead
+from .sampler import Sampler
+from .session import LaunchLock
+from .splash import Splash
+from .steamipc import dispatch
+from .valve import get_executable, load_or_fetch_info
+from .window import window_watcher
 
 
 LOG = logging.getLogger('vent')
 
-
-def xfconf_query(channel, prop, value=None):
-    if value:
-        ex(
-            "xfconf-query",
-            "--create",
-            "--type", "string",
-            "-c", channel,
-            "-p", prop,
-            "-s", value,
-        )
-    else:
-        ex(
-            "xfconf-query",
-            "-c", channel,
-            "-p", prop,
-            "-r",
-        )
-
-
-def xfterm_query(prop, value=None):
-    xfconf_query("xfce4-terminal", prop, value)
-
-
-def remove_splash():
-    xfconf_query("xfce4-terminal", "/background-image-file")
-    xfconf_query("xfce4-terminal", "/background-mode")
-    xfconf_query("xfce4-terminal", "/background-image-style")
-
-
-def do_configure_splash(img):
-    xfconf_query("xfce4-terminal", "/font-name", "Monospace Bold 20")
-    if img:
-        xfterm_query("/background-image-file", img)
-        xfterm_query("/background-mode", "TERMINAL_BACKGROUND_IMAGE")
-        xfterm_query("/background-image-style", "TERMINAL_BACKGROUND_STYLE_SCALED")
-    else:
-        remove_splash()
-
-
-def configure_splash(img):
-    try:
-        do_configure_splash(img)
-    except FileNotFoundError:
-        LOG.warning("Could not change terminal background. Is xfconf-query installed?")
+# Tries at the launch lock when its holder lets go under us.
+ACQUIRE_ATTEMPTS = 5
+
+
+def _wait_window(appID, pid, pidfd, since, record, splash, session):
+    """
+    Wait for the game's window, then drop the splash in front of it.
+    """
+    watcher = window_watcher()
+    if watcher is None:
+        return
+
+    session.progress("Waiting for the game to appear ...")
+    with watcher:
+        window = watcher.wait(pid, pidfd=pidfd)
+    if window is None:
+        LOG.warning("No window seen for appID=%s", appID)
+        return
+
+    latency = time.monotonic() - since
+    record.window_shown(latency)
+    LOG.debug(
+        "Game window 0x%x mapped", window,
+        extra={'appID': appID, 'phase': 'window', 'pid': pid, 'duration': latency},
+    )
+    if splash:
+        splash.remove()
 
 
-def launch_wait(cfg, appID):
+def _launch_wait(cfg, appID, session, record, readahead, sampler, tuning, splash):
     subprocess.run("clear", check=False, shell=True)
 
-    info = load_or_fetch_info(appID, cfg.cache_dir)
-    executable = get_executable(info)
+    with phase('metadata', appID=appID):
+        # Launching only needs the executable; skip the store metadata.
+        info = load_or_fetch_info(appID, cfg.cache_dir, sources=('vdf',))
+        executable = get_executable(info)
     game = info['vdf'].get('common', {}).get('name', '?????')
 
-    img = os.path.join(cfg.cache_dir, str(appID), "raw_page_background.jpg")
-    if not os.path.exists(img):
-        img = guess_thumbnail(cfg.cache_dir, str(appID))
-    configure_splash(img)
-
     LOG.info(
         "Launching appID=%s; game='%s'; executable='%s';",
         appID, game, executable
     )
 
-    print(f"Launching {game} ... ..", end='')
-    sys.stdout.flush()
+    session.progress(f"Launching {game} ... ..", end='')
 
-    ex("steam", f"steam://rungameid/{appID}")
+    with phase('dispatch', appID=appID):
+        dispatch(f"steam://rungameid/{appID}")
+    # After dispatch, so that planning it can't hold up the launch.
+    readahead.start(info, executable)
     LOG.debug("Waiting for executable '%s'", executable)
 
     pid = None
+    start = time.monotonic()
     for i in range(60):
         ret = subprocess.run(
             f"ps ax -o pid,comm | grep -i {executable}",
@@ -93,27 +87,40 @@ def launch_wait(cfg, appID):
             check=False,
         )
         if ret.returncode:
-            print(f"\b\b{60-i:2d}", end='')
-            sys.stdout.flush()
+            session.progress(f"\b\b{60-i:2d}", end='')
             time.sleep(1)
             continue
 
         pid = int(ret.stdout.decode().strip().split(" ")[0])
+        record.game_detected(time.monotonic() - start)
+        readahead.game_started(pid)
+        if tuning:
+            tuning.apply(pid)
+        sampler.start(pid)
         LOG.debug(
-            "Executable running: appID=%s; game='%s'; executable='%s'; pid=%s",
-            appID,
+            "Executable running: game='%s'; executable='%s'",
             game,
             executable,
-            pid,
+            extra={
+                'appID': appID,
+                'phase': 'detect',
+                'pid': pid,
+                'duration': time.monotonic() - start,
+            },
         )
         break
     else:
-        print("")
+        record.exit_cause = DETECT_TIMEOUT
+        session.progress()
         LOG.error(
-            "Timed out waiting for appID=%s; game='%s'; executable='%s'",
-            appID,
+            "Timed out waiting for game='%s'; executable='%s'",
             game,
             executable,
+            extra={
+                'appID': appID,
+                'phase': 'detect',
+                'duration': time.monotonic() - start,
+            },
         )
         exc = Exception(
             f"Timed out waiting for {appID=} {game=} {executable=}"
@@ -124,39 +131,79 @@ def launch_wait(cfg, appID):
         )
         raise exc
 
-    print("")
-    print("Game now running! Please enjoy =^_^=")
+    session.progress()
 
     pidfd = os.pidfd_open(pid)
 
     def handler(_sig, _frame):
         LOG.debug("SIGTERM received from exit button")
         LOG.debug("Forwarding SIGTERM to game process")
+        record.exit_cause = EXIT_BUTTON
         signal.pidfd_send_signal(pidfd, signal.SIGTERM)
 
     signal.signal(signal.SIGTERM, handler)
 
+    _wait_window(appID, pid, pidfd, start, record, splash, session)
+    session.progress("Game now running! Please enjoy =^_^=")
+    start = time.monotonic()
+
     while True:
         ret = select.select([pidfd], [], [])
-        LOG.debug(
-            "appID=%s; game='%s'; executable='%s'; pid=%s closed, exiting vent launcher",
-            appID,
+        LOG.info(
+            "game='%s'; executable='%s' closed, exiting vent launcher",
             game,
             executable,
-            pid,
+            extra={
+                'appID': appID,
+                'phase': 'play',
+                'pid': pid,
+                'duration': time.monotonic() - start,
+            },
         )
         LOG.debug("ret=%s", str(ret))
-        print("Game closed, returning you to the menu (｡･ω･｡)ﾉ♡")
+        session.progress("Game closed, returning you to the menu (｡･ω･｡)ﾉ♡")
         break
 
 
-def do_launch(cfg, appID, keymap):
-    switch_keymap(cfg.active_keymap, cfg.default_keymap, keymap)
+def launch_wait(cfg, appID, session, tuning=None, splash=None):
+    # Uses the splash time to pull the game's files into the page cache.
+    readahead = GameReadahead(cfg.cache_dir, appID)
+    # Samples the game's resource use, stored with the session at exit.
+    sampler = Sampler()
     try:
-        launch_wait(cfg, appID)
+        with History(cfg.history_db) as history:
+            with history.session(appID) as record:
+                try:
+                    _launch_wait(cfg, appID, session, record, readahead, sampler, tuning, splash)
+                finally:
+                    record.samples = sampler.stop()
     finally:
-        switch_keymap(cfg.active_keymap, cfg.default_keymap, cfg.default_keymap)
-        remove_splash()
+        readahead.finish()
+
+
+def do_launch(cfg, appID, keymap, session):
+    tuning = session_profile(cfg, appID)
+    display = display_session(cfg, appID)
+
+    # Everything set up for the session is undone in reverse order,
+    # each step even if an earlier one fails.
+    with ExitStack() as cleanup:
+        # The splash is written in the background, overlapping with the
+        # keymap switch and game dispatch below.
+        splash = Splash()
+        cleanup.callback(splash.close)
+        splash.show(find_splash(cfg.cache_dir, appID))
+        cleanup.callback(splash.remove)
+
+        if tuning:
+            cleanup.callback(tuning.restore)
+        if display:
+            cleanup.callback(display.restore)
+            display.apply()
+
+        switch_keymap(cfg.active_keymap, cfg.default_keymap, keymap)
+        cleanup.callback(switch_keymap, cfg.active_keymap, cfg.default_keymap, cfg.default_keymap)
+        launch_wait(cfg, appID, session, tuning, splash)
 
 
 def do_main():
@@ -173,7 +220,33 @@ def do_main():
     LOG.debug("    default_keymap=%s", cfg.default_keymap)
     LOG.debug("    keymap=%s", keymap)
 
-    do_launch(cfg, appID, keymap)
+    session = LaunchLock(cfg.run_dir)
+    for _ in range(ACQUIRE_ATTEMPTS):
+        if session.acquire(appID):
+            break
+        active_appID, pid = session.holder()
+        if active_appID is None:
+            # Whoever held the lock let go after our attempt; try again.
+            continue
+        if active_appID == appID:
+            LOG.info("appID=%s already launching (pid=%s); attaching", appID, pid)
+            session.follow()
+            return
+
+        LOG.warning(
+            "Refusing to launch appID=%s; appID=%s is already running (pid=%s)",
+            appID, active_appID, pid,
+        )
+        print(f"Another game (appID {active_appID}) is already running!")
+        print("Close it with the exit button before starting a new one.")
+        sys.exit(1)
+    else:
+        LOG.error("Failed to take the launch lock for appID=%s", appID)
+        print("Couldn't start the game; try again.")
+        sys.exit(1)
+
+    with session:
+        do_launch(cfg, appID, keymap, session)
 
 
 def main():
@@ -0,0 +1,148 @@
+import atexit
+import collections
+import contextlib
+import datetime
+import logging
+from logging.handlers import QueueHandler, QueueListener, SysLogHandler
+import os
+import queue
+import time
+
+
+LOG = logging.getLogger('vent')
+
+# Structured fields recognised in a record's 'extra', in output order.
+FIELDS = ('appID', 'phase', 'pid', 'duration')
+
+# Number of crash reports to keep around.
+MAX_CRASH_REPORTS = 10
+
+_ring = None
+
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Formatter appending any structured fields as key=value pairs.
+
+    e.g. ``LOG.info("launched", extra={'appID': 1234, 'duration': 0.5})``
+    is logged as ``vent: launched appID=1234 duration=0.500``.
+    """
+    def format(self, record):
+        msg = super().format(record)
+        fields = []
+        for name in FIELDS:
+            value = getattr(record, name, None)
+            if value is None:
+                continue
+            if isinstance(value, float):
+                value = f"{value:.3f}"
+            fields.append(f"{name}={value}")
+        if fields:
+            msg = f"{msg} {' '.join(fields)}"
+        return msg
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Keep the last few records in memory, for dumping into crash reports.
+
+    Records are only formatted when dumped, so the hot path pays for a
+    deque append and nothing else.
+
+    :param capacity: Number of records to keep.
+    """
+    def __init__(self, capacity=500):
+        super().__init__(logging.DEBUG)
+        self.records = collections.deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def dump(self, path):
+        formatter = self.formatter or logging.Formatter()
+        with open(path, "w", encoding='UTF-8') as outfile:
+            for record in list(self.records):
+                stamp = datetime.datetime.fromtimestamp(record.created)
+                outfile.write(
+                    f"{stamp.isoformat(timespec='milliseconds')} "
+                    f"{record.levelname} {formatter.format(record)}\n"
+                )
+
+
+def _syslog_handler():
+    address = ''
+    if os.path.exists('/dev/log'):
+        address = '/dev/log'
+    elif os.path.exists('/var/run/syslog'):
+        address = '/var/run/syslog'
+
+    if address:
+        syslog = SysLogHandler(address=address)
+    else:
+        syslog = SysLogHandler()
+
+    syslog.setLevel(logging.DEBUG)
+    syslog.setFormatter(StructuredFormatter("%(name)s: %(message)s"))
+    return syslog
+
+
+def configure_logging(capacity=500):
+    """
+    Route the 'vent' logger through a background syslog writer.
+
+    Records are handed to a queue and written to syslog by a listener
+    thread, so logging never blocks on syslog I/O. The most recent
+    records are also kept in a ring buffer for crash reports.
+    """
+    global _ring
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, _syslog_handler())
+    listener.start()
+    atexit.register(listener.stop)
+
+    _ring = RingBufferHandler(capacity)
+    _ring.setFormatter(StructuredFormatter("%(name)s: %(message)s"))
+
+    LOG.setLevel(logging.DEBUG)
+    LOG.addHandler(QueueHandler(log_queue))
+    LOG.addHandler(_ring)
+
+
+def dump_crash_report(crash_dir, name):
+    """
+    Write the ring buffer's contents to a new crash report file.
+
+    :return: The report's path, or None if logging isn't configured.
+    """
+    if _ring is None:
+        return None
+
+    os.makedirs(crash_dir, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    path = os.path.join(crash_dir, f"{stamp}-{name}.log")
+    _ring.dump(path)
+
+    reports = sorted(os.listdir(crash_dir))
+    for old in reports[:-MAX_CRASH_REPORTS]:
+        os.unlink(os.path.join(crash_dir, old))
+
+    return path
+
+
+@contextlib.contextmanager
+def phase(name, **fields):
+    """
+    Time a phase of work, logging its duration as a structured record.
+
+    Additional structured fields (e.g. appID) are passed through.
+    """
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        duration = time.monotonic() - start
+        LOG.debug(
+            "phase %s finished in %.3fs", name, duration,
+            extra={'phase': name, 'duration': duration, **fields},
+        )
@@ -0,0 +1,367 @@
+"""
+SQLite store for app metadata.
+
+Holds each app's metadata sources (the vdf, web and store documents
+valve.load_or_fetch_info returns) as JSON blobs, plus columns extracted
+from them and the asset manifest, indexed so that questions about the
+whole library are single queries rather than a walk over every app's
+cache directory::
+
+    SELECT appid, name FROM apps WHERE executable IS NULL;
+    SELECT appid FROM metadata WHERE fetched_at < strftime('%s', 'now', '-30 days');
+
+The database lives at cache/metadata.db, in WAL mode so the launcher can
+read while the installer or prefetcher writes. Caches from before it
+existed (cache/<appID>/{vdf,web,store}.json and manifest.json) are
+imported the first time it's opened; see migrate().
+"""
+
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+
+LOG = logging.getLogger('vent')
+
+DB_NAME = "metadata.db"
+
+# Metadata sources, as cached by valve.load_or_fetch_info.
+SOURCES = ('vdf', 'web', 'store')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS apps (
+    appid TEXT PRIMARY KEY,
+    name TEXT,
+    executable TEXT,
+    release_date INTEGER,
+    change_number INTEGER,
+    fetched_at REAL
+);
+CREATE INDEX IF NOT EXISTS apps_name ON apps (name);
+CREATE INDEX IF NOT EXISTS apps_executable ON apps (executable);
+CREATE INDEX IF NOT EXISTS apps_fetched_at ON apps (fetched_at);
+
+CREATE TABLE IF NOT EXISTS metadata (
+    appid TEXT NOT NULL,
+    source TEXT NOT NULL,
+    data TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (appid, source)
+);
+CREATE INDEX IF NOT EXISTS metadata_fetched_at ON metadata (fetched_at);
+
+CREATE TABLE IF NOT EXISTS assets (
+    appid TEXT NOT NULL,
+    local_name TEXT NOT NULL,
+    asset TEXT,
+    lang TEXT,
+    url TEXT,
+    size INTEGER,
+    width INTEGER,
+    height INTEGER,
+    sha256 TEXT,
+    fetched TEXT,
+    PRIMARY KEY (appid, local_name)
+);
+CREATE INDEX IF NOT EXISTS assets_asset ON assets (asset);
+CREATE INDEX IF NOT EXISTS assets_sha256 ON assets (sha256);
+
+-- Files a game read early in a session, for readahead.py.
+CREATE TABLE IF NOT EXISTS traces (
+    appid TEXT NOT NULL,
+    path TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    size INTEGER,
+    PRIMARY KEY (appid, path)
+);
+
+CREATE TABLE IF NOT EXISTS migrations (
+    name TEXT PRIMARY KEY,
+    applied REAL NOT NULL
+);
+"""
+
+ASSET_FIELDS = ('asset', 'lang', 'url', 'size', 'width', 'height', 'sha256', 'fetched')
+
+
+def _release_date(vdf_info):
+    common = vdf_info.get('common', {})
+    ts = common.get('original_release_date') or common.get('steam_release_date')
+    try:
+        return int(ts) if ts else None
+    except ValueError:
+        return None
+
+
+def _change_number(vdf_info):
+    value = vdf_info.get('_change_number') or vdf_info.get('change_number')
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+class MetaDB:
+    """
+    :param cache_dir: The steam cache directory.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = str(cache_dir)
+        self.path = os.path.join(self.cache_dir, DB_NAME)
+        self._local = threading.local()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self.db:
+            self.db.executescript(SCHEMA)
+        if not self.migrated('json-cache'):
+            migrate(self)
+
+    @property
+    def db(self):
+        # sqlite3 connections can't be shared between threads, and
+        # load_or_fetch_info writes from several.
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def migrated(self, name):
+        return self.db.execute(
+            "SELECT 1 FROM migrations WHERE name = ?", (name,)
+        ).fetchone() is not None
+
+    # Metadata
+
+    def get(self, appID, source):
+        """
+        One metadata source for an app, or None if it isn't stored.
+        """
+        row = self.db.execute(
+            "SELECT data FROM metadata WHERE appid = ? AND source = ?",
+            (str(appID), source),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def fetched_at(self, appID, source):
+        """
+        When a source was stored, as a Unix time; None if it isn't.
+        """
+        row = self.db.execute(
+            "SELECT fetched_at FROM metadata WHERE appid = ? AND source = ?",
+            (str(appID), source),
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, appID, source, data, fields=None, fetched_at=None):
+        """
+        Store one metadata source and refresh the app's extracted columns.
+
+        :param fields: dict of apps columns to set, e.g. the executable,
+            which the caller is better placed to work out.
+        :param fetched_at: Unix time; defaults to now.
+        """
+        appID = str(appID)
+        fetched_at = fetched_at or time.time()
+        columns = dict(fields or {})
+        if source == 'vdf':
+            columns.setdefault('name', data.get('common', {}).get('name'))
+            columns.setdefault('release_date', _release_date(data))
+            columns.setdefault('change_number', _change_number(data))
+
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO metadata (appid, source, data, fetched_at) "
+                "VALUES (?, ?, ?, ?)",
+                (appID, source, json.dumps(data), fetched_at),
+            )
+            self.db.execute(
+                "INSERT INTO apps (appid, fetched_at) VALUES (?, ?) "
+                "ON CONFLICT (appid) DO UPDATE SET fetched_at = MAX(fetched_at, excluded.fetched_at)",
+                (appID, fetched_at),
+            )
+            for column, value in columns.items():
+                self.db.execute(
+                    f"UPDATE apps SET {column} = ? WHERE appid = ?", (value, appID)
+                )
+
+    def apps(self, where="1", params=()):
+        """
+        Query the apps table.
+
+        :return: list of dicts, one per matching app.
+        """
+        cursor = self.db.execute(f"SELECT * FROM apps WHERE {where} ORDER BY appid", params)
+        names = [col[0] for col in cursor.description]
+        return [dict(zip(names, row)) for row in cursor]
+
+    # Assets
+
+    def set_assets(self, appID, entries):
+        """
+        Replace an app's asset list with a manifest's entries.
+        """
+        appID = str(appID)
+        with self.db:
+            self.db.execute("DELETE FROM assets WHERE appid = ?", (appID,))
+            self.db.executemany(
+                f"INSERT INTO assets (appid, local_name, {', '.join(ASSET_FIELDS)}) "
+                f"VALUES (?, ?{', ?' * len(ASSET_FIELDS)})",
+                [
+                    (appID, name, *(entry.get(field) for field in ASSET_FIELDS))
+                    for name, entry in entries.items()
+                ],
+            )
+
+    def assets(self, appID):
+        """
+        An app's assets, as a dict of local name to manifest entry.
+        """
+        cursor = self.db.execute(
+            f"SELECT local_name, {', '.join(ASSET_FIELDS)} FROM assets WHERE appid = ?",
+            (str(appID),),
+        )
+        return {row[0]: dict(zip(ASSET_FIELDS, row[1:])) for row in cursor}
+
+    def find_asset(self, appID, names):
+        """
+        The first of names that the app has, or None.
+        """
+        have = {
+            row[0] for row in self.db.execute(
+                "SELECT local_name FROM assets WHERE appid = ?", (str(appID),)
+            )
+        }
+        for name in names:
+            if name in have:
+                return name
+        return None
+
+    # Readahead traces
+
+    def set_trace(self, appID, files):
+        """
+        Replace an app's readahead trace.
+
+        :param files: list of (path, seconds into the session, size).
+        """
+        appID = str(appID)
+        with self.db:
+            self.db.execute("DELETE FROM traces WHERE appid = ?", (appID,))
+            self.db.executemany(
+                "INSERT INTO traces (appid, path, first_seen, size) VALUES (?, ?, ?, ?)",
+                [(appID, path, seen, size) for path, seen, size in files],
+            )
+
+    def trace(self, appID):
+        """
+        An app's readahead trace, in the order the files were first read.
+        """
+        return self.db.execute(
+            "SELECT path, first_seen, size FROM traces WHERE appid = ? ORDER BY first_seen",
+            (str(appID),),
+        ).fetchall()
+
+
+def migrate(metadb):
+    """
+    Import per-app JSON caches into the database.
+
+    Leaves the JSON files in place. Sources already in the database are
+    not overwritten.
+    """
+    # Imported here; valve builds on this module.
+    from .valve import get_executable
+
+    count = 0
+    root = Path(metadb.cache_dir)
+    for local_dir in sorted(root.iterdir()):
+        if not local_dir.name.isdigit() or not local_dir.is_dir():
+            continue
+        appID = local_dir.name
+
+        for source in SOURCES:
+            path = local_dir.joinpath(f"{source}.json")
+            if not path.exists() or metadb.fetched_at(appID, source) is not None:
+                continue
+            try:
+                data = json.loads(path.read_text())
+            except ValueError:
+                LOG.warning("Skipping unreadable metadata cache '%s'", path)
+                continue
+            fields = {}
+            if source == 'vdf':
+                try:
+                    fields['executable'] = get_executable({'vdf': data})
+                except Exception:
+                    fields['executable'] = None
+            metadb.put(appID, source, data, fields, fetched_at=path.stat().st_mtime)
+            count += 1
+
+        manifest = local_dir.joinpath("manifest.json")
+        if manifest.exists() and not metadb.assets(appID):
+            try:
+                metadb.set_assets(appID, json.loads(manifest.read_text()))
+            except ValueError:
+                LOG.warning("Skipping unreadable manifest '%s'", manifest)
+
+    with metadb.db:
+        metadb.db.execute(
+            "INSERT OR REPLACE INTO migrations (name, applied) VALUES (?, ?)",
+            ('json-cache', time.time()),
+        )
+    if count:
+        LOG.info("Imported %d cached metadata files into %s", count, metadb.path)
+    return count
+
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def metadb(cache_dir):
+    """
+    The shared MetaDB for a cache directory.
+    """
+    cache_dir = str(cache_dir)
+    with _instances_lock:
+        if cache_dir not in _instances:
+            _instances[cache_dir] = MetaDB(cache_dir)
+        return _instances[cache_dir]
+
+
+def main():
+    # Imported here; valve builds on this module.
+    from .common import get_configuration
+
+    parser = argparse.ArgumentParser(description="Query the steam metadata database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="Import any JSON caches not yet imported")
+    commands.add_parser("no-executable", help="List games without a usable executable")
+    stale = commands.add_parser("stale", help="List games whose metadata is older than N days")
+    stale.add_argument("days", type=int)
+    args = parser.parse_args()
+
+    db = metadb(get_configuration().cache_dir)
+    if args.command == 'migrate':
+        print(f"Imported {migrate(db)} metadata files")
+        return
+    if args.command == 'no-executable':
+        rows = db.apps("executable IS NULL")
+    else:
+        rows = db.apps(
+            "appid IN (SELECT appid FROM metadata GROUP BY appid HAVING MIN(fetched_at) < ?)",
+            (time.time() - args.days * 86400,),
+        )
+    for row in rows:
+        print(f"{row['appid']:>10s}  {row['name'] or '?'}")
+
+
+if __name__ == '__main__':
+    main()
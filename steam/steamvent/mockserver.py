@@ -0,0 +1,276 @@
+"""
+Local stand-in for the Steam store API and CDN.
+
+Serves recorded fixtures for IStoreBrowseService/GetItems,
+store.steampowered.com/api/appdetails and asset files, with injectable
+latency and failures, so installs can be tested and benchmarked
+offline. Point the installer at it with VENT_STEAM_BASE (see
+valve.ENDPOINTS).
+
+The fixture directory has the same layout as the installer's cache
+directory, so an existing cache can be served as-is::
+
+    python3 -m steamvent.mockserver --fixtures ~/RetroPie/steam/cache
+    VENT_STEAM_BASE=http://127.0.0.1:8000 vent-installer 221640
+"""
+
+import argparse
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import mimetypes
+from pathlib import Path
+import random
+import threading
+import time
+import urllib.parse
+
+from .metadb import DB_NAME, metadb
+
+
+LOG = logging.getLogger('vent')
+
+
+@dataclass
+class Faults:
+    """
+    Failure injection settings. Rates are probabilities per request.
+    """
+    latency: float = 0.0
+    jitter: float = 0.0
+    not_found: float = 0.0
+    rate_limited: float = 0.0
+    truncated: float = 0.0
+    retry_after: int = 1
+    seed: int = 0
+
+
+class Fixtures:
+    """
+    Index of the recorded metadata and assets in a fixture directory.
+
+    :param root: A directory of <appID>/ subdirectories, each holding
+        web.json, store.json and, optionally, asset files listed in a
+        manifest.json.
+    """
+    def __init__(self, root):
+        self.root = Path(root)
+        self.assets = {}
+        for local_dir in self.root.iterdir():
+            if not local_dir.name.isdigit():
+                continue
+            manifest = local_dir.joinpath("manifest.json")
+            if manifest.exists():
+                entries = json.loads(manifest.read_text())
+                for local_name, entry in entries.items():
+                    path = urllib.parse.urlsplit(entry['url']).path
+                    self.assets[path] = local_dir.joinpath(local_name)
+
+    def app_ids(self):
+        return sorted(
+            p.name for p in self.root.iterdir()
+            if p.name.isdigit() and self.metadata(p.name, "web.json") is not None
+        )
+
+    def metadata(self, appID, name):
+        path = self.root.joinpath(str(appID), name)
+        if path.exists():
+            return json.loads(path.read_text())
+        # A cache directory keeps its metadata in the metadata database.
+        if self.root.joinpath(DB_NAME).exists():
+            return metadb(self.root).get(appID, Path(name).stem)
+        return None
+
+    def asset(self, path):
+        """
+        Find the file recorded for a URL path.
+
+        Falls back to looking for the file by name in the app's fixture
+        directory, for fixtures without a manifest.
+        """
+        if path in self.assets:
+            return self.assets[path]
+        parts = path.strip('/').split('/')
+        for appID in (p for p in parts if p.isdigit()):
+            candidate = self.root.joinpath(appID, parts[-1])
+            if candidate.is_file():
+                return candidate
+        return None
+
+
+class MockSteamHandler(BaseHTTPRequestHandler):
+    server_version = "MockSteam/1.0"
+
+    def log_message(self, fmt, *args):
+        LOG.debug("mockserver: " + fmt, *args)
+
+    def _send(self, status, body=b'', content_type="application/json", headers=None):
+        faults = self.server.faults
+        truncate = status == 200 and self.server.roll(faults.truncated)
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+
+        if truncate:
+            # Promise the whole body, deliver half, hang up.
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(body)
+
+    def _send_json(self, data):
+        self._send(200, json.dumps(data).encode())
+
+    def do_GET(self):
+        server = self.server
+        faults = server.faults
+        server.count('requests')
+
+        delay = faults.latency + server.rng_uniform(0, faults.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if server.roll(faults.rate_limited):
+            server.count('429')
+            self._send(429, headers={"Retry-After": str(faults.retry_after)})
+            return
+
+        if server.roll(faults.not_found):
+            server.count('404')
+            self._send(404)
+            return
+
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+
+        if url.path.rstrip('/').endswith("IStoreBrowseService/GetItems/v1"):
+            request = json.loads(query.get('input_json', ['{}'])[0])
+            items = []
+            for item in request.get('ids', []):
+                web = server.fixtures.metadata(item['appid'], "web.json")
+                if web:
+                    items.append(web)
+            self._send_json({'response': {'store_items': items}})
+
+        elif url.path.rstrip('/').endswith("api/appdetails"):
+            appID = query.get('appids', [''])[0]
+            store = server.fixtures.metadata(appID, "store.json")
+            if store is None:
+                self._send_json({appID: {'success': False}})
+            else:
+                self._send_json({appID: {'success': True, 'data': store}})
+
+        else:
+            path = server.fixtures.asset(url.path)
+            if path is None:
+                server.count('404')
+                self._send(404)
+                return
+            content_type = mimetypes.guess_type(path.name)[0]
+            self._send(200, path.read_bytes(), content_type or "application/octet-stream")
+
+
+class MockSteamServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server serving Fixtures with injected Faults.
+
+    :param fixtures: Fixture directory.
+    :param faults: Faults to inject; defaults to none.
+    :param address: (host, port) to listen on; port 0 picks a free port.
+    """
+    daemon_threads = True
+
+    def __init__(self, fixtures, faults=None, address=('127.0.0.1', 0)):
+        super().__init__(address, MockSteamHandler)
+        self.fixtures = Fixtures(fixtures)
+        self.faults = faults or Faults()
+        self.counters = {}
+        self._rng = random.Random(self.faults.seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def roll(self, probability):
+        if not probability:
+            return False
+        with self._lock:
+            return self._rng.random() < probability
+
+    def rng_uniform(self, low, high):
+        if not high:
+            return low
+        with self._lock:
+            return self._rng.uniform(low, high)
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def start(self):
+        """
+        Serve from a background thread.
+        """
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="mockserver", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve recorded Steam store/CDN fixtures for offline installs",
+    )
+    parser.add_argument("--fixtures", required=True, help="Fixture (cache) directory")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra latency, up to this many seconds")
+    parser.add_argument("--p404", type=float, default=0.0, help="Probability of a 404")
+    parser.add_argument("--p429", type=float, default=0.0, help="Probability of a 429")
+    parser.add_argument("--truncate", type=float, default=0.0, help="Probability of a truncated body")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After for 429s, in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG)
+    faults = Faults(
+        latency=args.latency,
+        jitter=args.jitter,
+        not_found=args.p404,
+        rate_limited=args.p429,
+        truncated=args.truncate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+    )
+    server = MockSteamServer(args.fixtures, faults, (args.host, args.port))
+    print(f"Serving {args.fixtures} at {server.url}")
+    print(f"    VENT_STEAM_BASE={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("")
+        for name, value in sorted(server.counters.items()):
+            print(f"{name:10s} {value}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+LAN read-through cache shared between cabinets.
+
+One cabinet serves its steam cache directory with ``vent-cache-peer``;
+the others set VENT_CACHE_PEER to its URL and try it for metadata and
+assets before going to Steam. Everything fetched from a peer is checked
+against the SHA-256 the peer advertises, so a damaged or half-written
+file on the peer falls back to Steam rather than spreading.
+
+To try it with two processes on one host::
+
+    vent-cache-peer --port 8765
+    VENT_CACHE_PEER=http://127.0.0.1:8765 vent-installer 221640
+"""
+
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import threading
+
+from .assets import Manifest
+from .common import get_configuration
+from .metadb import SOURCES, metadb
+from .webclient import NotFound, SteamClient, SteamHTTPError
+
+
+LOG = logging.getLogger('vent')
+
+# Metadata sources are served as <source>.json.
+METADATA_NAMES = {f"{source}.json": source for source in SOURCES}
+INDEX_NAME = "index.json"
+DEFAULT_PORT = 8765
+
+
+def metadata_body(cache_dir, appID, name):
+    """
+    A metadata source from the metadata database, as JSON bytes.
+    """
+    data = metadb(cache_dir).get(appID, METADATA_NAMES[name])
+    return None if data is None else json.dumps(data).encode()
+
+
+def app_index(cache_dir, appID):
+    """
+    Describe every file a peer can serve for an app.
+
+    :return: dict of local file name to {'sha256', 'size'} and, for
+        assets, the manifest entry; or None if nothing is cached.
+    """
+    local_dir = os.path.join(cache_dir, str(appID))
+    if not os.path.isdir(local_dir):
+        return None
+
+    files = {}
+    for name in METADATA_NAMES:
+        body = metadata_body(cache_dir, appID, name)
+        if body is not None:
+            files[name] = {
+                'sha256': hashlib.sha256(body).hexdigest(),
+                'size': len(body),
+            }
+
+    for name, entry in Manifest(cache_dir, appID):
+        path = os.path.join(local_dir, name)
+        if os.path.exists(path) and os.path.getsize(path) == entry['size']:
+            files[name] = dict(entry)
+
+    return files
+
+
+class PeerHandler(BaseHTTPRequestHandler):
+    server_version = "VentCachePeer/1.0"
+
+    def log_message(self, fmt, *args):
+        LOG.debug("peer: " + fmt, *args)
+
+    def _send(self, status, body=b'', content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # /apps/                    list of cached appIDs
+        # /apps/<appID>/index.json  files and hashes for one app
+        # /apps/<appID>/<name>      one file, if listed in the index
+        parts = self.path.split('?')[0].strip('/').split('/')
+        cache_dir = self.server.cache_dir
+
+        if parts == ['apps']:
+            apps = sorted(
+                p.name for p in Path(cache_dir).iterdir()
+                if p.name.isdigit() and p.is_dir()
+            )
+            self._send(200, json.dumps(apps).encode())
+            return
+
+        if len(parts) != 3 or parts[0] != 'apps' or not parts[1].isdigit():
+            self._send(404)
+            return
+
+        _, appID, name = parts
+        index = app_index(cache_dir, appID)
+        if index is None:
+            self._send(404)
+        elif name == INDEX_NAME:
+            self._send(200, json.dumps(index).encode())
+        elif name in METADATA_NAMES and name in index:
+            self._send(200, metadata_body(cache_dir, appID, name))
+        elif name in index:
+            path = os.path.join(cache_dir, appID, name)
+            with open(path, "rb") as infile:
+                self._send(200, infile.read(), "application/octet-stream")
+        else:
+            self._send(404)
+
+
+class PeerServer(ThreadingHTTPServer):
+    """
+    Serve a steam cache directory to other cabinets.
+
+    :param cache_dir: The steam cache directory to serve.
+    :param address: (host, port) to listen on; port 0 picks a free port.
+    """
+    daemon_threads = True
+
+    def __init__(self, cache_dir, address=('0.0.0.0', DEFAULT_PORT)):
+        super().__init__(address, PeerHandler)
+        self.cache_dir = str(cache_dir)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """
+        Serve from a background thread.
+        """
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="cache-peer", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+
+class PeerCache:
+    """
+    Client for another cabinet's PeerServer.
+
+    Any failure talking to the peer is logged and treated as a miss. If
+    the peer can't be reached at all it is skipped for the rest of the
+    process, so a powered-off peer costs one connect timeout, not one
+    per file.
+
+    :param url: Base URL of the peer, e.g. http://cabinet-1:8765
+    """
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        # LAN peer: no rate limits, fail fast, let Steam be the fallback.
+        self.client = SteamClient(rate_limits={}, retries=1, backoff=0.5, timeout=(2, 30))
+        self.disabled = False
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _get(self, path):
+        if self.disabled:
+            return None
+        try:
+            return self.client.get(f"{self.url}/{path}")
+        except NotFound:
+            return None
+        except SteamHTTPError as exc:
+            if exc.status is None:
+                LOG.warning("Cache peer %s unreachable, not using it: %s", self.url, exc)
+                self.disabled = True
+            else:
+                LOG.warning("Cache peer error: %s", exc)
+            return None
+
+    def index(self, appID):
+        """
+        The peer's index for an app, fetched once per process.
+        """
+        appID = str(appID)
+        with self._lock:
+            if appID not in self._indexes:
+                rsp = self._get(f"apps/{appID}/{INDEX_NAME}")
+                self._indexes[appID] = rsp.json() if rsp else {}
+            return self._indexes[appID]
+
+    def fetch(self, appID, name):
+        """
+        Fetch one file for an app, verified against the peer's index.
+
+        :return: (bytes, index entry), or (None, None) on a miss.
+        """
+        entry = self.index(appID).get(name)
+        if not entry:
+            return None, None
+
+        rsp = self._get(f"apps/{appID}/{name}")
+        if rsp is None:
+            return None, None
+
+        if hashlib.sha256(rsp.content).hexdigest() != entry['sha256']:
+            LOG.warning("Cache peer sent a corrupt copy of %s/%s; ignoring it", appID, name)
+            return None, None
+
+        LOG.debug("Fetched %s/%s from cache peer", appID, name)
+        return rsp.content, entry
+
+    def fetch_json(self, appID, name):
+        data, _ = self.fetch(appID, name)
+        if data is None:
+            return None
+        return json.loads(data)
+
+
+_peer = None
+_peer_lock = threading.Lock()
+
+
+def cache_peer():
+    """
+    The PeerCache named by VENT_CACHE_PEER, or None if unset.
+    """
+    global _peer
+    url = os.environ.get("VENT_CACHE_PEER")
+    if not url:
+        return None
+    with _peer_lock:
+        if _peer is None or _peer.url != url.rstrip('/'):
+            _peer = PeerCache(url)
+        return _peer
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve this cabinet's steam cache to other cabinets",
+    )
+    parser.add_argument("--cache-dir", help="Cache directory to serve; defaults to the steam cache")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    cache_dir = args.cache_dir or get_configuration().cache_dir
+    server = PeerServer(cache_dir, (args.host, args.port))
+    print(f"Serving {cache_dir} at {server.url}")
+    print(f"    VENT_CACHE_PEER=http://<this host>:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+"""
+Per-game performance profiles.
+
+A profile is an optional INI file kept next to the game's keymap, as
+keymaps/<appID>.perf::
+
+    [cpu]
+    # One of cpufreq's scaling_available_governors.
+    governor = performance
+    # CPUs to pin the game to.
+    affinity = 2-3
+
+    [priority]
+    nice = -5
+    # idle, best-effort or realtime, and optionally a level, 0-7.
+    ionice = best-effort 0
+
+    [background]
+    # Processes to pause while the game runs, by name (/proc/<pid>/comm).
+    stop = emulationstation, steamwebhelper
+
+The launcher applies the profile once the game is detected and undoes
+all of it when the session ends. The governor changes and paused
+processes are also written to run/performance.json, so if the launcher
+itself is killed, the next launch puts them back before doing anything
+else.
+
+cpufreq is reached through VENT_SYSFS_ROOT (default /sys), so profiles
+can be tried against a fake sysfs tree; see bench.py.
+"""
+
+import configparser
+from dataclasses import dataclass
+import functools
+import json
+import logging
+import os
+from pathlib import Path
+import signal
+import subprocess
+
+from .common import ex
+from .readahead import process_tree
+
+
+LOG = logging.getLogger('vent')
+
+SYSFS_ROOT = "/sys"
+PROFILE_SUFFIX = ".perf"
+STATE_NAME = "performance.json"
+
+IONICE_CLASSES = {'none': 0, 'realtime': 1, 'best-effort': 2, 'idle': 3}
+
+
+class ProfileError(Exception):
+    """
+    A performance profile is malformed.
+    """
+
+
+def sysfs_root():
+    return Path(os.environ.get("VENT_SYSFS_ROOT", SYSFS_ROOT))
+
+
+def profile_path(cfg, appID):
+    return cfg.keymap_dir.joinpath(f"{appID}{PROFILE_SUFFIX}")
+
+
+def parse_cpus(text):
+    """
+    Parse a CPU list like "0,2-3" into a set of CPU numbers.
+    """
+    cpus = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+@dataclass
+class Profile:
+    governor: str = None
+    affinity: frozenset = None
+    nice: int = None
+    ionice: tuple = None
+    stop: tuple = ()
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a profile file.
+
+        :return: The Profile, or None if there is no such file.
+        :raises ProfileError: if the file can't be parsed.
+        """
+        parser = configparser.ConfigParser()
+        try:
+            if not parser.read(path):
+                return None
+        except configparser.Error as exc:
+            raise ProfileError(f"{path}: {exc}") from exc
+
+        profile = cls()
+        try:
+            profile.governor = parser.get('cpu', 'governor', fallback=None)
+            affinity = parser.get('cpu', 'affinity', fallback=None)
+            if affinity:
+                profile.affinity = frozenset(parse_cpus(affinity))
+            profile.nice = parser.getint('priority', 'nice', fallback=None)
+            ionice = parser.get('priority', 'ionice', fallback=None)
+            if ionice:
+                name, _, level = ionice.partition(' ')
+                if name not in IONICE_CLASSES:
+                    raise ValueError(f"unknown ionice class '{name}'")
+                profile.ionice = (name, int(level) if level.strip() else None)
+            stop = parser.get('background', 'stop', fallback='')
+            profile.stop = tuple(name.strip() for name in stop.split(',') if name.strip())
+        except ValueError as exc:
+            raise ProfileError(f"{path}: {exc}") from exc
+        return profile
+
+
+def governor_files(root=None):
+    root = root or sysfs_root()
+    return sorted(root.glob("devices/system/cpu/cpu[0-9]*/cpufreq/scaling_governor"))
+
+
+def _threads(pid):
+    try:
+        return [int(tid) for tid in os.listdir(f"/proc/{pid}/task")]
+    except OSError:
+        return []
+
+
+def _ionice_args(cls, level):
+    args = ["-c", str(IONICE_CLASSES[cls])]
+    if level is not None and cls in ('best-effort', 'realtime'):
+        args += ["-n", str(level)]
+    return args
+
+
+def _get_ionice(tids):
+    """
+    Current I/O class and level of each thread, e.g. ('best-effort', 4).
+    """
+    res = ex("ionice", "-p", *(str(tid) for tid in tids),
+             check=False, capture_output=True, timeout=10)
+    current = {}
+    for tid, line in zip(tids, res.stdout.decode().splitlines()):
+        cls, _, prio = line.partition(': prio ')
+        if cls in IONICE_CLASSES:
+            current[tid] = (cls, int(prio) if prio else None)
+    return current
+
+
+def find_processes(names, exclude=()):
+    """
+    pids of every process whose name is one of names.
+    """
+    pids = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit() or int(entry) in exclude:
+            continue
+        try:
+            with open(f"/proc/{entry}/comm") as infile:
+                if infile.read().strip() in names:
+                    pids.append(int(entry))
+        except OSError:
+            continue
+    return pids
+
+
+def write_governors(governors):
+    """
+    :param governors: dict of scaling_governor path to governor.
+    """
+    for path, governor in governors.items():
+        try:
+            Path(path).write_text(governor)
+        except OSError as exc:
+            LOG.warning("Couldn't set CPU governor at '%s': %s", path, exc)
+
+
+def resume_processes(pids):
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGCONT)
+        except ProcessLookupError:
+            pass
+
+
+def recover(state_path):
+    """
+    Undo a profile left applied by a launcher that didn't clean up.
+    """
+    try:
+        with open(state_path) as infile:
+            state = json.load(infile)
+    except FileNotFoundError:
+        return
+    except ValueError:
+        LOG.warning("Discarding unreadable performance state '%s'", state_path)
+        os.unlink(state_path)
+        return
+
+    LOG.warning("Restoring performance settings left by an earlier session")
+    write_governors(state.get('governors', {}))
+    resume_processes(state.get('stopped', []))
+    os.unlink(state_path)
+
+
+class SessionProfile:
+    """
+    Apply a Profile to one game session and undo it afterwards.
+
+    Every setting is applied independently: one that fails (say, for
+    want of permission) is logged and the rest still go ahead.
+
+    :param profile: The Profile to apply.
+    :param state_path: Where to record what needs undoing.
+    """
+    def __init__(self, profile, state_path, root=None):
+        self.profile = profile
+        self.state_path = str(state_path)
+        self.root = root or sysfs_root()
+        self.governors = {}
+        self.stopped = []
+        self.threads = {}
+        self.ionice = {}
+
+    def _save_state(self):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as outfile:
+            json.dump({'governors': self.governors, 'stopped': self.stopped}, outfile)
+        os.replace(tmp, self.state_path)
+
+    def _set_governor(self):
+        governor = self.profile.governor
+        for path in governor_files(self.root):
+            available = path.with_name("scaling_available_governors")
+            if available.exists() and governor not in available.read_text().split():
+                LOG.warning("CPU governor '%s' isn't available in '%s'", governor, available)
+                return
+            current = path.read_text().strip()
+            if current == governor:
+                continue
+            self.governors[str(path)] = current
+        self._save_state()
+        write_governors({path: governor for path in self.governors})
+
+    def _set_priority(self, pid):
+        tids = [tid for p in process_tree(pid) for tid in _threads(p)]
+        for tid in tids:
+            try:
+                self.threads[tid] = (
+                    os.getpriority(os.PRIO_PROCESS, tid),
+                    os.sched_getaffinity(tid),
+                )
+                if self.profile.nice is not None:
+                    os.setpriority(os.PRIO_PROCESS, tid, self.profile.nice)
+                if self.profile.affinity:
+                    os.sched_setaffinity(tid, self.profile.affinity)
+            except ProcessLookupError:
+                continue
+            except OSError as exc:
+                LOG.warning("Couldn't set priority or affinity of thread %s: %s", tid, exc)
+
+        if self.profile.ionice and tids:
+            self.ionice = _get_ionice(tids)
+            ex("ionice", *_ionice_args(*self.profile.ionice), "-p", *(str(tid) for tid in tids),
+               check=False, timeout=10)
+
+    def _stop_background(self, pid):
+        exclude = set(process_tree(pid)) | {os.getpid()}
+        pids = find_processes(self.profile.stop, exclude)
+        self.stopped.extend(pids)
+        self._save_state()
+        for background in pids:
+            try:
+                os.kill(background, signal.SIGSTOP)
+            except ProcessLookupError:
+                pass
+        LOG.debug("Paused background processes: %s", pids)
+
+    def apply(self, pid):
+        """
+        Apply the profile to the game process pid and its descendants.
+        """
+        steps = []
+        if self.profile.governor:
+            steps.append(self._set_governor)
+        if self.profile.nice is not None or self.profile.affinity or self.profile.ionice:
+            steps.append(functools.partial(self._set_priority, pid))
+        if self.profile.stop:
+            steps.append(functools.partial(self._stop_background, pid))
+
+        for step in steps:
+            try:
+                step()
+            except (OSError, subprocess.SubprocessError):
+                LOG.exception("Failed to apply part of the performance profile")
+
+    def restore(self):
+        """
+        Put back everything apply() changed.
+        """
+        resume_processes(self.stopped)
+        write_governors(self.governors)
+
+        for tid, (nice, affinity) in self.threads.items():
+            try:
+                os.setpriority(os.PRIO_PROCESS, tid, nice)
+                os.sched_setaffinity(tid, affinity)
+            except OSError:
+                # Most likely the game has already exited.
+                continue
+        for tid, setting in self.ionice.items():
+            if os.path.exists(f"/proc/{tid}"):
+                ex("ionice", *_ionice_args(*setting), "-p", str(tid), check=False, timeout=10)
+
+        try:
+            os.unlink(self.state_path)
+        except FileNotFoundError:
+            pass
+
+
+def session_profile(cfg, appID):
+    """
+    The SessionProfile for launching appID, or None if it has no profile.
+
+    Also undoes any profile an earlier launcher left applied.
+    """
+    state_path = cfg.run_dir.joinpath(STATE_NAME)
+    recover(state_path)
+    try:
+        profile = Profile.load(profile_path(cfg, appID))
+    except ProfileError:
+        LOG.exception("Ignoring performance profile for appID=%s", appID)
+        return None
+    if profile is None:
+        return None
+    return SessionProfile(profile, state_path)
@@ -0,0 +1,258 @@
+"""
+Idle-time prefetcher.
+
+Keeps the cache warm for every enabled menu entry, so that launches
+never have to fetch metadata or art while the player waits: refreshes
+metadata older than METADATA_MAX_AGE, fills in missing assets, and
+builds the launch splash.
+
+Started by the kiosk under nice and ionice. It works in small chunks
+(one metadata file, one asset, one derivative) and checks the launch
+lock before each, so it stops issuing work as soon as a 'vent' session
+starts and resumes once the session ends. Asset downloads are checked
+and paced on every chunk of the body: one that a launch interrupts is
+abandoned, and fetched again once the session ends.
+
+Game metadata is only refreshed from the Steam client's appinfo.vdf,
+never by running steamcmd, which can't be interrupted part way; a game
+that is in neither the cache nor appinfo.vdf is skipped.
+"""
+
+import argparse
+import json
+import logging
+import os
+from pathlib import Path
+import re
+import time
+
+from .appinfo import AppInfoError, load_appinfo
+from .assets import Manifest
+from .common import get_configuration
+from .images import make_derivatives
+from .install import asset_queue, cache_asset
+from .logs import configure_logging, phase
+from .session import LaunchLock
+from .valve import (
+    SOURCES,
+    cached_info_age,
+    fetch_info,
+    read_cached_info,
+    write_cached_info,
+)
+from .webclient import SteamHTTPError
+
+
+LOG = logging.getLogger('vent')
+
+# Refetch cached metadata older than this, in seconds.
+METADATA_MAX_AGE = 7 * 24 * 3600
+
+# Seconds between passes over the menu.
+PASS_INTERVAL = 3600
+
+# Fraction of one CPU the prefetcher may use, on average.
+CPU_BUDGET = 0.25
+
+# Download budget, in bytes per second.
+BANDWIDTH_BUDGET = 512 * 1024
+
+# Command used by the kiosk to start the prefetcher.
+PREFETCH_COMMAND = ("nice", "-n", "19", "ionice", "-c", "3", "vent-prefetch")
+
+_VENT_LINE = re.compile(r'^\s*vent\s+(\d+)\s*$', re.MULTILINE)
+
+
+def menu_app_ids(game_dir):
+    """
+    appIDs of every enabled menu entry.
+
+    Disabled entries are renamed away from .sh, so only .sh scripts
+    count.
+    """
+    app_ids = []
+    for script in sorted(Path(game_dir).glob("*.sh")):
+        try:
+            match = _VENT_LINE.search(script.read_text(encoding='UTF-8'))
+        except OSError:
+            continue
+        if match:
+            app_ids.append(match.group(1))
+    return app_ids
+
+
+class Budget:
+    """
+    Pace work to stay within a CPU and a bandwidth budget.
+
+    :param cpu: Fraction of one CPU to use on average.
+    :param bandwidth: Bytes per second to download on average.
+    """
+    def __init__(self, cpu=CPU_BUDGET, bandwidth=BANDWIDTH_BUDGET):
+        self.cpu = cpu
+        self.bandwidth = bandwidth
+        self.reset()
+
+    def reset(self):
+        """
+        Start a new averaging window, so idle time isn't banked.
+        """
+        self.start = time.monotonic()
+        self.cpu_start = self._cpu_time()
+        self.downloaded = 0
+
+    @staticmethod
+    def _cpu_time():
+        times = os.times()
+        return times.user + times.system + times.children_user + times.children_system
+
+    def charge(self, nbytes):
+        self.downloaded += nbytes
+
+    def pace(self):
+        """
+        Sleep long enough to bring both averages back under budget.
+        """
+        elapsed = time.monotonic() - self.start
+        needed = max(
+            (self._cpu_time() - self.cpu_start) / self.cpu,
+            self.downloaded / self.bandwidth,
+        )
+        if needed > elapsed:
+            time.sleep(needed - elapsed)
+
+
+class LaunchStarted(Exception):
+    """
+    A launch session started in the middle of a download.
+    """
+
+
+class Prefetcher:
+    """
+    :param cfg: Configuration.
+    :param budget: Budget to pace work by.
+    :param poll: Seconds between checks while a session is running.
+    """
+    def __init__(self, cfg, budget=None, poll=1.0):
+        self.cfg = cfg
+        self.budget = budget or Budget()
+        self.poll = poll
+        self.lock = LaunchLock(cfg.run_dir)
+
+    def wait_idle(self):
+        """
+        Block while a launch session is active, then pace to budget.
+        """
+        if self.lock.is_held():
+            LOG.debug("prefetch: paused for launch session")
+            while self.lock.is_held():
+                time.sleep(self.poll)
+            LOG.debug("prefetch: resumed")
+        self.budget.pace()
+
+    def on_chunk(self, nbytes):
+        """
+        Pace a download, abandoning it if a launch session starts.
+        """
+        if self.lock.is_held():
+            raise LaunchStarted()
+        self.budget.charge(nbytes)
+        self.budget.pace()
+
+    def refresh_metadata(self, appID):
+        for source in SOURCES:
+            age = cached_info_age(self.cfg.cache_dir, appID, source)
+            if age is not None and age < METADATA_MAX_AGE:
+                continue
+
+            self.wait_idle()
+            if source == 'vdf':
+                try:
+                    data = load_appinfo().get(appID)
+                except AppInfoError as exc:
+                    LOG.debug("prefetch: not refreshing vdf info for %s: %s", appID, exc)
+                    continue
+                if data is None:
+                    continue
+            else:
+                LOG.info("prefetch: refreshing %s info for %s", source, appID)
+                data = fetch_info(appID, source)
+                self.budget.charge(len(json.dumps(data)))
+            write_cached_info(self.cfg.cache_dir, appID, source, data)
+
+    def fill_assets(self, appID, info):
+        manifest = Manifest(self.cfg.cache_dir, appID)
+        try:
+            for local_name, (url, asset, lang) in asset_queue(appID, info).items():
+                if local_name in manifest and os.path.exists(manifest.local_path(local_name)):
+                    continue
+                while True:
+                    self.wait_idle()
+                    try:
+                        cache_asset(manifest, url, local_name, asset, lang, progress=self.on_chunk)
+                        break
+                    except LaunchStarted:
+                        LOG.debug("prefetch: abandoned '%s' for a launch session", url)
+        finally:
+            manifest.save()
+
+    def prefetch(self, appID):
+        with phase('prefetch', appID=appID):
+            self.refresh_metadata(appID)
+            # Only what is cached by now: fetching the vdf info that
+            # appinfo.vdf didn't have would mean running steamcmd.
+            info = {}
+            for source in SOURCES:
+                data = read_cached_info(self.cfg.cache_dir, appID, source)
+                if data is not None:
+                    info[source] = data
+            if 'vdf' not in info:
+                LOG.debug("prefetch: no vdf info for %s cached or in appinfo.vdf; skipping", appID)
+                return
+            self.fill_assets(appID, info)
+            self.wait_idle()
+            make_derivatives(self.cfg.cache_dir, appID)
+
+    def run_pass(self):
+        self.budget.reset()
+        for appID in menu_app_ids(self.cfg.game_dir):
+            try:
+                self.prefetch(appID)
+            except SteamHTTPError as exc:
+                LOG.warning("prefetch: %s failed: %s", appID, exc)
+            except Exception:
+                LOG.exception("prefetch: %s failed", appID)
+
+    def run(self, once=False, interval=PASS_INTERVAL):
+        while True:
+            self.run_pass()
+            if once:
+                return
+            time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Warm the steam cache for every enabled menu entry while idle",
+    )
+    parser.add_argument("--once", action="store_true", help="Make one pass and exit")
+    parser.add_argument("--interval", type=int, default=PASS_INTERVAL, help="Seconds between passes")
+    parser.add_argument("--cpu", type=float, default=CPU_BUDGET, help="CPU budget, as a fraction of one CPU")
+    parser.add_argument(
+        "--bandwidth", type=int, default=BANDWIDTH_BUDGET // 1024,
+        help="Bandwidth budget, in KiB/s",
+    )
+    args = parser.parse_args()
+
+    configure_logging()
+    cfg = get_configuration()
+    budget = Budget(cpu=args.cpu, bandwidth=args.bandwidth * 1024)
+    try:
+        Prefetcher(cfg, budget).run(once=args.once, interval=args.interval)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
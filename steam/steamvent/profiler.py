@@ -0,0 +1,270 @@
+"""
+Opt-in profiling of steamvent's entry points.
+
+Set VENT_PROFILE to run vent, vent-installer, kiosk or setup.py under a
+profiler:
+
+    VENT_PROFILE=cprofile vent 221640
+    VENT_PROFILE=sample vent 221640
+
+'cprofile' traces every Python call, which is exact but slows the
+program down noticeably; 'sample' has a background thread record every
+thread's stack each VENT_PROFILE_INTERVAL seconds (SAMPLE_INTERVAL by
+default), which is cheap enough to leave on for a whole session.
+
+Each run writes its profile to cache/profiles/<timestamp>-<entry point>,
+as .prof (pstats) or .folded (collapsed stacks, which flamegraph.pl and
+speedscope read), with the external commands it ran alongside in
+.commands.json. The last MAX_PROFILES runs are kept.
+
+'vent-profile report' prints the functions with the most cumulative
+time and the slowest external commands from a profile; the most recent
+one by default.
+"""
+
+import argparse
+import collections
+import contextlib
+import cProfile
+import dataclasses
+import datetime
+import json
+import logging
+import os
+import pstats
+import sys
+import threading
+
+try:
+    from . import runner
+except ImportError:
+    # setup.py imports this module from within the package directory.
+    import runner
+
+
+LOG = logging.getLogger('vent')
+
+PROFILE_ENV = "VENT_PROFILE"
+INTERVAL_ENV = "VENT_PROFILE_INTERVAL"
+
+CPROFILE = 'cprofile'
+SAMPLE = 'sample'
+
+SAMPLE_INTERVAL = 0.01
+MAX_PROFILES = 20
+
+SUFFIXES = {CPROFILE: ".prof", SAMPLE: ".folded"}
+COMMANDS_SUFFIX = ".commands.json"
+
+
+def _frame_name(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{code.co_firstlineno}"
+
+
+class StackSampler(threading.Thread):
+    """
+    Count every thread's Python stack at a fixed interval.
+
+    :param interval: Seconds between samples.
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._done = threading.Event()
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == self.ident:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def dump(self, path):
+        with open(path, "w") as outfile:
+            for stack, count in self.stacks.most_common():
+                outfile.write(f"{stack} {count}\n")
+
+
+def requested():
+    """
+    The profiler VENT_PROFILE asks for, or None.
+    """
+    mode = os.environ.get(PROFILE_ENV, "").strip().lower()
+    if not mode:
+        return None
+    if mode not in SUFFIXES:
+        LOG.warning("Ignoring unknown %s=%s; use %s", PROFILE_ENV, mode, " or ".join(SUFFIXES))
+        return None
+    return mode
+
+
+def _write(profiles_dir, name, mode, profiler):
+    os.makedirs(profiles_dir, exist_ok=True)
+    stamp = datetime.datetime.now().strftime("%Y%m%dT%H%M%S")
+    stem = os.path.join(profiles_dir, f"{stamp}-{name}")
+    path = stem + SUFFIXES[mode]
+    if mode == CPROFILE:
+        profiler.dump_stats(path)
+    else:
+        profiler.dump(path)
+    with open(stem + COMMANDS_SUFFIX, "w") as outfile:
+        json.dump([dataclasses.asdict(s) for s in runner.stats().values()], outfile, indent=1)
+
+    # A run's files share its timestamp and name; keep the latest runs.
+    stems = sorted({entry.split(".", 1)[0] for entry in os.listdir(profiles_dir)})
+    for old in stems[:-MAX_PROFILES]:
+        for entry in os.listdir(profiles_dir):
+            if entry.split(".", 1)[0] == old:
+                os.unlink(os.path.join(profiles_dir, entry))
+    return path
+
+
+@contextlib.contextmanager
+def profiling(name, profiles_dir):
+    """
+    Profile the body if VENT_PROFILE asks for it.
+
+    :param name: Entry point, for the profile's file name.
+    :param profiles_dir: Callable returning the directory to write to;
+        only called when profiling, since it may need the configuration.
+    """
+    mode = requested()
+    if mode is None:
+        yield
+        return
+
+    if mode == CPROFILE:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        try:
+            interval = float(os.environ.get(INTERVAL_ENV, SAMPLE_INTERVAL))
+        except ValueError:
+            interval = SAMPLE_INTERVAL
+        profiler = StackSampler(interval)
+        profiler.start()
+    try:
+        yield
+    finally:
+        if mode == CPROFILE:
+            profiler.disable()
+        else:
+            profiler.stop()
+        try:
+            path = _write(profiles_dir(), name, mode, profiler)
+            LOG.info("Profile written to %s", path)
+        except Exception:
+            LOG.exception("Failed to write profile")
+
+
+# Report
+
+def folded_stats(path):
+    """
+    Per-function sample counts from a collapsed-stack file.
+
+    :return: (total samples, Counter of samples per thread, Counter of
+        cumulative, Counter of self).
+    """
+    total = 0
+    threads = collections.Counter()
+    cumulative = collections.Counter()
+    own = collections.Counter()
+    with open(path) as infile:
+        for line in infile:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            if not stack:
+                continue
+            count = int(count)
+            # The first entry is the thread's name.
+            thread, *frames = stack.split(";")
+            total += count
+            threads[thread] += count
+            for frame in set(frames):
+                cumulative[frame] += count
+            if frames:
+                own[frames[-1]] += count
+    return total, threads, cumulative, own
+
+
+def print_folded(path, top):
+    total, threads, cumulative, own = folded_stats(path)
+    print(f"{total} stack samples, across all threads")
+    if not total:
+        return
+    # Idle threads are sampled too; see which threads the time is in.
+    print(", ".join(f"{thread} {100.0 * count / total:.0f}%" for thread, count in threads.most_common()))
+    print(f"{'cumul%':>7s} {'self%':>6s}  function")
+    for frame, count in cumulative.most_common(top):
+        print(f"{100.0 * count / total:7.1f} {100.0 * own[frame] / total:6.1f}  {frame}")
+
+
+def print_commands(path, top):
+    try:
+        with open(path) as infile:
+            command_stats = [runner.CommandStats(**s) for s in json.load(infile)]
+    except FileNotFoundError:
+        return
+    command_stats.sort(key=lambda s: s.slowest, reverse=True)
+    print("\nSlowest external commands:")
+    print(runner.format_stats(command_stats[:top]))
+
+
+def report(path, top=25):
+    print(path)
+    if path.endswith(SUFFIXES[CPROFILE]):
+        pstats.Stats(path).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    else:
+        print_folded(path, top)
+    print_commands(path.rsplit(".", 1)[0] + COMMANDS_SUFFIX, top)
+
+
+def main():
+    from .common import profiles_dir as get_profiles_dir
+
+    parser = argparse.ArgumentParser(description="Profiles of steamvent runs; see VENT_PROFILE")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List the profiles kept")
+    report_parser = commands.add_parser("report", help="Summarise a profile")
+    report_parser.add_argument("path", nargs="?", help="Profile file; the most recent by default")
+    report_parser.add_argument("--top", type=int, default=25, help="Rows to show")
+    args = parser.parse_args()
+
+    if args.command == 'report' and args.path:
+        report(args.path, args.top)
+        return
+
+    profiles_dir = get_profiles_dir()
+    profiles = []
+    if profiles_dir.is_dir():
+        profiles = sorted(
+            entry for entry in os.listdir(profiles_dir)
+            if entry.endswith(tuple(SUFFIXES.values()))
+        )
+    if args.command == 'list':
+        for entry in profiles:
+            print(profiles_dir.joinpath(entry))
+    elif args.command == 'report':
+        if not profiles:
+            sys.exit(f"No profiles in {profiles_dir}; run with {PROFILE_ENV}=cprofile or sample")
+        report(str(profiles_dir.joinpath(profiles[-1])), args.top)
+
+
+if __name__ == '__main__':
+    main()
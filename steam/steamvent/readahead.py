@@ -0,0 +1,334 @@
+"""
+Page-cache readahead of game files while the splash is up.
+
+The first launch of a large game after boot is dominated by cold reads
+from disk. While the splash shows, the launcher asks the kernel to pull
+the game's files into the page cache (posix_fadvise WILLNEED), so the
+game finds them there when it opens them.
+
+Which files: the first time, the executable plus the largest files in
+the install directory. During each session a Tracer notes which files
+under the install directory the game has open or mapped in its first
+TRACE_WINDOW seconds; later launches read ahead exactly those, in the
+order they were first seen.
+
+Traces are sampled from /proc/<pid>/fd and /proc/<pid>/maps rather than
+recorded with fanotify, which needs CAP_SYS_ADMIN; a file the game opens
+and closes between two samples is missed, which only costs a slower
+first read of that file.
+"""
+
+import functools
+import logging
+import os
+from pathlib import Path
+import threading
+import time
+
+import vdf
+
+from .metadb import metadb
+
+
+LOG = logging.getLogger('vent')
+
+STEAM_ROOT = "~/.steam/steam"
+
+# Most bytes to read ahead for one launch; also capped at half of the
+# memory available, so readahead never pushes the game itself out.
+READAHEAD_BUDGET = 2 * 1024 ** 3
+
+# fadvise is issued in chunks this size, so cancelling takes effect
+# promptly even in the middle of a large file.
+CHUNK_SIZE = 16 * 1024 ** 2
+
+# Static plan: the executable plus this many of the largest files.
+STATIC_FILES = 32
+
+# Files the game opens in its first TRACE_WINDOW seconds make up its
+# trace; the game's fds and mappings are sampled every TRACE_INTERVAL.
+TRACE_WINDOW = 60
+TRACE_INTERVAL = 0.5
+
+
+def library_dirs(steam_root=None):
+    """
+    Every Steam library folder, the default one first.
+    """
+    root = Path(os.path.expanduser(steam_root or STEAM_ROOT))
+    dirs = [root]
+    try:
+        with open(root.joinpath("steamapps", "libraryfolders.vdf")) as infile:
+            folders = vdf.load(infile).get('libraryfolders', {})
+    except (OSError, SyntaxError, ValueError):
+        return dirs
+
+    for folder in folders.values():
+        path = folder.get('path') if isinstance(folder, dict) else folder
+        if path and Path(path) not in dirs:
+            dirs.append(Path(path))
+    return dirs
+
+
+def find_install_dir(info, steam_root=None):
+    """
+    Where an installed game lives, or None if it isn't installed.
+
+    :param info: As returned by valve.load_or_fetch_info.
+    """
+    installdir = info['vdf'].get('config', {}).get('installdir')
+    if not installdir:
+        return None
+    for library in library_dirs(steam_root):
+        path = library.joinpath("steamapps", "common", installdir)
+        if path.is_dir():
+            return path
+    return None
+
+
+def available_memory():
+    """
+    MemAvailable from /proc/meminfo, in bytes; None if unknown.
+    """
+    try:
+        with open("/proc/meminfo") as infile:
+            for line in infile:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def static_plan(install_dir, executable, count=STATIC_FILES):
+    """
+    The executable, then the largest files in the install directory.
+    """
+    sizes = []
+    for dirpath, _, filenames in os.walk(install_dir):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                sizes.append((os.path.getsize(path), path))
+            except OSError:
+                continue
+    sizes.sort(reverse=True)
+
+    plan = []
+    exe = os.path.join(install_dir, executable)
+    if os.path.isfile(exe):
+        plan.append(exe)
+    plan.extend(path for _, path in sizes[:count] if path != exe)
+    return plan
+
+
+def readahead_plan(cache_dir, appID, install_dir, executable):
+    """
+    Files to read ahead for a launch, from the app's trace if it has one.
+
+    :return: (kind, paths); kind is 'trace' or 'static'.
+    """
+    trace = [
+        path for path, _, _ in metadb(cache_dir).trace(appID)
+        if os.path.isfile(path)
+    ]
+    if trace:
+        return 'trace', trace
+    return 'static', static_plan(install_dir, executable)
+
+
+class Readahead(threading.Thread):
+    """
+    Read files into the page cache in the background.
+
+    :param plan: Callable returning the files to read ahead, most
+        important first. It is called on the readahead thread, since
+        working out a static plan walks the whole install directory.
+    :param budget: Most bytes to read ahead.
+    """
+    def __init__(self, plan, budget=READAHEAD_BUDGET):
+        super().__init__(name="readahead", daemon=True)
+        available = available_memory()
+        if available is not None:
+            budget = min(budget, available // 2)
+        self.plan = plan
+        self.paths = []
+        self.budget = budget
+        self.issued = 0
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def _advise(self, path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError as exc:
+            LOG.debug("readahead: skipping '%s': %s", path, exc)
+            return
+        try:
+            size = os.fstat(fd).st_size
+            offset = 0
+            while offset < size and self.issued < self.budget:
+                if self._cancel.is_set():
+                    return
+                length = min(CHUNK_SIZE, size - offset, self.budget - self.issued)
+                os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+                offset += length
+                self.issued += length
+        finally:
+            os.close(fd)
+
+    def run(self):
+        start = time.monotonic()
+        try:
+            self.paths = list(self.plan())
+        except Exception:
+            LOG.exception("Failed to plan readahead")
+            return
+        files = 0
+        for path in self.paths:
+            if self._cancel.is_set() or self.issued >= self.budget:
+                break
+            self._advise(path)
+            files += 1
+        LOG.debug(
+            "Read ahead %d bytes from %d/%d files%s",
+            self.issued, files, len(self.paths),
+            " (cancelled)" if self._cancel.is_set() else "",
+            extra={'phase': 'readahead', 'duration': time.monotonic() - start},
+        )
+
+
+def process_tree(pid):
+    """
+    A process and all of its descendants, parents first.
+    """
+    pids = [pid]
+    for parent in pids:
+        try:
+            tasks = os.listdir(f"/proc/{parent}/task")
+        except OSError:
+            continue
+        for tid in tasks:
+            try:
+                with open(f"/proc/{parent}/task/{tid}/children") as infile:
+                    pids.extend(int(child) for child in infile.read().split())
+            except (OSError, ValueError):
+                continue
+    return pids
+
+
+def _open_files(pid):
+    """
+    Paths a process has open or mapped.
+    """
+    paths = set()
+    try:
+        for fd in os.listdir(f"/proc/{pid}/fd"):
+            try:
+                paths.add(os.readlink(f"/proc/{pid}/fd/{fd}"))
+            except OSError:
+                continue
+    except OSError:
+        pass
+    try:
+        with open(f"/proc/{pid}/maps") as infile:
+            for line in infile:
+                fields = line.split(maxsplit=5)
+                if len(fields) == 6 and fields[5].startswith('/'):
+                    paths.add(fields[5].rstrip('\n'))
+    except OSError:
+        pass
+    return paths
+
+
+class Tracer(threading.Thread):
+    """
+    Record which files under the install directory a game reads early on.
+
+    :param pid: The game's process.
+    :param install_dir: Only files under here are recorded.
+    :param window: Seconds to sample for.
+    """
+    def __init__(self, pid, install_dir, window=TRACE_WINDOW, interval=TRACE_INTERVAL):
+        super().__init__(name="readahead-trace", daemon=True)
+        self.pid = pid
+        self.prefix = os.path.join(os.path.realpath(install_dir), '')
+        self.window = window
+        self.interval = interval
+        self.seen = {}
+        self._done = threading.Event()
+
+    def stop(self):
+        self._done.set()
+
+    def run(self):
+        start = time.monotonic()
+        while time.monotonic() - start < self.window:
+            if not os.path.exists(f"/proc/{self.pid}"):
+                break
+            offset = time.monotonic() - start
+            for pid in process_tree(self.pid):
+                for path in _open_files(pid):
+                    if path.startswith(self.prefix) and path not in self.seen:
+                        self.seen[path] = offset
+            if self._done.wait(self.interval):
+                break
+
+    def files(self):
+        """
+        The trace: (path, seconds into the session, size), in order.
+        """
+        files = []
+        for path, seen in sorted(self.seen.items(), key=lambda item: item[1]):
+            try:
+                files.append((path, seen, os.path.getsize(path)))
+            except OSError:
+                continue
+        return files
+
+
+class GameReadahead:
+    """
+    Readahead and tracing for one launch.
+
+    start() once the game has been dispatched, game_started() once the
+    game's process is found, and finish() when the session ends, which
+    cancels any readahead still running and saves the trace.
+    """
+    def __init__(self, cache_dir, appID):
+        self.cache_dir = cache_dir
+        self.appID = str(appID)
+        self.install_dir = None
+        self.readahead = None
+        self.tracer = None
+
+    def start(self, info, executable):
+        self.install_dir = find_install_dir(info)
+        if self.install_dir is None:
+            LOG.debug("appID=%s isn't installed where we can see it; no readahead", self.appID)
+            return
+        self.readahead = Readahead(functools.partial(self._plan, self.install_dir, executable))
+        self.readahead.start()
+
+    def _plan(self, install_dir, executable):
+        kind, paths = readahead_plan(self.cache_dir, self.appID, install_dir, executable)
+        LOG.debug("Reading ahead %d files for appID=%s from the %s plan", len(paths), self.appID, kind)
+        return paths
+
+    def game_started(self, pid):
+        if self.install_dir is not None:
+            self.tracer = Tracer(pid, self.install_dir)
+            self.tracer.start()
+
+    def finish(self):
+        if self.readahead:
+            self.readahead.cancel()
+        if self.tracer:
+            self.tracer.stop()
+            self.tracer.join()
+            files = self.tracer.files()
+            if files:
+                metadb(self.cache_dir).set_trace(self.appID, files)
+                LOG.debug("Recorded readahead trace of %d files for appID=%s", len(files), self.appID)
@@ -0,0 +1,216 @@
+import asyncio
+from dataclasses import dataclass
+import logging
+import os
+import shlex
+import subprocess
+import threading
+import time
+
+
+LOG = logging.getLogger('vent')
+
+
+@dataclass
+class CommandStats:
+    """
+    Accumulated timing for every invocation of one external command.
+    """
+    name: str
+    calls: int = 0
+    total: float = 0.0
+    slowest: float = 0.0
+    failures: int = 0
+    timeouts: int = 0
+
+    @property
+    def mean(self):
+        return self.total / self.calls if self.calls else 0.0
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def _record(name, duration, failed=False, timed_out=False):
+    with _stats_lock:
+        stats = _stats.setdefault(name, CommandStats(name))
+        stats.calls += 1
+        stats.total += duration
+        stats.slowest = max(stats.slowest, duration)
+        stats.failures += int(failed)
+        stats.timeouts += int(timed_out)
+
+
+def stats():
+    """
+    Snapshot of the per-command metrics collected so far.
+    """
+    with _stats_lock:
+        return {
+            name: CommandStats(**vars(value))
+            for name, value in _stats.items()
+        }
+
+
+def slowest(count=10):
+    """
+    The commands with the slowest single invocation, slowest first.
+    """
+    return sorted(
+        stats().values(), key=lambda s: s.slowest, reverse=True
+    )[:count]
+
+
+def summary(count=10):
+    """
+    Human-readable table of the slowest external commands.
+    """
+    return format_stats(slowest(count))
+
+
+def format_stats(command_stats):
+    """
+    Format CommandStats as a table, in the order given.
+    """
+    lines = [
+        f"{'command':20s} {'calls':>5s} {'total':>9s} {'mean':>8s} "
+        f"{'slowest':>8s} {'failed':>6s} {'timeout':>7s}"
+    ]
+    for s in command_stats:
+        lines.append(
+            f"{s.name:20s} {s.calls:5d} {s.total:9.3f} {s.mean:8.3f} "
+            f"{s.slowest:8.3f} {s.failures:6d} {s.timeouts:7d}"
+        )
+    return "\n".join(lines)
+
+
+def command_name(args):
+    return os.path.basename(str(args[0]))
+
+
+def _run_streaming(args, stream, timeout):
+    proc = subprocess.Popen(
+        args,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        errors='replace',
+    )
+    output = []
+
+    def _reader():
+        for line in proc.stdout:
+            output.append(line)
+            stream(line)
+
+    reader = threading.Thread(target=_reader, daemon=True)
+    reader.start()
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        reader.join()
+        proc.stdout.close()
+
+    return subprocess.CompletedProcess(args, proc.returncode, "".join(output))
+
+
+def run(*args, check=True, capture_output=False, stdout=None, stderr=None,
+        timeout=None, stream=None, name=None):
+    """
+    Run an external command, recording how long it took.
+
+    :param check: Raise CalledProcessError on a non-zero exit status.
+    :param capture_output: Capture stdout and stderr, as subprocess.run.
+    :param stdout: stdout for the child, as subprocess.run.
+    :param stderr: stderr for the child, as subprocess.run.
+    :param timeout: Seconds to wait before killing the command and
+        raising subprocess.TimeoutExpired; None waits forever.
+    :param stream: Optional callable receiving each line of combined
+        output as it is produced; the output is also returned.
+    :param name: Name to file metrics under; defaults to the basename
+        of the command.
+    """
+    name = name or command_name(args)
+    failed = timed_out = False
+    start = time.monotonic()
+    try:
+        if stream:
+            result = _run_streaming(args, stream, timeout)
+            if check:
+                result.check_returncode()
+        else:
+            result = subprocess.run(
+                args,
+                check=check,
+                capture_output=capture_output,
+                stdout=stdout,
+                stderr=stderr,
+                timeout=timeout,
+            )
+        failed = bool(result.returncode)
+        return result
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        raise
+    except (subprocess.CalledProcessError, OSError):
+        failed = True
+        raise
+    finally:
+        duration = time.monotonic() - start
+        _record(name, duration, failed, timed_out)
+        LOG.debug(
+            "exit> %s", name,
+            extra={'phase': 'exec', 'duration': duration},
+        )
+
+
+async def arun(*args, check=True, capture_output=False, timeout=None, name=None):
+    """
+    asyncio variant of run(), so independent commands can overlap.
+
+    e.g. ``await asyncio.gather(arun("keyd", "reload"), arun(...))``
+    """
+    name = name or command_name(args)
+    pipe = subprocess.PIPE if capture_output else None
+    failed = timed_out = False
+    LOG.debug("exec> %s", " ".join(shlex.quote(str(arg)) for arg in args))
+    start = time.monotonic()
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *args, stdout=pipe, stderr=pipe
+        )
+        try:
+            out, err = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            timed_out = True
+            proc.kill()
+            await proc.wait()
+            raise subprocess.TimeoutExpired(args, timeout)
+        except asyncio.CancelledError:
+            # Don't leave the child running when a gather() we are part
+            # of fails.
+            failed = True
+            proc.kill()
+            await proc.wait()
+            raise
+
+        result = subprocess.CompletedProcess(args, proc.returncode, out, err)
+        failed = bool(result.returncode)
+        if check:
+            result.check_returncode()
+        return result
+    except OSError:
+        failed = True
+        raise
+    finally:
+        duration = time.monotonic() - start
+        _record(name, duration, failed, timed_out)
+        LOG.debug(
+            "exit> %s", name,
+            extra={'phase': 'exec', 'duration': duration},
+        )
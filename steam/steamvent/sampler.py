@@ -0,0 +1,333 @@
+"""
+In-session resource sampler.
+
+While a game runs, a background thread in the 'vent' session samples,
+every SAMPLE_INTERVAL seconds:
+
+- the game's process tree: CPU time, resident memory and bytes read
+  and written;
+- pressure stall information, /proc/pressure/{cpu,memory,io};
+- the hottest hwmon temperature sensor and the CPUs' thermal throttle
+  counters.
+
+Samples are packed into a fixed-size ring in memory (the last
+RING_CAPACITY samples; an hour at the default rate) and stored once,
+with the session, in the history database when the game exits.
+'vent-sampler summary' reads them back and flags sessions that stalled,
+ran hot or were throttled, for when a cabinet "feels laggy".
+"""
+
+import argparse
+import datetime
+import logging
+import math
+import os
+import struct
+import threading
+import time
+
+from .common import get_configuration
+from .history import History
+from .performance import sysfs_root
+from .readahead import process_tree
+
+
+LOG = logging.getLogger('vent')
+
+SAMPLE_INTERVAL = 2.0
+RING_CAPACITY = 1800
+
+# One sample: seconds since the start, CPU seconds, RSS, bytes read,
+# bytes written, PSI totals in microseconds (cpu some, memory some,
+# memory full, io some, io full), hottest temperature in degrees C
+# (NaN if there are no sensors), thermal throttle events.
+SAMPLE = struct.Struct("<fdQQQQQQQQfI")
+SAMPLE_FIELDS = (
+    't', 'cpu', 'rss', 'read', 'write',
+    'cpu_some', 'memory_some', 'memory_full', 'io_some', 'io_full',
+    'temp', 'throttle',
+)
+# Leading byte of a stored ring, in case SAMPLE ever changes.
+SAMPLE_VERSION = 1
+
+PSI_RESOURCES = ('cpu', 'memory', 'io')
+
+# Summary thresholds: percent of wall time stalled, averaged over the
+# session or within a single sample interval; degrees C.
+STALL_AVERAGE = 10.0
+STALL_PEAK = 50.0
+HOT_TEMPERATURE = 85.0
+
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class SampleRing:
+    """
+    A fixed-size ring of packed samples.
+
+    :param capacity: Number of samples kept; older ones are overwritten.
+    """
+    def __init__(self, capacity=RING_CAPACITY):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * SAMPLE.size)
+        self.count = 0
+
+    def append(self, *values):
+        SAMPLE.pack_into(self.buffer, (self.count % self.capacity) * SAMPLE.size, *values)
+        self.count += 1
+
+    def dump(self):
+        """
+        The samples, oldest first, as stored in the history database.
+        """
+        if self.count <= self.capacity:
+            data = self.buffer[:self.count * SAMPLE.size]
+        else:
+            split = (self.count % self.capacity) * SAMPLE.size
+            data = self.buffer[split:] + self.buffer[:split]
+        return bytes([SAMPLE_VERSION]) + bytes(data)
+
+
+def load_samples(data):
+    """
+    Unpack a stored ring into a list of dicts.
+    """
+    if not data or data[0] != SAMPLE_VERSION:
+        return []
+    return [dict(zip(SAMPLE_FIELDS, values)) for values in SAMPLE.iter_unpack(data[1:])]
+
+
+# Readers
+
+def _tree_usage(pid):
+    """
+    (CPU seconds, RSS, bytes read, bytes written) for a process tree;
+    None once the process has gone.
+    """
+    if not os.path.exists(f"/proc/{pid}"):
+        return None
+    cpu = rss = read = write = 0
+    for p in process_tree(pid):
+        try:
+            with open(f"/proc/{p}/stat") as infile:
+                fields = infile.read().rsplit(')', 1)[1].split()
+            # utime, stime, cutime, cstime; fields 14-17 of stat.
+            cpu += sum(int(value) for value in fields[11:15])
+            with open(f"/proc/{p}/statm") as infile:
+                rss += int(infile.read().split()[1]) * _PAGE_SIZE
+        except (OSError, IndexError, ValueError):
+            continue
+        try:
+            with open(f"/proc/{p}/io") as infile:
+                for line in infile:
+                    key, _, value = line.partition(':')
+                    if key == 'read_bytes':
+                        read += int(value)
+                    elif key == 'write_bytes':
+                        write += int(value)
+        except (OSError, ValueError):
+            pass
+    return cpu / _CLOCK_TICKS, rss, read, write
+
+
+def _psi_totals():
+    """
+    (cpu some, memory some, memory full, io some, io full), in us.
+    """
+    totals = {}
+    for resource in PSI_RESOURCES:
+        try:
+            with open(f"/proc/pressure/{resource}") as infile:
+                for line in infile:
+                    kind, *fields = line.split()
+                    for field in fields:
+                        if field.startswith("total="):
+                            totals[f"{resource}_{kind}"] = int(field[6:])
+        except (OSError, ValueError):
+            continue
+    return tuple(
+        totals.get(key, 0)
+        for key in ('cpu_some', 'memory_some', 'memory_full', 'io_some', 'io_full')
+    )
+
+
+def _temperature(root):
+    hottest = math.nan
+    for path in root.glob("class/hwmon/hwmon*/temp*_input"):
+        try:
+            value = int(path.read_text()) / 1000.0
+        except (OSError, ValueError):
+            continue
+        if math.isnan(hottest) or value > hottest:
+            hottest = value
+    return hottest
+
+
+def _throttle_count(root):
+    count = 0
+    for path in root.glob("devices/system/cpu/cpu[0-9]*/thermal_throttle/*_throttle_count"):
+        try:
+            count += int(path.read_text())
+        except (OSError, ValueError):
+            continue
+    return count
+
+
+class Sampler:
+    """
+    Sample a game's resource use from a background thread.
+
+    :param interval: Seconds between samples.
+    :param capacity: Ring size, in samples.
+    """
+    def __init__(self, interval=SAMPLE_INTERVAL, capacity=RING_CAPACITY):
+        self.interval = interval
+        self.ring = SampleRing(capacity)
+        self.root = sysfs_root()
+        self._done = threading.Event()
+        self._thread = None
+
+    def sample(self, pid, start):
+        usage = _tree_usage(pid)
+        if usage is None:
+            return
+        self.ring.append(
+            time.monotonic() - start,
+            *usage,
+            *_psi_totals(),
+            _temperature(self.root),
+            _throttle_count(self.root),
+        )
+
+    def _run(self, pid):
+        start = time.monotonic()
+        while True:
+            try:
+                self.sample(pid, start)
+            except Exception:
+                LOG.exception("Resource sampler failed; stopping it")
+                return
+            if self._done.wait(self.interval):
+                return
+
+    def start(self, pid):
+        """
+        Start sampling the process tree of pid.
+        """
+        self._thread = threading.Thread(
+            target=self._run, args=(pid,), name="sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop sampling.
+
+        :return: (interval, packed samples), for SessionRecord.samples;
+            None if it never started.
+        """
+        if self._thread is None:
+            return None
+        self._done.set()
+        self._thread.join()
+        return self.interval, self.ring.dump()
+
+
+# Summary
+
+def summarize(samples):
+    """
+    Reduce a session's samples to a few figures.
+
+    :return: dict, or None if there are too few samples.
+    """
+    if len(samples) < 2:
+        return None
+    first, last = samples[0], samples[-1]
+    elapsed = last['t'] - first['t']
+    if elapsed <= 0:
+        return None
+
+    summary = {
+        'elapsed': elapsed,
+        'cpu': 100.0 * (last['cpu'] - first['cpu']) / elapsed,
+        'rss': max(s['rss'] for s in samples),
+        'read': last['read'] - first['read'],
+        'write': last['write'] - first['write'],
+        'throttle': last['throttle'] - first['throttle'],
+    }
+    temps = [s['temp'] for s in samples if not math.isnan(s['temp'])]
+    summary['temp'] = max(temps) if temps else None
+
+    for key in ('cpu_some', 'memory_some', 'io_some'):
+        # PSI totals are microseconds stalled; as a percentage of wall time.
+        summary[key] = (last[key] - first[key]) / (elapsed * 1e4)
+        summary[f"{key}_peak"] = max(
+            (b[key] - a[key]) / ((b['t'] - a['t']) * 1e4)
+            for a, b in zip(samples, samples[1:]) if b['t'] > a['t']
+        )
+    return summary
+
+
+def flags(summary):
+    """
+    Problems worth a look in a session summary.
+    """
+    found = []
+    for resource in PSI_RESOURCES:
+        key = f"{resource}_some"
+        if summary[key] >= STALL_AVERAGE or summary[f"{key}_peak"] >= STALL_PEAK:
+            found.append(f"{resource}-stall")
+    if summary['temp'] is not None and summary['temp'] >= HOT_TEMPERATURE:
+        found.append("hot")
+    if summary['throttle']:
+        found.append("throttled")
+    return found
+
+
+def print_summary(cfg, days=None, flagged_only=False):
+    since = time.time() - days * 86400 if days else None
+    with History(cfg.history_db) as history:
+        sessions = history.samples(since)
+
+    print(
+        f"{'started':16s} {'appID':>8s} {'played':>7s} {'cpu%':>5s} {'rss MiB':>7s} "
+        f"{'stall cpu/mem/io %':>20s} {'temp':>5s}  flags"
+    )
+    for session in sessions:
+        summary = summarize(load_samples(session['data']))
+        if summary is None:
+            continue
+        found = flags(summary)
+        if flagged_only and not found:
+            continue
+        started = datetime.datetime.fromtimestamp(session['started']).strftime("%Y-%m-%d %H:%M")
+        stalls = "/".join(
+            f"{summary[f'{r}_some']:.0f}({summary[f'{r}_some_peak']:.0f})" for r in PSI_RESOURCES
+        )
+        temp = f"{summary['temp']:.0f}C" if summary['temp'] is not None else "-"
+        print(
+            f"{started:16s} {session['appID']:>8s} {summary['elapsed'] / 60:6.1f}m "
+            f"{summary['cpu']:5.0f} {summary['rss'] / 2**20:7.0f} {stalls:>20s} {temp:>5s}  "
+            f"{' '.join(found)}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resource samples from game sessions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    summary = commands.add_parser(
+        "summary",
+        help="Summarise each sampled session; stalls are average (peak) percent",
+    )
+    summary.add_argument("--days", type=int, help="Only show the last N days")
+    summary.add_argument("--flagged", action="store_true", help="Only show sessions with problems")
+    args = parser.parse_args()
+
+    if args.command == 'summary':
+        print_summary(get_configuration(), args.days, args.flagged)
+
+
+if __name__ == '__main__':
+    main()
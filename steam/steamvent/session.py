@@ -0,0 +1,145 @@
+import fcntl
+import logging
+import os
+from pathlib import Path
+import sys
+import time
+
+
+LOG = logging.getLogger('vent')
+
+
+class LaunchLock:
+    """
+    Single-flight lock serialising 'vent' launch sessions.
+
+    The lock is an flock() held on a file in the run directory for the
+    lifetime of the session, so it is released by the kernel even if the
+    launcher dies. The file records the appID and pid of the holder, and
+    a sibling progress file mirrors everything the session prints, so
+    that a duplicate request for the same game can follow along instead
+    of launching it a second time.
+
+    :param run_dir: Directory to keep the lock and progress files in.
+    """
+    def __init__(self, run_dir):
+        self.lock_path = Path(run_dir, "vent.lock")
+        self.progress_path = Path(run_dir, "vent.progress")
+        self._fd = None
+        self._progress = None
+
+    def acquire(self, appID):
+        """
+        Try to take the lock for appID without blocking.
+
+        :return: True if we now own the session, False if someone else does.
+        """
+        os.makedirs(self.lock_path.parent, exist_ok=True)
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{appID} {os.getpid()}\n".encode())
+        self._fd = fd
+        self._progress = open(self.progress_path, "w", encoding='UTF-8')
+        return True
+
+    def release(self):
+        if self._progress is not None:
+            self._progress.close()
+            self._progress = None
+        if self._fd is not None:
+            os.ftruncate(self._fd, 0)
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+    def _read_holder(self):
+        try:
+            with open(self.lock_path, "r", encoding='UTF-8') as infile:
+                fields = infile.read().split()
+        except FileNotFoundError:
+            return None, None
+        if len(fields) != 2:
+            return None, None
+        try:
+            return fields[0], int(fields[1])
+        except ValueError:
+            return None, None
+
+    def holder(self, retries=20, delay=0.05):
+        """
+        Identify the session currently holding the lock.
+
+        The holder writes its identity immediately after locking, so
+        retry briefly if we catch it in between.
+
+        :return: (appID, pid) tuple, or (None, None) if unknown.
+        """
+        for _ in range(retries):
+            appID, pid = self._read_holder()
+            if pid is not None:
+                return appID, pid
+            time.sleep(delay)
+        return None, None
+
+    def is_held(self):
+        """
+        Check whether any process currently holds the lock.
+
+        Goes by the pid the holder recorded rather than probing the
+        flock(), which would make a launch's acquire() fail if the two
+        happened to overlap. release() empties the file, and a holder
+        that was killed leaves a pid that no longer exists.
+        """
+        _, pid = self._read_holder()
+        if pid is None:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def progress(self, text='', end='\n'):
+        """
+        Print session progress, mirroring it for attached observers.
+        """
+        print(text, end=end)
+        sys.stdout.flush()
+        if self._progress is not None:
+            self._progress.write(text + end)
+            self._progress.flush()
+
+    def follow(self, interval=0.25):
+        """
+        Replay and follow the progress output of the running session
+        until it releases the lock.
+        """
+        try:
+            infile = open(self.progress_path, "r", encoding='UTF-8')
+        except FileNotFoundError:
+            return
+
+        with infile:
+            while True:
+                done = not self.is_held()
+                chunk = infile.read()
+                if chunk:
+                    print(chunk, end='')
+                    sys.stdout.flush()
+                if done:
+                    break
+                time.sleep(interval)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
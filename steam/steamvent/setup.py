@@ -1,16 +1,16 @@
 #!/usr/bin/env python3
 
+import asyncio
 from configparser import RawConfigParser
 import json
 import logging
 import os
 from pwd import getpwnam
 import shutil
-import subprocess
 import sys
 from xml.etree import ElementTree
 
-from common import ex, mklink, main_wrapper, have_binary, get_configuration
+from common import aex, ex, mklink, main_wrapper, have_binary, get_configuration
 import keycfg
 
 LOG = logging.getLogger('vent')
@@ -29,6 +29,27 @@ try:
 except ModuleNotFoundError:
     pass
 
+_HAVE_PIL = False
+try:
+    import PIL
+    _HAVE_PIL = True
+except ModuleNotFoundError:
+    pass
+
+_HAVE_DBUS = False
+try:
+    import dbus
+    _HAVE_DBUS = True
+except ModuleNotFoundError:
+    pass
+
+_HAVE_XLIB = False
+try:
+    import Xlib
+    _HAVE_XLIB = True
+except ModuleNotFoundError:
+    pass
+
 
 def add_steam_system(config_path, steam_path):
     tree = ElementTree.parse(config_path)
@@ -54,6 +75,27 @@ def add_steam_system(config_path, steam_path):
     tree.write(config_path)
 
 
+async def _gather(jobs):
+    await asyncio.gather(*jobs)
+
+
+async def steamcmd_sources():
+    await aex("add-apt-repository", "-y", "multiverse")
+
+    # Steam requires the user to interactively accept the steam license.
+    # We've got better things to do with our life though,
+    # so procedurally accept it for an unattended install.
+    await aex("sh", "-c", 'echo "steamcmd steam/license note" | debconf-set-selections', check=False)
+    await aex("sh", "-c", 'echo "steamcmd steam/purge note" | debconf-set-selections', check=False)
+    await aex(
+        "sh", "-c",
+        'echo "steamcmd steam/question select I AGREE"'
+        ' | debconf-set-selections',
+        check=False
+    )
+    await aex("dpkg", "--add-architecture", "i386")
+
+
 def external_tool_setup():
     """
     Ensure that all external tooling required by the 'vent' launcher is installed and available.
@@ -80,6 +122,14 @@ def external_tool_setup():
       Format files, principally used to identify image assets and to
       identify the executable binary to launch a particular game. Also
       used to map steam appIDs to human-readable game names.
+    - python3-pil: the 'PIL' (Pillow) python library, used to pre-scale
+      splash and gamelist images to the cabinet's display at install
+      time, so they aren't decoded and scaled at full size on every view.
+    - python3-dbus: the 'dbus' python library, used to write the splash
+      screen settings through the xfconf D-Bus interface in one round
+      trip instead of spawning xfconf-query repeatedly.
+    - python3-xlib: the 'Xlib' python library, used to notice when a
+      game's window appears, to drop the splash screen at that moment.
 
     All packages except for 'keyd' will be installed through apt/dpkg,
     using a .deb file for the steam client if necessary. This function
@@ -139,25 +189,20 @@ def external_tool_setup():
     # so we can detect its presence appropriately.
     os.environ['PATH'] = os.environ['PATH'] + ':/usr/games'
 
+    # Downloading the client and adding steamcmd's repository both wait
+    # on the network and don't depend on each other, so overlap them.
+    jobs = []
     if not have_binary("steam"):
-        ex("wget", "https://repo.steampowered.com/steam/archive/stable/steam_latest.deb")
+        jobs.append(aex("wget", "https://repo.steampowered.com/steam/archive/stable/steam_latest.deb"))
         packages.append("./steam_latest.deb")
 
-    # Steam requires the user to interactively accept the steam license.
-    # We've got better things to do with our life though,
-    # so procedurally accept it for an unattended install.
     if not have_binary("steamcmd"):
-        ex("add-apt-repository", "-y", "multiverse")
-        subprocess.run('echo "steamcmd steam/license note" | debconf-set-selections', shell=True)
-        subprocess.run('echo "steamcmd steam/purge note" | debconf-set-selections', shell=True)
-        subprocess.run(
-            'echo "steamcmd steam/question select I AGREE"'
-            ' | debconf-set-selections',
-            shell=True
-        )
-        ex("dpkg", "--add-architecture", "i386")
+        jobs.append(steamcmd_sources())
         packages.append("steamcmd")
 
+    if jobs:
+        asyncio.run(_gather(jobs))
+
     # xfconf-query *should* come along for the ride when we install xfce4-terminal.
     if not (have_binary("xfce4-terminal") or have_binary("xfconf-query")):
         packages.append("xfce4-terminal")
@@ -168,6 +213,15 @@ def external_tool_setup():
     if not _HAVE_VDF:
         packages.append("python3-vdf")
 
+    if not _HAVE_PIL:
+        packages.append("python3-pil")
+
+    if not _HAVE_DBUS:
+        packages.append("python3-dbus")
+
+    if not _HAVE_XLIB:
+        packages.append("python3-xlib")
+
     if packages:
         if not ran_update:
             ex("apt", "update", "-y")
@@ -217,6 +271,21 @@ def keyd_setup(config):
     ex("usermod", "-aG", "keyd", config.user)
 
 
+def performance_setup(config):
+    # Let the kiosk user switch CPU governors for per-game performance
+    # profiles (see performance.py) ...
+    with open("/etc/tmpfiles.d/steamvent-cpufreq.conf", "w") as outfile:
+        outfile.write(
+            "z /sys/devices/system/cpu/cpu*/cpufreq/scaling_governor "
+            f"0664 root {config.user} -\n"
+        )
+    ex("systemd-tmpfiles", "--create", "/etc/tmpfiles.d/steamvent-cpufreq.conf")
+
+    # ... and raise a game's priority as far as nice -10.
+    with open("/etc/security/limits.d/steamvent.conf", "w") as outfile:
+        outfile.write(f"{config.user} - nice -10\n")
+
+
 def first_run_setup(config):
     ex("systemctl", "restart", "systemd-timesyncd")
     external_tool_setup()
@@ -231,6 +300,7 @@ def first_run_setup(config):
         shutil.chown(p, user=config.user, group=config.user)
 
     keyd_setup(config)
+    performance_setup(config)
     add_steam_system(config.es_config, config.game_dir)
 
     # Prime steamcmd and fetch updates from valve, etc.
@@ -0,0 +1,148 @@
+import logging
+import queue
+import shlex
+import threading
+
+from .common import ex
+
+
+LOG = logging.getLogger('vent')
+
+_HAVE_DBUS = False
+try:
+    import dbus
+    _HAVE_DBUS = True
+except ModuleNotFoundError:
+    pass
+
+
+CHANNEL = "xfce4-terminal"
+FONT = "Monospace Bold 20"
+
+# Properties to reset in order to remove the splash image.
+BACKGROUND_PROPERTIES = (
+    "/background-image-file",
+    "/background-mode",
+    "/background-image-style",
+)
+
+
+def splash_properties(img):
+    """
+    Compute the xfce4-terminal property writes needed to show a splash.
+
+    :param img: Path to the splash image, or None to clear it.
+    :return: List of (property, value) pairs; a value of None means reset.
+    """
+    props = [("/font-name", FONT)]
+    if img:
+        props.extend([
+            ("/background-image-file", str(img)),
+            ("/background-mode", "TERMINAL_BACKGROUND_IMAGE"),
+            ("/background-image-style", "TERMINAL_BACKGROUND_STYLE_SCALED"),
+        ])
+    else:
+        props.extend((prop, None) for prop in BACKGROUND_PROPERTIES)
+    return props
+
+
+def _write_dbus(props):
+    bus = dbus.SessionBus()
+    xfconf = dbus.Interface(
+        bus.get_object("org.xfce.Xfconf", "/org/xfce/Xfconf"),
+        "org.xfce.Xfconf",
+    )
+    for prop, value in props:
+        if value is None:
+            xfconf.ResetProperty(CHANNEL, prop, False)
+        else:
+            xfconf.SetProperty(CHANNEL, prop, dbus.String(value))
+
+
+def _write_batched(props):
+    cmds = []
+    for prop, value in props:
+        if value is None:
+            cmd = ["xfconf-query", "-c", CHANNEL, "-p", prop, "-r"]
+        else:
+            cmd = [
+                "xfconf-query",
+                "--create",
+                "--type", "string",
+                "-c", CHANNEL,
+                "-p", prop,
+                "-s", value,
+            ]
+        cmds.append(" ".join(shlex.quote(arg) for arg in cmd))
+
+    # Resetting a property that doesn't exist fails; that's fine, so
+    # don't chain the commands together with '&&'.
+    ret = ex("sh", "-c", "; ".join(cmds), check=False)
+    if ret.returncode == 127:
+        raise FileNotFoundError("xfconf-query")
+
+
+def write_properties(props):
+    """
+    Write a batch of xfce4-terminal properties in a single round trip.
+
+    Uses the xfconf D-Bus interface when python3-dbus is available,
+    falling back to a single batched shell invocation of xfconf-query.
+    """
+    if _HAVE_DBUS:
+        try:
+            _write_dbus(props)
+            return
+        except dbus.DBusException:
+            LOG.warning("xfconf D-Bus write failed, falling back to xfconf-query")
+
+    try:
+        _write_batched(props)
+    except FileNotFoundError:
+        LOG.warning("Could not change terminal background. Is xfconf-query installed?")
+
+
+class Splash:
+    """
+    Asynchronous splash screen writer.
+
+    Property writes are handed to a single background thread so they
+    never hold up keymap switching or game dispatch, while still being
+    applied in the order they were requested.
+    """
+    def __init__(self):
+        self.shown = False
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="splash", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            props = self._queue.get()
+            if props is None:
+                break
+            try:
+                write_properties(props)
+            except Exception:
+                LOG.exception("Failed to update splash screen")
+
+    def show(self, img):
+        self.shown = True
+        self._queue.put(splash_properties(img))
+
+    def remove(self):
+        # Removed as soon as the game's window appears, and again, to
+        # no effect, when the session ends.
+        if not self.shown:
+            return
+        self.shown = False
+        self._queue.put([(prop, None) for prop in BACKGROUND_PROPERTIES])
+
+    def close(self):
+        """
+        Wait for all pending writes to finish and stop the writer.
+        """
+        self._queue.put(None)
+        self._thread.join()
@@ -1,9 +1,30 @@
+import logging
 import sys
 import time
 import subprocess
 
-from .common import ex, switch_keymap, get_configuration
+from .common import ex, switch_keymap, get_configuration, profiles_dir
+from .display import MODE_STATE_NAME, recover_mode, sync_launch_options
+from .history import fold_into_gamelist
 from .lolfiglet import lolfiglet
+from .performance import STATE_NAME, recover
+from .prefetch import PREFETCH_COMMAND
+from .profiler import profiling
+
+
+LOG = logging.getLogger('vent')
+
+
+def start_prefetcher():
+    try:
+        return subprocess.Popen(
+            PREFETCH_COMMAND,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    except OSError:
+        LOG.exception("Couldn't start the prefetcher")
+        return None
 
 
 def do_kiosk():
@@ -12,11 +33,14 @@ def do_kiosk():
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
     )
+    prefetcher = start_prefetcher()
 
     try:
         lolfiglet("SUPER JOETENDO")
         ex("emulationstation", "--force-kiosk", "--no-exit")
     finally:
+        if prefetcher:
+            prefetcher.terminate()
         proc.terminate()
 
 
@@ -29,8 +53,27 @@ def kiosk():
         config.default_keymap
     )
 
+    # Put back any performance profile or screen mode a killed launcher
+    # left applied.
+    recover(config.run_dir.joinpath(STATE_NAME))
+    recover_mode(config.run_dir.joinpath(MODE_STATE_NAME))
+
+    # Steam only reads launch options at startup; see display.py.
+    try:
+        sync_launch_options(config)
+    except Exception:
+        LOG.exception("Failed to update launch options from display profiles")
+
+    # EmulationStation rewrites the gamelist when it exits, so fold in
+    # launch history before it starts.
+    try:
+        fold_into_gamelist(config)
+    except Exception:
+        LOG.exception("Failed to fold launch history into the gamelist")
+
     try:
-        do_kiosk()
+        with profiling("kiosk", profiles_dir):
+            do_kiosk()
     finally:
         switch_keymap(
             config.active_keymap,
@@ -0,0 +1,100 @@
+"""
+Hand steam:// URIs to the running Steam client.
+
+The Linux client listens on a FIFO, ~/.steam/steam.pipe, for the command
+lines of later 'steam' invocations; that's how the bootstrap script
+forwards a URI to an already running client. Writing the line ourselves
+skips starting the bootstrap, and its runtime checks, on every launch.
+
+If the pipe is missing, or nothing is reading it (the client isn't
+running), the 'steam' bootstrap is used instead, which starts the client
+if need be.
+"""
+
+import errno
+import logging
+import os
+import shlex
+import stat
+import time
+
+from .common import ex
+
+
+LOG = logging.getLogger('vent')
+
+STEAM_PIPE = "~/.steam/steam.pipe"
+
+# How the dispatch was done.
+PIPE = 'pipe'
+BOOTSTRAP = 'bootstrap'
+
+
+class PipeUnavailable(Exception):
+    """
+    The client's pipe is missing, stale or full.
+    """
+
+
+def pipe_path():
+    return os.path.expanduser(STEAM_PIPE)
+
+
+def write_pipe(uri, path=None):
+    """
+    Write a command line for the URI to the client's pipe.
+
+    The pipe is opened non-blocking, so a pipe with no reader fails
+    immediately (ENXIO) instead of hanging until a client appears.
+
+    :raises PipeUnavailable: if the URI couldn't be delivered.
+    """
+    path = path or pipe_path()
+    line = (shlex.join(["steam", uri]) + "\n").encode()
+    try:
+        if not stat.S_ISFIFO(os.stat(path).st_mode):
+            raise PipeUnavailable(f"{path} is not a FIFO")
+        fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+    except FileNotFoundError:
+        raise PipeUnavailable(f"{path} does not exist")
+    except OSError as exc:
+        if exc.errno == errno.ENXIO:
+            raise PipeUnavailable(f"{path} is stale; no Steam client is reading it")
+        raise PipeUnavailable(f"{path}: {exc}")
+
+    try:
+        # Writes up to PIPE_BUF bytes are atomic, so the client never
+        # sees half a command line.
+        written = os.write(fd, line)
+    except BlockingIOError:
+        raise PipeUnavailable(f"{path} is full; the Steam client isn't keeping up")
+    finally:
+        os.close(fd)
+
+    if written != len(line):
+        raise PipeUnavailable(f"short write to {path}")
+
+
+def dispatch(uri, path=None, timeout=60):
+    """
+    Send a steam:// URI to Steam, over the pipe if possible.
+
+    :param uri: e.g. steam://rungameid/221640
+    :param path: Pipe to use; defaults to STEAM_PIPE.
+    :param timeout: Timeout for the bootstrap fallback, in seconds.
+    :return: PIPE or BOOTSTRAP.
+    """
+    start = time.monotonic()
+    try:
+        write_pipe(uri, path)
+        method = PIPE
+    except PipeUnavailable as exc:
+        LOG.info("Falling back to the steam bootstrap: %s", exc)
+        ex("steam", uri, timeout=timeout)
+        method = BOOTSTRAP
+
+    LOG.debug(
+        "Dispatched %s via %s", uri, method,
+        extra={'phase': f"dispatch-{method}", 'duration': time.monotonic() - start},
+    )
+    return method
@@ -0,0 +1,174 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import os
+import subprocess
+import threading
+
+from .common import ex, have_binary
+
+
+LOG = logging.getLogger('vent')
+
+
+TRANSCODED_NAME = "trailer_es.mp4"
+
+# Limits for screensaver/gamelist clips. The length matches the
+# ScreenSaverSwapVideoTimeout configured for EmulationStation in
+# deploy.sh; ES never plays more than that of any one clip.
+MAX_HEIGHT = 480
+MAX_SECONDS = 45
+VIDEO_BITRATE = "1000k"
+VIDEO_MAXRATE = "1200k"
+VIDEO_BUFSIZE = "2400k"
+AUDIO_BITRATE = "96k"
+
+# Seconds to let one ffmpeg run before giving up on the trailer.
+TRANSCODE_TIMEOUT = 600
+
+
+def ffmpeg_args(source, target):
+    return [
+        "nice", "-n", "10",
+        "ffmpeg",
+        "-nostdin",
+        "-y",
+        "-loglevel", "error",
+        "-i", source,
+        "-t", str(MAX_SECONDS),
+        "-vf", f"scale=-2:'min({MAX_HEIGHT},ih)'",
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-b:v", VIDEO_BITRATE,
+        "-maxrate", VIDEO_MAXRATE,
+        "-bufsize", VIDEO_BUFSIZE,
+        "-c:a", "aac",
+        "-b:a", AUDIO_BITRATE,
+        "-movflags", "+faststart",
+        "-f", "mp4",
+        target,
+    ]
+
+
+def transcoded_trailer(local_dir):
+    """
+    Find the screensaver-friendly trailer for an app, if it's ready.
+    """
+    path = os.path.join(local_dir, TRANSCODED_NAME)
+    if os.path.exists(path):
+        return path
+    return None
+
+
+class Transcoder:
+    """
+    Background worker pool for trailer transcodes.
+
+    Jobs are recorded in a queue file in the cache directory before
+    they start and removed once they finish, so work interrupted by a
+    reboot or a ^C can be picked back up with resume(). Output is
+    written to a temporary file and only moved into place when
+    complete, so a partially transcoded clip is never used.
+
+    :param cache_dir: The steam cache directory.
+    :param workers: Number of concurrent ffmpeg processes.
+    """
+    def __init__(self, cache_dir, workers=2):
+        self.cache_dir = cache_dir
+        self.queue_path = os.path.join(cache_dir, "transcode.json")
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="transcode"
+        )
+        self._futures = {}
+
+    @staticmethod
+    def available():
+        return have_binary("ffmpeg")
+
+    def _load(self):
+        try:
+            with open(self.queue_path, "r") as infile:
+                return json.load(infile)
+        except FileNotFoundError:
+            return {}
+
+    def _save(self, jobs):
+        tmp = self.queue_path + ".tmp"
+        with open(tmp, "w") as outfile:
+            json.dump(jobs, outfile, indent=2)
+        os.replace(tmp, self.queue_path)
+
+    def pending(self):
+        with self._lock:
+            return self._load()
+
+    def _transcode(self, appID, source):
+        target = os.path.join(self.cache_dir, str(appID), TRANSCODED_NAME)
+        tmp = target + ".part"
+        try:
+            ex(*ffmpeg_args(source, tmp), timeout=TRANSCODE_TIMEOUT)
+            os.replace(tmp, target)
+        except (subprocess.SubprocessError, OSError):
+            LOG.exception("Failed to transcode trailer for appID=%s", appID)
+            target = None
+        finally:
+            try:
+                os.unlink(tmp)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                LOG.exception("Failed to remove '%s'", tmp)
+
+        # A failed job is dropped from the queue too, so that resume()
+        # doesn't retry it forever; the installer can queue it again.
+        try:
+            with self._lock:
+                jobs = self._load()
+                jobs.pop(str(appID), None)
+                self._save(jobs)
+        except (OSError, ValueError):
+            LOG.exception("Failed to update the transcode queue")
+
+        return target
+
+    def submit(self, appID, source):
+        """
+        Queue a trailer for transcoding.
+
+        :return: A future resolving to the transcoded path, or None.
+        """
+        appID = str(appID)
+        with self._lock:
+            jobs = self._load()
+            jobs[appID] = source
+            self._save(jobs)
+
+        print(f"transcoding trailer for {appID} in the background")
+        future = self._pool.submit(self._transcode, appID, source)
+        self._futures[appID] = future
+        return future
+
+    def resume(self):
+        """
+        Restart every job left in the queue by a previous run.
+        """
+        for appID, source in self.pending().items():
+            if appID not in self._futures:
+                self.submit(appID, source)
+
+    def wait(self):
+        """
+        Wait for all submitted jobs to finish.
+
+        :return: dict mapping appID to the transcoded path (or None).
+        """
+        results = {
+            appID: future.result()
+            for appID, future in self._futures.items()
+        }
+        self._futures.clear()
+        return results
+
+    def close(self):
+        self._pool.shutdown(wait=True)
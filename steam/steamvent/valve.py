@@ -2,12 +2,17 @@ import dataclasses
 import json
 import logging
 import os
+import threading
+import time
 import urllib
 
-import requests
 import vdf
 
+from .appinfo import AppInfoError, load_appinfo
 from .common import ex
+from .metadb import SOURCES, metadb
+from .peer import cache_peer
+from .webclient import NotFound, client
 
 
 LOG = logging.getLogger('vent')
@@ -47,13 +52,54 @@ class URL:
         return self.build()
 
 
+# Base URLs for each Steam web endpoint we talk to, and the environment
+# variable that overrides each one. VENT_STEAM_BASE overrides all of
+# them at once; the paths below the bases don't overlap, so a single
+# server (e.g. mockserver.py) can stand in for every endpoint.
+ENDPOINTS = {
+    'api': ("VENT_STEAM_API", "https://api.steampowered.com"),
+    'store': ("VENT_STEAM_STORE", "https://store.steampowered.com"),
+    'assets': ("VENT_STEAM_ASSETS", "https://shared.fastly.steamstatic.com"),
+    'community': ("VENT_STEAM_COMMUNITY", "https://cdn.fastly.steamstatic.com"),
+    'video': ("VENT_STEAM_VIDEO", "https://video.akamai.steamstatic.com"),
+}
+
+
+def steam_url(endpoint, path=''):
+    """
+    Build a URL for one of the Steam web endpoints.
+
+    :param endpoint: A key of ENDPOINTS.
+    :param path: Path below the endpoint's base URL.
+    """
+    env, default = ENDPOINTS[endpoint]
+    base = os.environ.get(env) or os.environ.get("VENT_STEAM_BASE") or default
+    return base.rstrip('/') + '/' + path.lstrip('/')
+
+
 def get_info(appID):
+    """
+    Fetch an app's metadata: from the Steam client's appinfo.vdf if it
+    has the app, otherwise from steamcmd.
+    """
+    try:
+        info = load_appinfo().get(appID)
+        if info is not None:
+            return info
+        LOG.info("appID %s isn't in the client's appinfo.vdf; asking steamcmd", appID)
+    except AppInfoError as exc:
+        LOG.info("%s; asking steamcmd", exc)
+    return get_steamcmd_info(appID)
+
+
+def get_steamcmd_info(appID):
     ret = ex(
         "steamcmd",
         "+app_info_print",
         str(appID),
         "+exit",
-        capture_output=True
+        capture_output=True,
+        timeout=300,
     )
     output = ret.stdout.decode()
 
@@ -99,23 +145,24 @@ def get_web_info(appID):
         }
     }
 
-    base_uri = "https://api.steampowered.com/IStoreBrowseService/GetItems/v1/"
+    base_uri = steam_url('api', "IStoreBrowseService/GetItems/v1/")
 
     url = URL(base_uri)
     url.query = urllib.parse.urlencode({
         "input_json": json.dumps(input_json),
     })
 
-    rsp = requests.get(url)
-    assert rsp.status_code == 200
-
+    data = client().get_json(url)
     print(url)
-    data = rsp.json()
-    return data['response']['store_items'][0]
+
+    items = data.get('response', {}).get('store_items', [])
+    if not items:
+        raise NotFound(f"No store item for appID {appID}", str(url))
+    return items[0]
 
 
 def get_store_info(appID):
-    base_uri = "https://store.steampowered.com/api/appdetails"
+    base_uri = steam_url('store', "api/appdetails")
     # "?appids=1921550"
 
     url = URL(base_uri)
@@ -123,12 +170,13 @@ def get_store_info(appID):
         "appids": str(appID),
     })
 
-    rsp = requests.get(url)
-    assert rsp.status_code == 200
-
+    data = client().get_json(url)
     print(url)
-    data = rsp.json()
-    return data[str(appID)]['data']
+
+    result = data.get(str(appID), {})
+    if not result.get('success', False):
+        raise NotFound(f"No appdetails for appID {appID}", str(url))
+    return result['data']
 
 
 def get_executable(info):
@@ -148,59 +196,179 @@ def get_executable(info):
     raise Exception("Couldn't find a suitable executable to run this game ...?")
 
 
-def load_or_fetch_info(appID, cachedir):
-    local_dir = os.path.join(cachedir, str(appID))
-    os.makedirs(local_dir, exist_ok=True)
+# Metadata sources (metadb.SOURCES):
+#
+#   vdf:   steamcmd app_info_print {appID}, or the client's appinfo.vdf
+#   web:   https://api.steampowered.com/IStoreBrowseService/GetItems/v1/? ...
+#   store: https://store.steampowered.com/api/appdetails?appids=...
 
-    def _cache_fetch(target, retrieve_fn):
-        if os.path.exists(target):
-            with open(target, "r") as infile:
-                data = json.load(infile)
-        else:
-            data = retrieve_fn()
-            with open(target, "w") as outfile:
-                json.dump(data, outfile, indent=2)
-        return data
-
-    # steamcmd app_info_print {appID}
-    vdf_info = _cache_fetch(
-        os.path.join(local_dir, "vdf.json"),
-        lambda: get_info(appID),
-    )
+# How long to wait for each source before giving up on it, in seconds.
+SOURCE_TIMEOUTS = {
+    'vdf': 300,
+    'web': 120,
+    'store': 120,
+}
 
-    # https://api.steampowered.com/IStoreBrowseService/GetItems/v1/? ...
-    web_info = _cache_fetch(
-        os.path.join(local_dir, "web.json"),
-        lambda: get_web_info(appID),
-    )
 
-    # https://store.steampowered.com/api/appdetails?appids=...
-    store_info = _cache_fetch(
-        os.path.join(local_dir, "store.json"),
-        lambda: get_store_info(appID),
-    )
+def fetch_info(appID, source):
+    """
+    Fetch one metadata source from Steam, bypassing the cache.
+    """
+    retrieve_fn = {
+        'vdf': get_info,
+        'web': get_web_info,
+        'store': get_store_info,
+    }[source]
+    return retrieve_fn(appID)
+
+
+def read_cached_info(cachedir, appID, source):
+    """
+    Load one cached metadata source, or None if it isn't cached.
+    """
+    return metadb(cachedir).get(appID, source)
+
+
+def cached_info_age(cachedir, appID, source):
+    """
+    Seconds since a metadata source was cached, or None if it isn't.
+    """
+    fetched_at = metadb(cachedir).fetched_at(appID, source)
+    return None if fetched_at is None else time.time() - fetched_at
+
+
+def write_cached_info(cachedir, appID, source, data):
+    """
+    Replace one cached metadata source.
+    """
+    fields = {}
+    if source == 'vdf':
+        try:
+            fields['executable'] = get_executable({'vdf': data})
+        except Exception:
+            fields['executable'] = None
+    metadb(cachedir).put(appID, source, data, fields)
+
+
+class _Fetch(threading.Thread):
+    """
+    Fetch one metadata source in the background.
+
+    A daemon thread, so one that is still waiting on Steam when its
+    timeout passes doesn't keep the process alive at exit.
+    """
+    def __init__(self, fetch, source):
+        super().__init__(name=f"fetch-{source}", daemon=True)
+        self.fetch = fetch
+        self.source = source
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = self.fetch(self.source)
+        except Exception as exc:
+            self.error = exc
+
+
+class PartialInfo(dict):
+    """
+    App metadata keyed by source, as load_or_fetch_info returns.
+
+    Sources that couldn't be fetched are absent, with the reason in
+    errors, so callers can carry on with whatever they got.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.errors = {}
+
+    @property
+    def complete(self):
+        return not self.errors
+
+
+def load_or_fetch_info(appID, cachedir, sources=SOURCES, required=('vdf',)):
+    """
+    Load an app's metadata from the cache, fetching what's missing.
+
+    Missing sources are fetched concurrently (from the cache peer if
+    there is one, then from Steam), each within its SOURCE_TIMEOUTS
+    budget, and each is cached as soon as it arrives, regardless of
+    how the others fare.
+
+    :param sources: Which of SOURCES to load.
+    :param required: Sources without which the caller can't proceed;
+        the first of these to fail has its exception re-raised.
+    :return: PartialInfo.
+    """
+    info = PartialInfo()
+    missing = []
+    for source in sources:
+        data = read_cached_info(cachedir, appID, source)
+        if data is None:
+            missing.append(source)
+        else:
+            info[source] = data
+
+    if missing:
+        peer = cache_peer()
+
+        def _fetch(source):
+            data = None
+            if peer:
+                data = peer.fetch_json(appID, f"{source}.json")
+            if data is None:
+                data = fetch_info(appID, source)
+            write_cached_info(cachedir, appID, source, data)
+            return data
+
+        fetches = {source: _Fetch(_fetch, source) for source in missing}
+        for fetch in fetches.values():
+            fetch.start()
+        start = time.monotonic()
+        # Don't wait for stragglers; they still cache what they get.
+        for source, fetch in fetches.items():
+            remaining = SOURCE_TIMEOUTS[source] - (time.monotonic() - start)
+            fetch.join(timeout=max(0, remaining))
+            if fetch.is_alive():
+                LOG.error("Timed out fetching %s info for appID %s", source, appID)
+                info.errors[source] = TimeoutError(
+                    f"{source} info for appID {appID} took over {SOURCE_TIMEOUTS[source]}s"
+                )
+            elif fetch.error is not None:
+                LOG.error("Failed to fetch %s info for appID %s: %s", source, appID, fetch.error)
+                info.errors[source] = fetch.error
+            else:
+                info[source] = fetch.result
+
+    for source in required:
+        if source in info.errors:
+            raise info.errors[source]
 
-    info = {
-        'vdf': vdf_info,
-        'web': web_info,
-        'store': store_info,
-    }
     return info
 
 
+THUMBNAIL_NAMES = (
+    'hero_capsule_2x.jpg',
+    'library_capsule_2x.jpg',
+    'hero_capsule.jpg',
+    'library_capsule.jpg',
+    'main_capsule.jpg',
+    'header.jpg',
+    'small_capsule.jpg'
+)
+
+
 def guess_thumbnail(cache_dir, appID):
     # Guess which image to use for our thumbnail. Go through the list
     # until we find one that seems suitable.
 
-    for img_name in (
-        'hero_capsule_2x.jpg',
-        'library_capsule_2x.jpg',
-        'hero_capsule.jpg',
-        'library_capsule.jpg',
-        'main_capsule.jpg',
-        'header.jpg',
-        'small_capsule.jpg'
-    ):
+    name = metadb(cache_dir).find_asset(appID, THUMBNAIL_NAMES)
+    if name:
+        return os.path.join(cache_dir, str(appID), name)
+
+    # Caches from before the manifest existed.
+    for img_name in THUMBNAIL_NAMES:
         libimg = os.path.join(cache_dir, str(appID), img_name)
         if os.path.exists(libimg):
             return libimg
@@ -0,0 +1,254 @@
+import email.utils
+import logging
+import random
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+LOG = logging.getLogger('vent')
+
+
+# Per-host token bucket limits, as (requests per second, burst).
+#
+# The store's appdetails endpoint allows roughly 200 requests per five
+# minutes per client before it starts answering 429. The Web API is
+# more generous. The CDN hosts aren't limited.
+RATE_LIMITS = {
+    'store.steampowered.com': (200 / 300, 20),
+    'api.steampowered.com': (5.0, 20),
+}
+
+# (connect, read) timeouts, in seconds.
+TIMEOUT = (5, 30)
+
+# Bodies read with a progress callback are read in chunks this size.
+CHUNK_SIZE = 64 * 1024
+
+
+class SteamHTTPError(Exception):
+    """
+    A Steam web request failed.
+
+    :param url: The URL requested.
+    :param status: HTTP status code, if a response was received.
+    """
+    def __init__(self, message, url, status=None):
+        super().__init__(message)
+        self.url = url
+        self.status = status
+
+
+class NotFound(SteamHTTPError):
+    """
+    The resource doesn't exist (404, or a 'success: false' API reply).
+    """
+
+
+class RateLimited(SteamHTTPError):
+    """
+    Steam kept answering 429 after every retry.
+    """
+    retry_after = None
+
+
+class TransientError(SteamHTTPError):
+    """
+    Connection failures, timeouts, truncated bodies or 5xx responses
+    persisted after every retry.
+    """
+
+
+class TokenBucket:
+    """
+    Blocking token bucket rate limiter.
+
+    :param rate: Tokens added per second.
+    :param burst: Maximum number of tokens held.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self, seconds):
+        """
+        Withhold tokens for a while, e.g. after being told to back off.
+        """
+        with self._lock:
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+def retry_after(rsp):
+    """
+    Parse a Retry-After header (seconds or HTTP date) into seconds.
+    """
+    value = rsp.headers.get("Retry-After")
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+        return max(0, when.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class SteamClient:
+    """
+    Shared HTTP client for every Steam web request.
+
+    Pools connections per host, rate limits per host, applies timeouts,
+    and retries transient failures and 429s with exponential backoff
+    that honours Retry-After.
+
+    :param rate_limits: dict of host to (rate, burst); see RATE_LIMITS.
+    :param retries: Attempts after the first before giving up.
+    :param backoff: Initial backoff, in seconds; doubled each attempt.
+    :param max_backoff: Upper bound on a single backoff, in seconds.
+    :param timeout: (connect, read) timeouts, in seconds.
+    """
+    def __init__(self, rate_limits=None, retries=5, backoff=1.0,
+                 max_backoff=60.0, timeout=TIMEOUT):
+        self.rate_limits = RATE_LIMITS if rate_limits is None else rate_limits
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host):
+        with self._lock:
+            if host not in self._buckets:
+                limit = self.rate_limits.get(host)
+                self._buckets[host] = TokenBucket(*limit) if limit else None
+            return self._buckets[host]
+
+    def _delay(self, attempt):
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def get(self, url, progress=None, **kwargs):
+        """
+        GET a URL, retrying as needed.
+
+        :param progress: Optional callable receiving the size of each
+            chunk of the body as it arrives, to pace a download. Any
+            exception it raises abandons the download and propagates.
+        :return: The successful (200) requests.Response.
+        :raises NotFound: on a 404.
+        :raises RateLimited: if still rate limited after all retries.
+        :raises TransientError: if still failing after all retries.
+        :raises SteamHTTPError: on any other unexpected status.
+        """
+        url = str(url)
+        host = urllib.parse.urlsplit(url).hostname
+        bucket = self._bucket(host)
+        error = None
+
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self._delay(attempt - 1)
+                if isinstance(error, RateLimited) and error.retry_after is not None:
+                    delay = min(self.max_backoff, max(delay, error.retry_after))
+                LOG.debug("Retrying %s in %.1fs (attempt %d)", url, delay, attempt + 1)
+                time.sleep(delay)
+
+            if bucket:
+                bucket.acquire()
+
+            try:
+                rsp = self.session.get(url, timeout=self.timeout, stream=progress is not None, **kwargs)
+                if progress is not None and rsp.status_code == 200:
+                    self._read_body(rsp, progress)
+                # urllib3 normally catches short bodies itself; this
+                # covers versions that don't enforce Content-Length.
+                length = rsp.headers.get("Content-Length")
+                encoded = rsp.headers.get("Content-Encoding")
+                if length and not encoded and len(rsp.content) != int(length):
+                    raise requests.exceptions.ContentDecodingError("truncated body")
+            except requests.RequestException as exc:
+                LOG.warning("%s fetching '%s'", type(exc).__name__, url)
+                error = TransientError(f"{type(exc).__name__}: {exc}", url)
+                continue
+
+            if rsp.status_code == 200:
+                return rsp
+
+            if rsp.status_code == 404:
+                raise NotFound(f"404 Not Found: {url}", url, 404)
+
+            if rsp.status_code == 429:
+                error = RateLimited(f"429 Too Many Requests: {url}", url, 429)
+                error.retry_after = retry_after(rsp)
+                if bucket and error.retry_after:
+                    bucket.drain(error.retry_after)
+                LOG.warning("Rate limited by %s; Retry-After=%s", host, error.retry_after)
+                continue
+
+            if rsp.status_code >= 500:
+                error = TransientError(f"{rsp.status_code}: {url}", url, rsp.status_code)
+                continue
+
+            raise SteamHTTPError(f"{rsp.status_code}: {url}", url, rsp.status_code)
+
+        raise error
+
+    @staticmethod
+    def _read_body(rsp, progress):
+        chunks = []
+        try:
+            for chunk in rsp.iter_content(CHUNK_SIZE):
+                progress(len(chunk))
+                chunks.append(chunk)
+        finally:
+            rsp.close()
+        # As Response.content would have stored it.
+        rsp._content = b"".join(chunks)
+
+    def get_json(self, url, **kwargs):
+        rsp = self.get(url, **kwargs)
+        try:
+            return rsp.json()
+        except ValueError as exc:
+            raise TransientError(f"Invalid JSON from {url}: {exc}", str(url), rsp.status_code)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def client():
+    """
+    The process-wide SteamClient, created on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SteamClient()
+        return _client
@@ -0,0 +1,186 @@
+"""
+Detect a game's window appearing.
+
+A game's process shows up long before it has anything on screen;
+Proton games especially spend many seconds loading behind a black
+screen. WindowWatcher waits for the game's top-level window to be
+mapped, so the launcher can drop the splash and time the launch to the
+moment the game is actually visible.
+
+It subscribes to the X server's events rather than polling: MapNotify
+for every top-level window (or window manager frame) on the root
+window, and PropertyNotify for _NET_CLIENT_LIST, which EWMH window
+managers update as they take on windows. A window is the game's if its
+_NET_WM_PID is in the game's process tree, or is a wrapper the game
+runs under, such as gamescope.
+
+Needs python-xlib and an X display; without them window_watcher()
+returns None and the launcher goes by the game's process alone.
+"""
+
+import logging
+import os
+import select
+import time
+
+from .readahead import process_tree
+
+
+LOG = logging.getLogger('vent')
+
+_HAVE_XLIB = False
+try:
+    from Xlib import X, error as xerror
+    from Xlib.display import Display
+    _HAVE_XLIB = True
+except ModuleNotFoundError:
+    pass
+
+
+# Seconds to wait for a window once the game's process is running.
+WINDOW_TIMEOUT = 120
+
+# Programs that put the game in a window of their own.
+WRAPPERS = ('gamescope',)
+
+
+def _comm(pid):
+    try:
+        with open(f"/proc/{pid}/comm") as infile:
+            return infile.read().strip()
+    except OSError:
+        return None
+
+
+def _ancestors(pid):
+    while pid > 1:
+        try:
+            with open(f"/proc/{pid}/stat") as infile:
+                # The command name is parenthesised and may hold spaces.
+                pid = int(infile.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            return
+        yield pid
+
+
+def game_pids(pid):
+    """
+    Processes whose windows count as the game's.
+    """
+    pids = set(process_tree(pid))
+    pids.update(p for p in _ancestors(pid) if _comm(p) in WRAPPERS)
+    return pids
+
+
+class WindowWatcher:
+    """
+    :param display_name: X display to watch; defaults to $DISPLAY.
+    """
+    def __init__(self, display_name=None):
+        self.display = Display(display_name)
+        self.root = self.display.screen().root
+        self.NET_WM_PID = self.display.intern_atom('_NET_WM_PID')
+        self.NET_CLIENT_LIST = self.display.intern_atom('_NET_CLIENT_LIST')
+        # Subscribe before looking at the existing windows, so a window
+        # mapped in between is still reported.
+        self.root.change_attributes(event_mask=X.SubstructureNotifyMask | X.PropertyChangeMask)
+        self.display.sync()
+
+    def close(self):
+        self.display.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _window_pid(self, window, depth=2):
+        # Reparenting window managers map a frame around the client
+        # window, so look a little way down the tree too.
+        try:
+            prop = window.get_full_property(self.NET_WM_PID, X.AnyPropertyType)
+            if prop and len(prop.value):
+                return int(prop.value[0])
+            if depth:
+                for child in window.query_tree().children:
+                    pid = self._window_pid(child, depth - 1)
+                    if pid:
+                        return pid
+        except xerror.XError:
+            # The window went away while we were looking at it.
+            pass
+        return None
+
+    def _is_game_window(self, window, pids):
+        try:
+            if window.get_attributes().map_state != X.IsViewable:
+                return False
+        except xerror.XError:
+            return False
+        return self._window_pid(window) in pids
+
+    def _client_list(self):
+        prop = self.root.get_full_property(self.NET_CLIENT_LIST, X.AnyPropertyType)
+        if not prop:
+            return []
+        return [self.display.create_resource_object('window', wid) for wid in prop.value]
+
+    def _find(self, windows, pid):
+        if not windows:
+            return None
+        pids = game_pids(pid)
+        for window in windows:
+            if self._is_game_window(window, pids):
+                return window
+        return None
+
+    def wait(self, pid, timeout=WINDOW_TIMEOUT, pidfd=None):
+        """
+        Wait for one of the game's windows to be mapped.
+
+        :param pid: The game's process.
+        :param pidfd: If given, stop waiting when the game exits.
+        :return: The X window id, or None if the game exited first or
+            the timeout expired.
+        """
+        deadline = time.monotonic() + timeout
+        window = self._find(self.root.query_tree().children + self._client_list(), pid)
+
+        fds = [self.display.fileno()] + ([pidfd] if pidfd is not None else [])
+        while window is None:
+            # Events already read off the socket won't wake select().
+            while window is None and self.display.pending_events():
+                event = self.display.next_event()
+                if event.type == X.MapNotify:
+                    window = self._find([event.window], pid)
+                elif event.type == X.PropertyNotify and event.atom == self.NET_CLIENT_LIST:
+                    window = self._find(self._client_list(), pid)
+            if window is not None:
+                break
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            ready, _, _ = select.select(fds, [], [], remaining)
+            if pidfd is not None and pidfd in ready:
+                return None
+        return window.id
+
+
+def window_watcher():
+    """
+    A WindowWatcher for $DISPLAY, or None if windows can't be watched.
+    """
+    if not _HAVE_XLIB:
+        LOG.debug("python-xlib isn't installed; not watching for the game's window")
+        return None
+    if not os.environ.get("DISPLAY"):
+        LOG.debug("No DISPLAY; not watching for the game's window")
+        return None
+    try:
+        return WindowWatcher()
+    except Exception:
+        # python-xlib raises a variety of errors for an unusable display.
+        LOG.exception("Can't connect to the X display; not watching for the game's window")
+        return None